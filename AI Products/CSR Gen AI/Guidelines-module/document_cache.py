@@ -0,0 +1,88 @@
+"""Per-document cache of guideline OCR and extraction results.
+
+Entries are keyed by the SHA-256 of the PDF, so renaming a guideline
+costs nothing and changing one invalidates only its own entry:
+
+- ``cache/documents/<sha>.md``: the OCR markdown;
+- ``cache/documents/<sha>.json``: the extracted shard results, written
+  once every shard of the document succeeded, with the extractor
+  version they were produced by.
+
+Adding, updating or removing one guideline PDF then costs that one
+document's processing; the others are merged from their entries.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_CACHE_DIR = Path(__file__).resolve().parent / "cache" / "documents"
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _atomic_write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def load_ocr(pdf_sha):
+    try:
+        return (DOCUMENT_CACHE_DIR / f"{pdf_sha}.md").read_text(
+            encoding="utf-8"
+        )
+    except OSError:
+        return None
+
+
+def save_ocr(pdf_sha, markdown_text):
+    try:
+        _atomic_write(DOCUMENT_CACHE_DIR / f"{pdf_sha}.md", markdown_text)
+    except OSError as e:
+        logger.warning("Cannot cache OCR output %s: %s", pdf_sha[:12], e)
+
+
+def load_results(pdf_sha, extractor):
+    """Return the cached shard results (JSON-ready dicts) of a document,
+    or None if missing or made by a different extractor version."""
+    try:
+        with open(DOCUMENT_CACHE_DIR / f"{pdf_sha}.json", "r",
+                  encoding="utf-8") as f:
+            entry = json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return None
+    if entry.get("extractor") != extractor:
+        return None
+    return entry.get("results")
+
+
+def save_results(pdf_sha, document, extractor, results):
+    entry = {
+        "document": document,
+        "pdf_sha256": pdf_sha,
+        "extractor": extractor,
+        "extracted_at": datetime.utcnow().isoformat(),
+        "results": results,
+    }
+    try:
+        _atomic_write(
+            DOCUMENT_CACHE_DIR / f"{pdf_sha}.json",
+            json.dumps(entry, indent=2, ensure_ascii=False),
+        )
+    except OSError as e:
+        logger.warning("Cannot cache results of %s: %s", document, e)
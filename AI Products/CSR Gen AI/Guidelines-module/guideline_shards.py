@@ -0,0 +1,140 @@
+"""Splitting OCR'd guideline documents into extraction shards.
+
+A shard is a run of consecutive heading blocks of one document, up to
+``SHARD_MAX_CHARS``; a single block longer than that is split at
+paragraph breaks. Each shard is extracted by its own model call, so
+responses stay well below the output limit and a failed shard can be
+retried without redoing the rest of the document.
+
+Extracted shards are cached under ``cache/shards`` by a hash of their
+text and the extraction prompt, so a rerun only calls the model for
+shards that failed or changed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SHARD_MAX_CHARS = int(os.getenv("GUIDELINES_SHARD_MAX_CHARS", "30000"))
+SHARD_CACHE_DIR = Path(__file__).resolve().parent / "cache" / "shards"
+
+HEADING = re.compile(r"^#{1,6}\s+\S")
+
+
+@dataclass(frozen=True)
+class Shard:
+    document: str
+    index: int
+    total: int
+    # First heading of the shard, for logs
+    heading: str
+    text: str
+
+    @property
+    def label(self):
+        return f"{self.document} [{self.index + 1}/{self.total}]"
+
+    def key(self, *salts):
+        """Hash of the shard text and everything else that shapes its
+        extraction (model, prompt)."""
+        digest = hashlib.sha256()
+        for part in (*salts, self.text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+
+def _heading_blocks(markdown_text):
+    """Split at headings outside code blocks; text before the first
+    heading is a block of its own."""
+    blocks = []
+    current = []
+    in_code = False
+    for line in markdown_text.split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if not in_code and HEADING.match(line) and current:
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_paragraphs(block, max_chars):
+    """Split an oversized block at blank lines (or hard, as a last resort)."""
+    pieces = []
+    current = ""
+    for paragraph in block.split("\n\n"):
+        while len(paragraph) > max_chars:
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_shards(document, markdown_text, max_chars=SHARD_MAX_CHARS):
+    """Return the :class:`Shard` list of one document, in order."""
+    pieces = []
+    for block in _heading_blocks(markdown_text):
+        if len(block) > max_chars:
+            pieces.extend(_split_paragraphs(block, max_chars))
+        else:
+            pieces.append(block)
+
+    texts = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            texts.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current.strip():
+        texts.append(current)
+
+    shards = []
+    for index, text in enumerate(texts):
+        heading = next(
+            (line for line in text.split("\n") if HEADING.match(line)), ""
+        )
+        shards.append(Shard(
+            document=document,
+            index=index,
+            total=len(texts),
+            heading=heading.lstrip("#").strip(),
+            text=text,
+        ))
+    return shards
+
+
+def load_cached_shard(key):
+    """Return a cached extraction result (JSON text), or None."""
+    try:
+        return (SHARD_CACHE_DIR / f"{key}.json").read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def save_cached_shard(key, result_json):
+    SHARD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = SHARD_CACHE_DIR / f"{key}.json"
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(json.loads(result_json), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Cannot cache shard result %s: %s", key[:12], e)
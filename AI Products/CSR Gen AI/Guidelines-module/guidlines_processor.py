@@ -1,21 +1,40 @@
+import hashlib
 import json
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
 from pydantic import BaseModel, Field
 from google.genai import types
 
+from document_cache import (
+    load_ocr, load_results, save_ocr, save_results, sha256_file,
+)
+from guideline_shards import (
+    SHARD_MAX_CHARS, load_cached_shard, save_cached_shard,
+    split_into_shards,
+)
 from utils import (
     get_gemini_client,
     get_mistral_client,
+    OUTPUT_FILE,
     read_pdf_files,
     save_ocr_markdown,
     write_json_output,
 )
+# utils puts the app root on sys.path
+from llm_gateway import PRIORITY_GUIDELINES, estimate_tokens, get_gateway
 
 logger = logging.getLogger(__name__)
 
 GEMINI_MODEL = "gemini-2.5-flash"
+OCR_MODEL = "mistral-ocr-latest"
+# Documents OCR'd, and shards extracted, at the same time
+MAX_CONCURRENCY = int(os.getenv("GUIDELINES_MAX_CONCURRENCY", "4"))
+# Attempts per shard for failures the gateway does not retry (e.g. a
+# truncated or invalid JSON response)
+SHARD_ATTEMPTS = int(os.getenv("GUIDELINES_SHARD_ATTEMPTS", "3"))
 
 
 class ClinicalDefinition(BaseModel):
@@ -184,9 +203,21 @@ If the source text has no content for a section, return the title with \
 empty lists."""
 
 
+# Cached shard and document results are reused only if they were
+# extracted the same way
+EXTRACTOR_VERSION = hashlib.sha256(
+    json.dumps(
+        [GEMINI_MODEL, SYSTEM_PROMPT, SHARD_MAX_CHARS,
+         CSRKnowledgeBase.model_json_schema()],
+        sort_keys=True,
+    ).encode("utf-8")
+).hexdigest()[:16]
+
+
 class GuidelinesProcessor:
 
     def __init__(self):
+        self.gateway = get_gateway()
         self.mistral_client = get_mistral_client()
         self.gemini_client = get_gemini_client()
 
@@ -194,18 +225,29 @@ class GuidelinesProcessor:
         logger.info("Extracting text from %s via Mistral OCR.", pdf_path.name)
         uploaded_file = None
         try:
-            uploaded_file = self.mistral_client.files.upload(
-                file={
-                    "file_name": pdf_path.name,
-                    "content": open(pdf_path, "rb"),
-                },
-                purpose="ocr",
+
+            def _upload():
+                # Reopened per attempt so a retry sends the whole file
+                with open(pdf_path, "rb") as f:
+                    return self.mistral_client.files.upload(
+                        file={"file_name": pdf_path.name, "content": f},
+                        purpose="ocr",
+                    )
+
+            uploaded_file = self.gateway.call(
+                OCR_MODEL, _upload, priority=PRIORITY_GUIDELINES
             )
-            signed_url = self.mistral_client.files.get_signed_url(
-                file_id=uploaded_file.id
+            signed_url = self.gateway.call(
+                OCR_MODEL,
+                self.mistral_client.files.get_signed_url,
+                priority=PRIORITY_GUIDELINES,
+                file_id=uploaded_file.id,
             )
-            ocr_response = self.mistral_client.ocr.process(
-                model="mistral-ocr-latest",
+            ocr_response = self.gateway.call(
+                OCR_MODEL,
+                self.mistral_client.ocr.process,
+                priority=PRIORITY_GUIDELINES,
+                model=OCR_MODEL,
                 document={
                     "type": "document_url",
                     "document_url": signed_url.url,
@@ -246,7 +288,11 @@ class GuidelinesProcessor:
     def transform_text(self, markdown_text):
         logger.info("Transforming extracted text via Gemini (%s).", GEMINI_MODEL)
         try:
-            response = self.gemini_client.models.generate_content(
+            response = self.gateway.call(
+                GEMINI_MODEL,
+                self.gemini_client.models.generate_content,
+                priority=PRIORITY_GUIDELINES,
+                tokens=estimate_tokens(markdown_text, SYSTEM_PROMPT),
                 model=GEMINI_MODEL,
                 contents=[markdown_text],
                 config=types.GenerateContentConfig(
@@ -264,24 +310,111 @@ class GuidelinesProcessor:
             raise
 
     @staticmethod
-    def merge_results(results: list[CSRKnowledgeBase]) -> dict:
+    def _shard_prompt(shard):
+        return (
+            f"The following text is part {shard.index + 1} of {shard.total} "
+            f"of the regulatory document {shard.document}. Extract only "
+            "what this part states. For sections this part has no content "
+            "for, return the official title with empty lists.\n\n"
+            f"{shard.text}"
+        )
+
+    def transform_shard(self, shard):
+        """Extract one shard, from the shard cache when possible. Retried
+        on its own when the response is invalid."""
+        key = shard.key(EXTRACTOR_VERSION)
+        cached = load_cached_shard(key)
+        if cached is not None:
+            try:
+                return CSRKnowledgeBase.model_validate_json(cached)
+            except ValueError:
+                logger.warning("Ignoring invalid cached %s.", shard.label)
+
+        for attempt in range(1, SHARD_ATTEMPTS + 1):
+            try:
+                parsed = self.transform_text(self._shard_prompt(shard))
+            except Exception:
+                if attempt == SHARD_ATTEMPTS:
+                    raise
+                logger.warning(
+                    "Extraction of %s failed (attempt %d/%d). Retrying.",
+                    shard.label, attempt, SHARD_ATTEMPTS,
+                )
+                continue
+            save_cached_shard(key, parsed.model_dump_json())
+            return parsed
+
+    @staticmethod
+    def merge_results(results: list[CSRKnowledgeBase],
+                      sources: list[str] | None = None) -> dict:
+        """Merge extraction results into the ``guidlines.json`` structure.
+
+        With ``sources`` (the document each result came from), every
+        definition and data dependency gets a ``sources`` list, and
+        ``Provenance`` maps every other rule to its source documents.
+        """
         seen_definitions = {}
         merged_constraints = []
         merged_forbidden = []
         merged_formatting = []
         merged_sections = {}
+        # rule list -> rule text -> source documents
+        provenance = {
+            "Clinical_Definitions": {},
+            "Global_Writing_Constraints": {},
+            "Forbidden_Actions": {},
+            "Formatting_Rules": {},
+            "Sections": {},
+        }
+
+        def _trace(table, text, source):
+            if source is not None:
+                docs = table.setdefault(text, [])
+                if source not in docs:
+                    docs.append(source)
 
-        for result in results:
+        for index, result in enumerate(results):
+            source = sources[index] if sources else None
             for defn in result.clinical_definitions:
                 if defn.term not in seen_definitions:
                     seen_definitions[defn.term] = defn.definition
+                _trace(provenance["Clinical_Definitions"], defn.term, source)
 
             merged_constraints.extend(result.global_writing_constraints)
             merged_forbidden.extend(result.forbidden_actions)
             merged_formatting.extend(result.formatting_rules)
+            for key, rules in (
+                ("Global_Writing_Constraints",
+                 result.global_writing_constraints),
+                ("Forbidden_Actions", result.forbidden_actions),
+                ("Formatting_Rules", result.formatting_rules),
+            ):
+                for rule in rules:
+                    _trace(provenance[key], rule, source)
 
             for section in result.sections:
                 key = section.section_key
+                section_provenance = provenance["Sections"].setdefault(
+                    key,
+                    {
+                        "required_content": {},
+                        "data_dependencies": {},
+                        "critical_safety_checks": {},
+                    },
+                )
+                for item in section.required_content:
+                    _trace(section_provenance["required_content"], item, source)
+                for dep in section.data_dependencies:
+                    _trace(
+                        section_provenance["data_dependencies"],
+                        dep.reference_id, source,
+                    )
+                for check in section.critical_safety_checks:
+                    _trace(
+                        section_provenance["critical_safety_checks"],
+                        check, source,
+                    )
+
                 if key not in merged_sections:
                     merged_sections[key] = {
                         "section_title": section.section_title,
@@ -317,8 +450,12 @@ class GuidelinesProcessor:
             s["critical_safety_checks"] = list(
                 dict.fromkeys(s["critical_safety_checks"])
             )
+            if sources:
+                dep_sources = provenance["Sections"][key]["data_dependencies"]
+                for dep in s["data_dependencies"]:
+                    dep["sources"] = dep_sources.get(dep["reference_id"], [])
 
-        return {
+        merged = {
             "Clinical_Definitions": [
                 {"term": t, "definition": d}
                 for t, d in seen_definitions.items()
@@ -330,6 +467,73 @@ class GuidelinesProcessor:
             "Formatting_Rules": list(dict.fromkeys(merged_formatting)),
             "Sections": merged_sections,
         }
+        if sources:
+            for definition in merged["Clinical_Definitions"]:
+                definition["sources"] = provenance["Clinical_Definitions"][
+                    definition["term"]
+                ]
+            del provenance["Clinical_Definitions"]
+            for section_provenance in provenance["Sections"].values():
+                del section_provenance["data_dependencies"]
+            merged["Provenance"] = provenance
+        return merged
+
+    def _prepare_document(self, pdf_path):
+        """Return ``(pdf_sha, cached results or None, markdown or None)``."""
+        try:
+            pdf_sha = sha256_file(pdf_path)
+            cached = load_results(pdf_sha, EXTRACTOR_VERSION)
+            if cached is not None:
+                logger.info("Using cached extraction of %s.", pdf_path.name)
+                return pdf_sha, cached, None
+            markdown_text = load_ocr(pdf_sha)
+            if markdown_text is None:
+                markdown_text = self.extract_text(pdf_path)
+                save_ocr(pdf_sha, markdown_text)
+            return pdf_sha, None, markdown_text
+        except Exception:
+            logger.error(
+                "Skipping %s due to processing error.", pdf_path.name
+            )
+            return None, None, None
+
+    def _transform_shard_or_none(self, shard):
+        try:
+            return self.transform_shard(shard)
+        except Exception:
+            logger.error(
+                "Giving up on %s (starts at %r).", shard.label, shard.heading
+            )
+            return None
+
+    @staticmethod
+    def _keep_curated_fields(merged):
+        """Carry over section fields of the current output that extraction
+        does not produce (hand-curated, e.g. the title page field list)."""
+        try:
+            with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
+                current = json.load(f).get("Sections", {})
+        except (IOError, json.JSONDecodeError):
+            return
+        for key, section in merged["Sections"].items():
+            for field, value in current.get(key, {}).items():
+                section.setdefault(field, value)
+
+    @staticmethod
+    def _previous_results(document):
+        """Return ``(pdf_sha, results)`` of the version of ``document`` in
+        the current output, if its extraction is still cached, else None."""
+        try:
+            with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
+                source = json.load(f).get("Sources", {}).get(document)
+        except (IOError, json.JSONDecodeError):
+            return None
+        if not source:
+            return None
+        cached = load_results(source["sha256"], EXTRACTOR_VERSION)
+        if cached is None:
+            return None
+        return source["sha256"], cached
 
     def run(self):
         pdf_files = read_pdf_files()
@@ -337,22 +541,66 @@ class GuidelinesProcessor:
             logger.info("No PDFs to process. Exiting.")
             return
 
-        results = []
-        for pdf_path in pdf_files:
-            try:
-                markdown_text = self.extract_text(pdf_path)
-                rules = self.transform_text(markdown_text)
-                results.append(rules)
-            except Exception:
-                logger.error(
-                    "Skipping %s due to processing error.", pdf_path.name
+        # Unchanged documents come from the cache; the others are OCR'd
+        # in parallel and their shards fanned out
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+            prepared = list(pool.map(self._prepare_document, pdf_files))
+        shards = []
+        for pdf_path, (_, _, markdown_text) in zip(pdf_files, prepared):
+            if markdown_text:
+                shards.extend(split_into_shards(pdf_path.name, markdown_text))
+        logger.info(
+            "%d document(s) cached, extracting %d shard(s) from %d.",
+            sum(1 for _, cached, _ in prepared if cached is not None),
+            len(shards),
+            sum(1 for _, _, text in prepared if text),
+        )
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+            shard_results = list(pool.map(self._transform_shard_or_none, shards))
+        by_document = {}
+        for shard, result in zip(shards, shard_results):
+            by_document.setdefault(shard.document, []).append(result)
+
+        # Merged in document and shard order. A document that failed, even
+        # in part, keeps the version of it in the current output
+        results, sources, documents, failed = [], [], {}, []
+        for pdf_path, (pdf_sha, cached, _) in zip(pdf_files, prepared):
+            if pdf_sha is not None and cached is None:
+                extracted = by_document.get(pdf_path.name, [])
+                if None not in extracted:
+                    cached = [r.model_dump() for r in extracted]
+                    save_results(
+                        pdf_sha, pdf_path.name, EXTRACTOR_VERSION, cached
+                    )
+            if pdf_sha is None or cached is None:
+                previous = self._previous_results(pdf_path.name)
+                if previous is None:
+                    failed.append(pdf_path.name)
+                    continue
+                pdf_sha, cached = previous
+                logger.warning(
+                    "Keeping the previous extraction of %s.", pdf_path.name
                 )
-
-        if results:
-            merged = self.merge_results(results)
+            doc_results = [CSRKnowledgeBase.model_validate(r) for r in cached]
+            if doc_results:
+                documents[pdf_path.name] = {"sha256": pdf_sha}
+            results.extend(doc_results)
+            sources.extend([pdf_path.name] * len(doc_results))
+        if failed:
+            # Writing now would drop part of these documents' guidelines
+            logger.error(
+                "Could not process %s and no earlier extraction is "
+                "available. Keeping the current output; rerun to retry.",
+                ", ".join(failed),
+            )
+        elif results:
+            merged = self.merge_results(results, sources)
+            merged["Sources"] = documents
+            self._keep_curated_fields(merged)
             write_json_output(merged)
             logger.info(
-                "Pipeline complete. Processed %d file(s).", len(results)
+                "Pipeline complete. Processed %d shard(s) of %d file(s).",
+                len(results), len(documents),
             )
         else:
             logger.warning("No files were successfully processed.")
@@ -1,14 +1,16 @@
 import os
+import sys
 import json
 import logging
 from pathlib import Path
 
 from dotenv import load_dotenv
-from mistralai import Mistral
-from google import genai
 
 load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_gateway import get_gateway
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -21,20 +23,13 @@ OUTPUT_FILE = Path(__file__).resolve().parent / "guidlines.json"
 
 
 def get_mistral_client():
-    api_key = os.getenv("MISTRAL_API_KEY")
-    if not api_key:
-        raise EnvironmentError("MISTRAL_API_KEY is not set.")
-    logger.info("Mistral client initialized.")
-    return Mistral(api_key=api_key)
+    """Return the process-wide Mistral client from the LLM gateway."""
+    return get_gateway().mistral_client()
 
 
 def get_gemini_client():
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise EnvironmentError("GOOGLE_API_KEY is not set.")
-    client = genai.Client(api_key=api_key)
-    logger.info("Gemini client initialized.")
-    return client
+    """Return the process-wide Gemini client from the LLM gateway."""
+    return get_gateway().gemini_client()
 
 
 def read_pdf_files():
@@ -0,0 +1,118 @@
+"""Content-addressed store for OCR page images.
+
+Mistral OCR returns page images inline as base64. Keeping them in
+``<stem>_pages.json`` makes every reader of that file parse the images,
+even readers that only need markdown or tables. Images are instead
+decoded and written once to ``<root>/<sha[:2]>/<sha>``, and the pages
+JSON keeps only a reference::
+
+    {"image_index": 0, "image_id": "img-0.jpeg",
+     "ref": "<sha256>", "media_type": "image/jpeg", "bytes": 48213}
+
+Identical images (logos, headers repeated on every page) are stored once.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DATA_URI_PATTERN = re.compile(r"^data:([\w.+-]+/[\w.+-]+);base64,", re.I)
+DEFAULT_MEDIA_TYPE = "application/octet-stream"
+
+
+def _decode_image(image_b64):
+    """Split an OCR image payload into ``(bytes, media_type)``.
+
+    Accepts a data URI or bare base64. Returns ``(None, None)`` if the
+    payload is not valid base64.
+    """
+    media_type = DEFAULT_MEDIA_TYPE
+    match = DATA_URI_PATTERN.match(image_b64)
+    if match:
+        media_type = match.group(1).lower()
+        image_b64 = image_b64[match.end():]
+    try:
+        return base64.b64decode(image_b64, validate=True), media_type
+    except (binascii.Error, ValueError):
+        return None, None
+
+
+class ImageStore:
+
+    def __init__(self, root):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, ref):
+        return self.root / ref[:2] / ref
+
+    def has(self, ref):
+        return self.path_for(ref).exists()
+
+    def _write(self, ref, data):
+        path = self.path_for(ref)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{ref}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, image_b64):
+        """Store a base64 image and return its reference fields.
+
+        Returns None if the payload cannot be decoded.
+        """
+        data, media_type = _decode_image(image_b64)
+        if data is None:
+            return None
+        ref = hashlib.sha256(data).hexdigest()
+        self._write(ref, data)
+        return {"ref": ref, "media_type": media_type, "bytes": len(data)}
+
+    def put_file(self, ref, src_path):
+        """Copy an already content-addressed blob into the store."""
+        path = self.path_for(ref)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{ref}.{uuid.uuid4().hex[:8]}.tmp")
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def refs_in(pages_json_path):
+        """Return the set of image refs a ``_pages.json`` file points to."""
+        try:
+            with open(pages_json_path, "r", encoding="utf-8") as f:
+                pages = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            return set()
+        return {
+            image["ref"]
+            for page in pages
+            for image in page.get("images", [])
+            if image.get("ref")
+        }
+
+    def garbage_collect(self, referenced):
+        """Delete blobs not in ``referenced``. Returns the number removed."""
+        removed = 0
+        for path in self.root.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            if path.name not in referenced:
+                path.unlink(missing_ok=True)
+                removed += 1
+        if removed:
+            logger.info("Garbage-collected %d OCR page images.", removed)
+        return removed
@@ -4,15 +4,34 @@ import logging
 import os
 import re
 import sys
-import time
+import textwrap
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import httpx
 from dotenv import load_dotenv
-from mistralai import Mistral
-from google import genai
+from pypdf import PdfReader
 from google.genai import types
 
+from image_store import ImageStore
+from ingestion_manifest import IngestionManifest, hash_files
+from ocr_cache import OCRCache, hash_file
+from node_index import INDEX_FILENAME as NODE_INDEX_FILENAME
+from node_index import write_node_index
+from page_index import index_path_for, write_page_index
+from table_index import INDEX_FILENAME as TABLE_INDEX_FILENAME
+from table_index import write_table_index
+from tree_index import (
+    assign_node_ids,
+    build_structural_tree,
+    merge_subtrees,
+    page_windows,
+    sparse_leaves,
+    split_pages,
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_gateway import PRIORITY_INGESTION, estimate_tokens, get_gateway
+
 load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
 
 logging.basicConfig(
@@ -22,36 +41,38 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 GEMINI_MODEL = "gemini-2.5-flash"
-MAX_RETRIES = 3
-RETRY_BACKOFF_BASE = 5
-
-NETWORK_ERRORS = (
-    httpx.ConnectError,
-    httpx.TimeoutException,
-    httpx.RemoteProtocolError,
-    ConnectionError,
-    OSError,
-    TimeoutError,
-)
+OCR_MODEL = "mistral-ocr-latest"
+# Part of the OCR cache key: changing these invalidates cached OCR output
+OCR_OPTIONS = {"table_format": "html", "include_image_base64": True}
 
+# PDFs with at least this many pages (or bytes) are uploaded once and OCR'd
+# in page windows instead of one base64 request
+OCR_CHUNK_MIN_PAGES = int(os.getenv("OCR_CHUNK_MIN_PAGES", "100"))
+OCR_CHUNK_MIN_BYTES = int(os.getenv("OCR_CHUNK_MIN_BYTES", str(20 * 1024 * 1024)))
+OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "25"))
+OCR_WINDOW_CONCURRENCY = int(os.getenv("OCR_WINDOW_CONCURRENCY", "3"))
 
-def _retry_on_network_error(func, *args, **kwargs):
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            return func(*args, **kwargs)
-        except NETWORK_ERRORS as e:
-            if attempt == MAX_RETRIES:
-                logger.error(
-                    "All %d retries exhausted. Last error: %s",
-                    MAX_RETRIES, e,
-                )
-                raise
-            wait = RETRY_BACKOFF_BASE * attempt
-            logger.warning(
-                "Network error (attempt %d/%d): %s. Retrying in %ds.",
-                attempt, MAX_RETRIES, e, wait,
-            )
-            time.sleep(wait)
+# Documents longer than this are tree-indexed in page windows and merged
+TREE_WINDOW_CHARS = int(os.getenv("TREE_WINDOW_CHARS", "150000"))
+TREE_WINDOW_CONCURRENCY = int(os.getenv("TREE_WINDOW_CONCURRENCY", "4"))
+
+# "auto" builds trees from markdown headings and falls back to Gemini when
+# the structure is unreliable; "llm" or "structural" force one builder
+TREE_INDEX_MODE = os.getenv("TREE_INDEX_MODE", "auto")
+STRUCTURAL_MIN_CONFIDENCE = float(os.getenv("STRUCTURAL_MIN_CONFIDENCE", "0.6"))
+# Heading-less stretches longer than this are sub-indexed by Gemini
+STRUCTURAL_MAX_LEAF_PAGES = int(os.getenv("STRUCTURAL_MAX_LEAF_PAGES", "15"))
+
+# Number of documents processed concurrently (OCR + tree index per worker)
+MAX_IN_FLIGHT = int(os.getenv("INGESTION_MAX_IN_FLIGHT", "4"))
+
+# Model each provider's calls are rate-limited under in the LLM gateway
+PROVIDER_MODELS = {"mistral": OCR_MODEL, "gemini": GEMINI_MODEL}
+
+
+def _is_tlf_document(stem):
+    stem_lower = stem.lower()
+    return "tlf" in stem_lower or "tfl" in stem_lower
 
 
 TREE_INDEX_PROMPT = """\
@@ -72,6 +93,13 @@ The output must be a JSON array of node objects. Each node must have:
 Produce the tree by identifying all headings, sections, and subsections \
 in the document. Preserve the document's hierarchy faithfully."""
 
+TREE_WINDOW_NOTE = """
+
+The text is pages {first_page}-{last_page} of a {total_pages}-page \
+document. Index only these pages and keep every start_page and end_page \
+within {first_page}-{last_page}. If the text begins in the middle of a \
+section, start with a node for that section using its title."""
+
 
 class StudyIngestionEngine:
 
@@ -80,6 +108,7 @@ class StudyIngestionEngine:
         input_dir=None,
         ocr_output_dir=None,
         study_data_dir=None,
+        ocr_cache_dir=None,
     ):
         base = Path(__file__).resolve().parent
         self.input_dir = Path(input_dir) if input_dir else base / "Input-docs"
@@ -91,69 +120,118 @@ class StudyIngestionEngine:
         )
         self.ocr_output_dir.mkdir(exist_ok=True)
         self.study_data_dir.mkdir(exist_ok=True)
-
-        mistral_key = os.getenv("MISTRAL_API_KEY")
-        if not mistral_key:
-            raise EnvironmentError("MISTRAL_API_KEY is not set.")
-        self.mistral_client = Mistral(
-            api_key=mistral_key,
-            timeout_ms=60000,
+        self.ocr_cache = OCRCache(
+            ocr_cache_dir, scope=self.input_dir.resolve()
         )
+        self.image_store = ImageStore(self.ocr_output_dir / "images")
+        # Reloaded at the start of each run_ingestion
+        self.manifest = IngestionManifest(self.study_data_dir)
 
-        google_key = os.getenv("GOOGLE_API_KEY")
-        if not google_key:
-            raise EnvironmentError("GOOGLE_API_KEY is not set.")
-        self.gemini_client = genai.Client(api_key=google_key)
+        self.gateway = get_gateway()
+        self.mistral_client = self.gateway.mistral_client()
+        self.gemini_client = self.gateway.gemini_client()
 
         logger.info("StudyIngestionEngine initialized.")
 
+    def _call_provider(self, provider, func, *args, **kwargs):
+        """Call a provider API through the shared LLM gateway at ingestion
+        priority, so section writers go first when quotas are tight."""
+        contents = kwargs.get("contents") or []
+        tokens = estimate_tokens(*(c for c in contents if isinstance(c, str)))
+        return self.gateway.call(
+            PROVIDER_MODELS[provider], func, *args,
+            priority=PRIORITY_INGESTION, tokens=tokens, **kwargs,
+        )
+
+    def _page_record(self, page_idx, page):
+        """Convert one OCR response page into its ``_pages.json`` entry.
+
+        Image bytes go to the image store; the entry keeps only refs.
+        """
+        page_tables = []
+        if hasattr(page, "tables") and page.tables:
+            for t_idx, table in enumerate(page.tables):
+                table_html = table if isinstance(table, str) else str(table)
+                page_tables.append({
+                    "table_index": t_idx,
+                    "html": table_html,
+                })
+
+        page_images = []
+        if hasattr(page, "images") and page.images:
+            for i_idx, image in enumerate(page.images):
+                if isinstance(image, str):
+                    image_id, image_b64 = None, image
+                else:
+                    image_id = getattr(image, "id", None)
+                    image_b64 = getattr(image, "image_base64", None)
+                record = {"image_index": i_idx, "image_id": image_id}
+                stored = self.image_store.put(image_b64) if image_b64 else None
+                if stored:
+                    record.update(stored)
+                elif image_b64:
+                    logger.warning(
+                        "Could not decode image %d on page %d.",
+                        i_idx, page_idx + 1,
+                    )
+                page_images.append(record)
+
+        return {
+            "page_index": page_idx,
+            "markdown": page.markdown,
+            "tables": page_tables,
+            "images": page_images,
+        }
+
+    @staticmethod
+    def _count_pages(pdf_path):
+        try:
+            return len(PdfReader(pdf_path).pages)
+        except Exception:
+            logger.warning(
+                "Could not read page count of %s.", pdf_path.name,
+                exc_info=True,
+            )
+            return None
+
     def _run_mistral_ocr(self, pdf_path):
+        """OCR a PDF and write ``<stem>.md`` and ``<stem>_pages.json``.
+
+        Large PDFs are routed to :meth:`_run_mistral_ocr_chunked`.
+
+        Returns:
+            The ``(md_path, pages_json_path)`` that were written.
+        """
+        page_count = self._count_pages(pdf_path)
+        if page_count and (
+            page_count >= OCR_CHUNK_MIN_PAGES
+            or pdf_path.stat().st_size >= OCR_CHUNK_MIN_BYTES
+        ):
+            return self._run_mistral_ocr_chunked(pdf_path, page_count)
+
         logger.info("Running Mistral OCR on %s.", pdf_path.name)
         try:
             with open(pdf_path, "rb") as f:
                 base64_pdf = base64.b64encode(f.read()).decode("utf-8")
 
-            ocr_response = _retry_on_network_error(
+            ocr_response = self._call_provider(
+                "mistral",
                 self.mistral_client.ocr.process,
-                model="mistral-ocr-latest",
+                model=OCR_MODEL,
                 document={
                     "type": "document_url",
                     "document_url": f"data:application/pdf;base64,{base64_pdf}",
                 },
-                table_format="html",
-                include_image_base64=True,
+                **OCR_OPTIONS,
             )
+            del base64_pdf
 
             pages_data = []
             markdown_parts = []
             for idx, page in enumerate(ocr_response.pages):
                 markdown_parts.append(f"--- Page {idx + 1} ---")
                 markdown_parts.append(page.markdown)
-
-                page_tables = []
-                if hasattr(page, "tables") and page.tables:
-                    for t_idx, table in enumerate(page.tables):
-                        table_html = table if isinstance(table, str) else str(table)
-                        page_tables.append({
-                            "table_index": t_idx,
-                            "html": table_html,
-                        })
-
-                page_images = []
-                if hasattr(page, "images") and page.images:
-                    for i_idx, image in enumerate(page.images):
-                        image_b64 = image if isinstance(image, str) else str(image)
-                        page_images.append({
-                            "image_index": i_idx,
-                            "base64": image_b64,
-                        })
-
-                pages_data.append({
-                    "page_index": idx,
-                    "markdown": page.markdown,
-                    "tables": page_tables,
-                    "images": page_images,
-                })
+                pages_data.append(self._page_record(idx, page))
 
             full_markdown = "\n\n".join(markdown_parts)
             stem = pdf_path.stem
@@ -168,7 +246,7 @@ class StudyIngestionEngine:
                 json.dump(pages_data, f, indent=2, ensure_ascii=False)
             logger.info("Saved pages JSON to %s.", pages_json_path)
 
-            return full_markdown, pages_data
+            return md_path, pages_json_path
 
         except Exception:
             logger.error(
@@ -176,6 +254,131 @@ class StudyIngestionEngine:
             )
             raise
 
+    def _run_mistral_ocr_chunked(self, pdf_path, page_count):
+        """OCR a large PDF in page windows.
+
+        The PDF is uploaded to Mistral once (streamed from disk) and each
+        window of ``OCR_PAGE_WINDOW`` pages is OCR'd by its own request,
+        at most ``OCR_WINDOW_CONCURRENCY`` at a time. Windows are written
+        to disk in page order as they complete, so peak memory is bounded
+        by the windows in flight rather than the document size. Output has
+        the same ``--- Page N ---`` / ``_pages.json`` layout as a
+        single-request run, with global page numbers.
+        """
+        windows = [
+            (start, min(start + OCR_PAGE_WINDOW, page_count))
+            for start in range(0, page_count, OCR_PAGE_WINDOW)
+        ]
+        logger.info(
+            "Running chunked Mistral OCR on %s (%d pages, %d windows).",
+            pdf_path.name, page_count, len(windows),
+        )
+
+        stem = pdf_path.stem
+        md_path = self.ocr_output_dir / f"{stem}.md"
+        pages_json_path = self.ocr_output_dir / f"{stem}_pages.json"
+        md_tmp = md_path.with_name(md_path.name + ".partial")
+        pages_tmp = pages_json_path.with_name(pages_json_path.name + ".partial")
+
+        def _upload():
+            with open(pdf_path, "rb") as f:
+                return self.mistral_client.files.upload(
+                    file={"file_name": pdf_path.name, "content": f},
+                    purpose="ocr",
+                )
+
+        uploaded_file = None
+        try:
+            uploaded_file = self._call_provider("mistral", _upload)
+            signed_url = self._call_provider(
+                "mistral",
+                self.mistral_client.files.get_signed_url,
+                file_id=uploaded_file.id,
+            )
+
+            def _ocr_window(window):
+                start, end = window
+                response = self._call_provider(
+                    "mistral",
+                    self.mistral_client.ocr.process,
+                    model=OCR_MODEL,
+                    document={
+                        "type": "document_url",
+                        "document_url": signed_url.url,
+                    },
+                    pages=list(range(start, end)),
+                    **OCR_OPTIONS,
+                )
+                logger.info(
+                    "OCR'd pages %d-%d of %s.", start + 1, end, pdf_path.name
+                )
+                return [
+                    self._page_record(start + offset, page)
+                    for offset, page in enumerate(response.pages)
+                ]
+
+            with open(md_tmp, "w", encoding="utf-8") as md_file, \
+                    open(pages_tmp, "w", encoding="utf-8") as pages_file, \
+                    ThreadPoolExecutor(
+                        max_workers=OCR_WINDOW_CONCURRENCY,
+                        thread_name_prefix=f"ocr-{stem[:16]}",
+                    ) as pool:
+                pages_file.write("[")
+                first_page = True
+                pending = []
+                next_window = 0
+                while next_window < len(windows) or pending:
+                    # Keep at most OCR_WINDOW_CONCURRENCY windows in flight
+                    # and consume them in order.
+                    while (
+                        next_window < len(windows)
+                        and len(pending) < OCR_WINDOW_CONCURRENCY
+                    ):
+                        pending.append(
+                            pool.submit(_ocr_window, windows[next_window])
+                        )
+                        next_window += 1
+                    for record in pending.pop(0).result():
+                        separator = "" if first_page else "\n\n"
+                        md_file.write(
+                            f"{separator}--- Page {record['page_index'] + 1}"
+                            f" ---\n\n{record['markdown']}"
+                        )
+                        pages_file.write(
+                            ("\n" if first_page else ",\n")
+                            + textwrap.indent(
+                                json.dumps(record, indent=2, ensure_ascii=False),
+                                "  ",
+                            )
+                        )
+                        first_page = False
+                pages_file.write("\n]" if not first_page else "]")
+
+            os.replace(md_tmp, md_path)
+            os.replace(pages_tmp, pages_json_path)
+            logger.info("Saved OCR markdown to %s.", md_path)
+            logger.info("Saved pages JSON to %s.", pages_json_path)
+            return md_path, pages_json_path
+
+        except Exception:
+            logger.error(
+                "Chunked Mistral OCR failed for %s.", pdf_path.name,
+                exc_info=True,
+            )
+            raise
+        finally:
+            md_tmp.unlink(missing_ok=True)
+            pages_tmp.unlink(missing_ok=True)
+            if uploaded_file:
+                try:
+                    self.mistral_client.files.delete(file_id=uploaded_file.id)
+                except Exception:
+                    logger.warning(
+                        "Failed to delete file %s from Mistral.",
+                        uploaded_file.id,
+                        exc_info=True,
+                    )
+
     def _cache_tables_from_tlf(self, pages_json_path):
         logger.info("Extracting tables from TLF: %s.", pages_json_path.name)
         try:
@@ -329,35 +532,19 @@ class StudyIngestionEngine:
             return f"{table_num}. {raw_title}"
         return f"Table on page {page_idx + 1} (table {table_idx + 1})"
 
-    def _build_tree_index(self, md_path):
-        logger.info("Building tree index for %s.", md_path.name)
-        try:
-            with open(md_path, "r", encoding="utf-8") as f:
-                content = f.read()
-        except IOError:
-            logger.error("Failed to read %s.", md_path, exc_info=True)
-            raise
-
-        # Truncate very large documents to avoid Gemini timeouts
-        max_chars = 150_000
-        if len(content) > max_chars:
-            logger.warning(
-                "Truncating %s from %d to %d chars for tree index.",
-                md_path.name, len(content), max_chars,
-            )
-            content = content[:max_chars]
-
+    def _generate_tree(self, md_path, content, system_instruction):
         try:
-            response = _retry_on_network_error(
+            response = self._call_provider(
+                "gemini",
                 self.gemini_client.models.generate_content,
                 model=GEMINI_MODEL,
                 contents=[content],
                 config=types.GenerateContentConfig(
-                    system_instruction=TREE_INDEX_PROMPT,
+                    system_instruction=system_instruction,
                     response_mime_type="application/json",
                 ),
             )
-            tree = json.loads(response.text)
+            return json.loads(response.text)
         except json.JSONDecodeError:
             logger.error(
                 "Gemini returned invalid JSON for %s.",
@@ -373,107 +560,478 @@ class StudyIngestionEngine:
             )
             raise
 
+    def _llm_subtrees(self, md_path, pages, total_pages):
+        """Index ``pages`` with Gemini, one call per page window.
+
+        Returns ``[(first_page, last_page, nodes), ...]`` in page order.
+        """
+        windows = page_windows(pages, TREE_WINDOW_CHARS)
+        whole_document = len(windows) == 1 and len(pages) == total_pages
+
+        def _window_tree(window):
+            first_page, last_page = window[0][0], window[-1][0]
+            instruction = TREE_INDEX_PROMPT
+            if not whole_document:
+                instruction += TREE_WINDOW_NOTE.format(
+                    first_page=first_page,
+                    last_page=last_page,
+                    total_pages=total_pages,
+                )
+            nodes = self._generate_tree(
+                md_path, "".join(text for _, text in window), instruction,
+            )
+            return first_page, last_page, nodes
+
+        if len(windows) == 1:
+            return [_window_tree(windows[0])]
+
+        logger.info(
+            "Indexing %s pages %d-%d in %d page windows.",
+            md_path.name, pages[0][0], pages[-1][0], len(windows),
+        )
+        with ThreadPoolExecutor(
+            max_workers=TREE_WINDOW_CONCURRENCY,
+            thread_name_prefix=f"tree-{md_path.stem[:16]}",
+        ) as pool:
+            return list(pool.map(_window_tree, windows))
+
+    def _build_structural_tree(self, md_path, pages):
+        """Build a tree from markdown headings, or None if unreliable.
+
+        Leaves covering more than ``STRUCTURAL_MAX_LEAF_PAGES`` pages have
+        no usable headings inside them; only those page ranges are sent
+        to Gemini and the result is attached as the leaf's children.
+        """
+        tree, confidence = build_structural_tree(pages, md_path.stem)
+        if TREE_INDEX_MODE != "structural" and (
+            confidence < STRUCTURAL_MIN_CONFIDENCE
+        ):
+            logger.info(
+                "Heading structure of %s is unreliable (confidence %.2f). "
+                "Using Gemini.",
+                md_path.name, confidence,
+            )
+            return None
+
+        sparse = list(sparse_leaves(tree, STRUCTURAL_MAX_LEAF_PAGES))
+        logger.info(
+            "Built structural tree for %s (confidence %.2f, %d sparse "
+            "node(s) sent to Gemini).",
+            md_path.name, confidence, len(sparse),
+        )
+        if TREE_INDEX_MODE == "structural":
+            return tree
+
+        total_pages = pages[-1][0]
+        for node in sparse:
+            node_pages = [
+                (page_num, text) for page_num, text in pages
+                if node["start_page"] <= page_num <= node["end_page"]
+            ]
+            try:
+                subtrees = self._llm_subtrees(md_path, node_pages, total_pages)
+            except Exception:
+                logger.warning(
+                    "Could not sub-index %s pages %d-%d. Keeping the "
+                    "structural node.",
+                    md_path.name, node["start_page"], node["end_page"],
+                )
+                continue
+            node["children"] = merge_subtrees(subtrees, md_path.stem)
+            assign_node_ids(
+                node["children"], node["node_id"], node["level"] + 1
+            )
+        return tree
+
+    def _build_tree_index(self, md_path):
+        """Build ``<stem>_tree.json`` for an OCR markdown file.
+
+        Well-structured documents are indexed locally from their headings
+        (see ``TREE_INDEX_MODE``). Otherwise documents up to
+        ``TREE_WINDOW_CHARS`` go to Gemini in one call, and longer ones are
+        split on page markers into windows, indexed in parallel and
+        merged, so every page is covered.
+        """
+        logger.info("Building tree index for %s.", md_path.name)
+        try:
+            with open(md_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except IOError:
+            logger.error("Failed to read %s.", md_path, exc_info=True)
+            raise
+
         stem = md_path.stem
+        pages = split_pages(content)
+
+        tree = None
+        if TREE_INDEX_MODE != "llm":
+            tree = self._build_structural_tree(md_path, pages)
+        if tree is None:
+            subtrees = self._llm_subtrees(md_path, pages, pages[-1][0])
+            if len(subtrees) == 1:
+                tree = subtrees[0][2]
+            else:
+                tree = merge_subtrees(subtrees, stem)
+
         tree_path = self.study_data_dir / f"{stem}_tree.json"
         with open(tree_path, "w", encoding="utf-8") as f:
             json.dump(tree, f, indent=2, ensure_ascii=False)
         logger.info("Tree index saved to %s.", tree_path)
         return tree
 
-    def run_ingestion(self):
-        logger.info("Starting study document ingestion.")
-
-        pdf_files = sorted(self.input_dir.glob("*.pdf"))
-        if not pdf_files:
-            logger.warning("No PDF files found in %s.", self.input_dir)
+    @staticmethod
+    def _notify(progress_callback, stem, stage, status):
+        if progress_callback is None:
             return
+        try:
+            progress_callback(stem, stage, status)
+        except Exception:
+            logger.warning(
+                "Progress callback failed for %s (%s %s).",
+                stem, stage, status, exc_info=True,
+            )
 
-        logger.info("Found %d PDF file(s) to process.", len(pdf_files))
+    def _ensure_ocr_output(self, stem, pdf_path, progress_callback=None):
+        """Make ``ocr-output/<stem>.*`` match the current PDF contents.
 
-        for pdf_path in pdf_files:
-            stem = pdf_path.stem
-            md_path = self.ocr_output_dir / f"{stem}.md"
-            pages_json_path = self.ocr_output_dir / f"{stem}_pages.json"
+        Looks the PDF up in the content-addressed OCR cache by hash and
+        only calls Mistral on a miss. Returns ``"skipped"`` when the
+        existing output is current, ``"cached"`` when it was restored from
+        the cache, or ``"completed"`` after a fresh OCR run.
+        """
+        md_path = self.ocr_output_dir / f"{stem}.md"
+        pages_json_path = self.ocr_output_dir / f"{stem}_pages.json"
+        outputs_exist = md_path.exists() and pages_json_path.exists()
+
+        pdf_hash = hash_file(pdf_path)
+        key = OCRCache.make_key(pdf_hash, OCR_MODEL, OCR_OPTIONS)
+        previous = self.ocr_cache.lookup(stem)
+
+        self.manifest.update(stem, pdf_sha256=pdf_hash)
+
+        if outputs_exist and previous and previous["key"] == key:
+            logger.info(
+                "OCR output is current for %s. Skipping OCR.", pdf_path.name
+            )
+            return "skipped"
+
+        if outputs_exist and previous is None:
+            # Output predates the cache: adopt it rather than paying to
+            # OCR the same document again.
+            logger.info(
+                "Adopting existing OCR output for %s into the cache.",
+                pdf_path.name,
+            )
+            self.ocr_cache.store(
+                key, md_path, pages_json_path,
+                self._image_paths(pages_json_path),
+            )
+            self.ocr_cache.record(stem, key, pdf_hash, OCR_MODEL)
+            return "skipped"
+
+        if self.ocr_cache.restore(
+            key, md_path, pages_json_path, self.image_store
+        ):
+            status = "cached"
+        else:
+            self._notify(progress_callback, stem, "ocr", "started")
+            self._run_mistral_ocr(pdf_path)
+            self.ocr_cache.store(
+                key, md_path, pages_json_path,
+                self._image_paths(pages_json_path),
+            )
+            status = "completed"
+        self.ocr_cache.record(stem, key, pdf_hash, OCR_MODEL)
+        return status
+
+    def _image_paths(self, pages_json_path):
+        """Map each image ref in a pages JSON to its blob path."""
+        refs = ImageStore.refs_in(pages_json_path)
+        return {ref: self.image_store.path_for(ref) for ref in refs}
+
+    def _tree_is_current(self, stem, ocr_hash, ocr_refreshed=False):
+        """True if ``<stem>_tree.json`` is valid and built from ``ocr_hash``.
+
+        Trees from before the manifest existed are adopted if they parse,
+        unless ``ocr_refreshed`` says this run has just redone the OCR.
+        """
+        tree_path = self.study_data_dir / f"{stem}_tree.json"
+        if not tree_path.exists():
+            return False
+        try:
+            with open(tree_path, "r", encoding="utf-8") as f:
+                if not json.load(f):
+                    raise ValueError("empty tree")
+        except (IOError, ValueError):
+            logger.warning("Tree index for %s is unreadable. Rebuilding.", stem)
+            return False
 
-            if md_path.exists() and pages_json_path.exists():
+        entry = self.manifest.get(stem)
+        if "tree_source_ocr_sha256" not in entry:
+            if ocr_refreshed:
                 logger.info(
-                    "OCR output already exists for %s. Skipping OCR.",
-                    pdf_path.name,
+                    "OCR output for %s was refreshed; rebuilding its tree.",
+                    stem,
                 )
-            else:
-                try:
-                    self._run_mistral_ocr(pdf_path)
-                except Exception:
-                    logger.error(
-                        "Skipping %s due to OCR failure.", pdf_path.name
-                    )
-                    continue
+                return False
+            self.manifest.update(
+                stem,
+                tree_sha256=hash_file(tree_path),
+                tree_source_ocr_sha256=ocr_hash,
+            )
+            return True
+        if entry["tree_source_ocr_sha256"] != ocr_hash:
+            logger.info(
+                "OCR output for %s changed since its tree was built.", stem
+            )
+            return False
+        return True
+
+    def _ingest_document(self, stem, pdf_path, progress_callback=None):
+        """OCR one document (if needed) and immediately build its tree.
+
+        ``pdf_path`` is None for OCR output that has no source PDF in
+        ``input_dir``; only the tree index step runs for those.
+        """
+        md_path = self.ocr_output_dir / f"{stem}.md"
+
+        ocr_refreshed = False
+        if pdf_path is not None:
+            try:
+                status = self._ensure_ocr_output(
+                    stem, pdf_path, progress_callback
+                )
+            except Exception:
+                logger.error(
+                    "Skipping %s due to OCR failure.", pdf_path.name
+                )
+                self._notify(progress_callback, stem, "ocr", "failed")
+                return
+            self._notify(progress_callback, stem, "ocr", status)
+            ocr_refreshed = status != "skipped"
+            if ocr_refreshed:
+                self.manifest.mark_changed("ocr", stem)
+            if status != "skipped" or "images" not in self.manifest.get(stem):
+                refs = ImageStore.refs_in(
+                    self.ocr_output_dir / f"{stem}_pages.json"
+                )
+                self.manifest.update(stem, images=sorted(refs))
 
+        ocr_hash = hash_files(
+            md_path, self.ocr_output_dir / f"{stem}_pages.json"
+        )
+        self.manifest.update(stem, ocr_sha256=ocr_hash)
+        try:
+            write_page_index(md_path)
+        except OSError:
+            logger.warning(
+                "Could not write page index for %s.", stem, exc_info=True
+            )
+
+        if _is_tlf_document(stem):
+            logger.info("Skipping tree index for TLF document %s.", stem)
+            return
+
+        if self._tree_is_current(stem, ocr_hash, ocr_refreshed):
+            logger.info("Tree index is current for %s. Skipping.", stem)
+            self._notify(progress_callback, stem, "tree", "skipped")
+            return
+
+        self._notify(progress_callback, stem, "tree", "started")
+        try:
+            self._build_tree_index(md_path)
+        except Exception:
+            logger.error("Skipping tree index for %s due to error.", stem)
+            self._notify(progress_callback, stem, "tree", "failed")
+            return
+        self.manifest.update(
+            stem,
+            tree_sha256=hash_file(
+                self.study_data_dir / f"{stem}_tree.json"
+            ),
+            tree_source_ocr_sha256=ocr_hash,
+        )
+        self.manifest.mark_changed("trees", stem)
+        self._notify(progress_callback, stem, "tree", "completed")
+
+    def _refresh_tlf_tables(self, removed_stems=()):
+        """Bring ``tables.json`` in line with the current TLF OCR output.
+
+        Only TLFs whose OCR output changed since their tables were
+        extracted are re-extracted. Their rows are replaced where they
+        were, rows of other documents are kept as they are, and rows of
+        removed documents are dropped.
+        """
         tables_path = self.study_data_dir / "tables.json"
-        existing_tables = {}
+        tables = []
         if tables_path.exists():
             try:
                 with open(tables_path, "r", encoding="utf-8") as f:
-                    existing_list = json.load(f)
-                existing_tables = {
-                    t["table_id"]: t for t in existing_list
-                }
+                    tables = json.load(f)
             except (IOError, json.JSONDecodeError):
                 logger.warning("Could not read existing tables.json.")
 
-        master_table_list = list(existing_tables.values())
+        changed = False
+        if removed_stems:
+            kept = [
+                t for t in tables
+                if t["source_document"] not in removed_stems
+            ]
+            changed = len(kept) != len(tables)
+            tables = kept
 
         for pages_json in sorted(self.ocr_output_dir.glob("*_pages.json")):
             stem = pages_json.stem.replace("_pages", "")
-            stem_lower = stem.lower()
-            is_tlf = "tlf" in stem_lower or "tfl" in stem_lower
+            if not _is_tlf_document(stem):
+                continue
+            entry = self.manifest.get(stem)
+            ocr_hash = entry.get("ocr_sha256")
+            rows = [t for t in tables if t["source_document"] == stem]
 
-            if is_tlf:
-                already_cached = any(
-                    t["source_document"] == stem
-                    for t in master_table_list
+            if entry.get("tables_source_ocr_sha256") == ocr_hash:
+                logger.info("Tables are current for TLF %s. Skipping.", stem)
+                continue
+            if "tables_source_ocr_sha256" not in entry and rows:
+                # Tables extracted before the manifest existed
+                self.manifest.update(
+                    stem,
+                    tables=[t["table_id"] for t in rows],
+                    tables_source_ocr_sha256=ocr_hash,
                 )
-                if already_cached:
-                    logger.info(
-                        "Tables already cached for TLF %s. Skipping.", stem
-                    )
-                    continue
-                new_tables = self._cache_tables_from_tlf(pages_json)
-                master_table_list.extend(new_tables)
+                continue
 
-        if master_table_list:
+            new_tables = self._cache_tables_from_tlf(pages_json)
+            positions = [
+                i for i, t in enumerate(tables)
+                if t["source_document"] == stem
+            ]
+            insert_at = positions[0] if positions else len(tables)
+            tables = [t for t in tables if t["source_document"] != stem]
+            tables[insert_at:insert_at] = new_tables
+            changed = True
+            self.manifest.update(
+                stem,
+                tables=[t["table_id"] for t in new_tables],
+                tables_source_ocr_sha256=ocr_hash,
+            )
+            self.manifest.mark_changed("tables", stem)
+
+        if changed:
             with open(tables_path, "w", encoding="utf-8") as f:
-                json.dump(master_table_list, f, indent=2, ensure_ascii=False)
+                json.dump(tables, f, indent=2, ensure_ascii=False)
             logger.info(
                 "Saved %d total tables to %s.",
-                len(master_table_list),
+                len(tables),
                 tables_path,
             )
+        if changed or not (self.study_data_dir / TABLE_INDEX_FILENAME).exists():
+            write_table_index(self.study_data_dir)
+
+    def _remove_stale_documents(self, current_stems):
+        """Forget documents whose PDF and OCR output are both gone."""
+        removed = [
+            stem for stem in list(self.manifest.documents)
+            if stem not in current_stems
+        ]
+        for stem in removed:
+            logger.info("%s no longer exists. Removing its artifacts.", stem)
+            (self.study_data_dir / f"{stem}_tree.json").unlink(
+                missing_ok=True
+            )
+            index_path_for(self.ocr_output_dir / f"{stem}.md").unlink(
+                missing_ok=True
+            )
+            self.manifest.remove(stem)
+        return removed
+
+    def run_ingestion(self, max_in_flight=None, progress_callback=None):
+        """Ingest every PDF in ``input_dir``.
 
+        Documents are processed by a pool of ``max_in_flight`` workers.
+        Each worker OCRs its document and builds the tree index as soon as
+        the OCR lands, so tree building overlaps with other documents' OCR.
+        Provider calls are throttled by the per-provider rate limiters.
+        Only artifacts that are stale according to the ingestion manifest
+        are regenerated.
+
+        Args:
+            max_in_flight: Maximum documents processed concurrently
+                (defaults to ``MAX_IN_FLIGHT``; 1 runs sequentially).
+            progress_callback: Optional ``callback(stem, stage, status)``
+                invoked from worker threads, where stage is ``"ocr"`` or
+                ``"tree"`` and status is ``"started"``, ``"completed"``,
+                ``"cached"``, ``"skipped"`` or ``"failed"``.
+
+        Returns:
+            The change set from :meth:`IngestionManifest.save` (stems whose
+            OCR output, tree or tables were regenerated or that were
+            removed, plus the manifest version), or None if there were no
+            PDFs to ingest.
+        """
+        logger.info("Starting study document ingestion.")
+
+        pdf_files = sorted(self.input_dir.glob("*.pdf"))
+        if not pdf_files:
+            logger.warning("No PDF files found in %s.", self.input_dir)
+            return
+
+        max_in_flight = max(1, max_in_flight or MAX_IN_FLIGHT)
+        logger.info(
+            "Found %d PDF file(s) to process (%d in flight).",
+            len(pdf_files), max_in_flight,
+        )
+
+        self.manifest = IngestionManifest(self.study_data_dir)
+        documents = {pdf_path.stem: pdf_path for pdf_path in pdf_files}
+        # OCR output without a source PDF still gets a tree index
         for md_file in sorted(self.ocr_output_dir.glob("*.md")):
-            stem = md_file.stem
-            stem_lower = stem.lower()
-            if "tlf" in stem_lower or "tfl" in stem_lower:
-                logger.info(
-                    "Skipping tree index for TLF document %s.", stem
-                )
-                continue
+            documents.setdefault(md_file.stem, None)
 
-            tree_path = self.study_data_dir / f"{stem}_tree.json"
-            if tree_path.exists():
-                logger.info(
-                    "Tree index already exists for %s. Skipping.", stem
-                )
-                continue
+        with ThreadPoolExecutor(
+            max_workers=max_in_flight,
+            thread_name_prefix="ingestion",
+        ) as pool:
+            futures = {
+                pool.submit(
+                    self._ingest_document, stem, pdf_path, progress_callback
+                ): stem
+                for stem, pdf_path in documents.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception:
+                    logger.error(
+                        "Ingestion worker failed for %s.",
+                        futures[future], exc_info=True,
+                    )
 
-            try:
-                self._build_tree_index(md_file)
-            except Exception:
-                logger.error(
-                    "Skipping tree index for %s due to error.", stem
-                )
+        removed = self._remove_stale_documents(set(documents))
+        self._refresh_tlf_tables(removed_stems=set(removed))
+        if (
+            self.manifest.changes["trees"]
+            or removed
+            or not (self.study_data_dir / NODE_INDEX_FILENAME).exists()
+        ):
+            write_node_index(self.study_data_dir)
+        self.ocr_cache.prune(
+            pdf_path.stem for pdf_path in pdf_files
+        )
+        self.ocr_cache.garbage_collect()
+        self.image_store.garbage_collect({
+            ref
+            for entry in self.manifest.documents.values()
+            for ref in entry.get("images", [])
+        })
+        change_set = self.manifest.save()
 
-        logger.info("Study document ingestion complete.")
+        logger.info(
+            "Study document ingestion complete. Regenerated OCR: %s; "
+            "trees: %s; tables: %s; removed: %s.",
+            change_set["ocr"], change_set["trees"],
+            change_set["tables"], change_set["removed"],
+        )
+        return change_set
 
 
 if __name__ == "__main__":
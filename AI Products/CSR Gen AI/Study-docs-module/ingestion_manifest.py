@@ -0,0 +1,115 @@
+"""Per-document record of what ingestion produced and from which inputs.
+
+``study_data/ingestion_manifest.json`` stores, for every source document,
+the hash of its PDF, its OCR output, the tables extracted from it and its
+tree index, together with the OCR hash each artifact was built from. An
+artifact is stale when that recorded OCR hash no longer matches.
+
+The manifest ``version`` is a hash over all document entries; consumers
+can compare it to decide whether cached study data is still valid.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "ingestion_manifest.json"
+CHANGE_KINDS = ("ocr", "trees", "tables", "removed")
+
+
+def hash_files(*paths):
+    """SHA-256 over the contents of the given files that exist."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if not path.exists():
+            continue
+        digest.update(path.name.encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+
+    def __init__(self, study_data_dir):
+        self.path = study_data_dir / MANIFEST_FILENAME
+        self._lock = threading.Lock()
+        self.documents = {}
+        self.version = None
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.documents = data.get("documents", {})
+                self.version = data.get("version")
+            except (IOError, json.JSONDecodeError):
+                logger.warning(
+                    "Could not read %s. All artifacts will be re-checked.",
+                    self.path,
+                )
+        self.previous_version = self.version
+        self.changes = {kind: [] for kind in CHANGE_KINDS}
+
+    def get(self, stem):
+        with self._lock:
+            return dict(self.documents.get(stem, {}))
+
+    def update(self, stem, **fields):
+        with self._lock:
+            entry = self.documents.setdefault(stem, {})
+            entry.update(fields)
+            entry["updated_at"] = datetime.utcnow().isoformat()
+
+    def remove(self, stem):
+        with self._lock:
+            self.documents.pop(stem, None)
+            self.changes["removed"].append(stem)
+
+    def mark_changed(self, kind, stem):
+        with self._lock:
+            if stem not in self.changes[kind]:
+                self.changes[kind].append(stem)
+
+    def _compute_version(self):
+        stable = {
+            stem: {k: v for k, v in entry.items() if k != "updated_at"}
+            for stem, entry in self.documents.items()
+        }
+        payload = json.dumps(stable, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def save(self):
+        """Write the manifest atomically and return the change set.
+
+        The change set lists the stems whose OCR output, tree index or
+        tables were regenerated in this run, the stems that were removed,
+        and the manifest version before and after.
+        """
+        with self._lock:
+            self.version = self._compute_version()
+            change_set = {
+                "version": self.version,
+                "previous_version": self.previous_version,
+                **{kind: sorted(stems) for kind, stems in self.changes.items()},
+            }
+            data = {
+                "version": self.version,
+                "updated_at": datetime.utcnow().isoformat(),
+                "documents": self.documents,
+                "last_changes": change_set,
+            }
+            tmp_path = self.path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        logger.info(
+            "Ingestion manifest saved (version %s).", self.version[:12]
+        )
+        return change_set
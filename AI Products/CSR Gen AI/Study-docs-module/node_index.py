@@ -0,0 +1,250 @@
+"""Local retrieval index over tree index nodes for reasoning_search hop 1.
+
+Every node of every ``<stem>_tree.json`` becomes a hashed TF-IDF vector
+over its document name, its title, its ancestors' titles and its summary
+(unigrams and bigrams hashed into ``HASH_BUCKETS`` buckets, sublinear TF,
+L2 normalised). Queries are scored by cosine similarity through an inverted
+index over buckets, so a lookup touches only nodes sharing a term with
+the question and costs milliseconds however many documents are indexed.
+
+Built at ingestion time and saved as ``study_data/node_index.json`` with
+the hash of the tree files it was built from; readers rebuild it in
+memory when that hash no longer matches.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import uuid
+import zlib
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "node_index.json"
+HASH_BUCKETS = 1 << 20
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    "a", "an", "the", "of", "in", "for", "and", "or", "to", "by", "at",
+    "from", "with", "on", "is", "are", "was", "were", "be", "been", "that",
+    "this", "these", "those", "as", "it", "its", "which", "what", "how",
+    "any", "all", "not", "no", "into", "per", "than", "such", "each",
+    "do", "does", "did", "has", "have", "had", "will", "should", "can",
+}
+
+
+def _features(text):
+    tokens = [
+        t for t in TOKEN_PATTERN.findall(text.lower())
+        if t not in STOP_WORDS and (len(t) > 1 or t.isdigit())
+    ]
+    features = list(tokens)
+    features.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+def _hashed_counts(text):
+    counts = {}
+    for feature in _features(text):
+        bucket = zlib.crc32(feature.encode("utf-8")) % HASH_BUCKETS
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if not norm:
+        return {}
+    return {bucket: w / norm for bucket, w in vector.items()}
+
+
+def _flatten(nodes, source, ancestors=()):
+    for node in nodes:
+        if not isinstance(node, dict):
+            continue
+        title = str(node.get("title", ""))
+        yield {
+            "source": source,
+            "node_id": node.get("node_id", ""),
+            "title": title,
+            "summary": str(node.get("summary", "")),
+            "start_page": node.get("start_page", 1),
+            "end_page": node.get("end_page", node.get("start_page", 1)),
+            "path": " > ".join((*ancestors, title)),
+        }
+        yield from _flatten(
+            node.get("children", []) or [], source, (*ancestors, title)
+        )
+
+
+def hash_trees(tree_bytes):
+    """Hash ``{tree_name: raw bytes}`` in name order."""
+    digest = hashlib.sha256()
+    for name in sorted(tree_bytes):
+        digest.update(name.encode("utf-8"))
+        digest.update(tree_bytes[name])
+    return digest.hexdigest()
+
+
+class NodeIndex:
+
+    def __init__(self, nodes, vectors, idf, trees_sha256=None):
+        self.nodes = nodes
+        self.vectors = vectors
+        self.idf = idf
+        self.trees_sha256 = trees_sha256
+        self._postings = {}
+        for position, vector in enumerate(vectors):
+            for bucket, weight in vector.items():
+                self._postings.setdefault(bucket, []).append(
+                    (position, weight)
+                )
+
+    @classmethod
+    def build(cls, trees, trees_sha256=None):
+        """Build from ``{"<stem>_tree": nodes}`` as loaded by the tools."""
+        nodes = []
+        for name in sorted(trees):
+            source = name[:-len("_tree")] if name.endswith("_tree") else name
+            tree = trees[name]
+            if isinstance(tree, dict):
+                tree = [tree]
+            nodes.extend(_flatten(tree or [], source))
+
+        counts = [
+            _hashed_counts(f"{n['source']} {n['path']} {n['summary']}")
+            for n in nodes
+        ]
+        df = {}
+        for node_counts in counts:
+            for bucket in node_counts:
+                df[bucket] = df.get(bucket, 0) + 1
+        n_docs = len(nodes)
+        idf = {
+            bucket: math.log((1 + n_docs) / (1 + freq)) + 1
+            for bucket, freq in df.items()
+        }
+        vectors = [
+            _normalize({
+                bucket: (1 + math.log(tf)) * idf[bucket]
+                for bucket, tf in node_counts.items()
+            })
+            for node_counts in counts
+        ]
+        return cls(nodes, vectors, idf, trees_sha256)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["nodes"],
+            [{int(b): w for b, w in v} for v in data["vectors"]],
+            {int(b): w for b, w in data["idf"].items()},
+            data.get("trees_sha256"),
+        )
+
+    def to_dict(self):
+        return {
+            "trees_sha256": self.trees_sha256,
+            "buckets": HASH_BUCKETS,
+            "nodes": self.nodes,
+            "vectors": [
+                [[b, round(w, 5)] for b, w in v.items()]
+                for v in self.vectors
+            ],
+            "idf": {b: round(w, 5) for b, w in self.idf.items()},
+        }
+
+    def embed(self, text):
+        """Return the normalized sparse vector of ``text`` in this index's
+        TF-IDF space (terms unseen at build time are dropped)."""
+        return _normalize({
+            bucket: (1 + math.log(tf)) * self.idf[bucket]
+            for bucket, tf in _hashed_counts(text).items()
+            if bucket in self.idf
+        })
+
+    def unknown_terms(self, text):
+        """Return the terms of ``text`` that :meth:`embed` drops as unseen
+        at build time (stop words excluded)."""
+        return {
+            t for t in TOKEN_PATTERN.findall(text.lower())
+            if t not in STOP_WORDS and (len(t) > 1 or t.isdigit())
+            and zlib.crc32(t.encode("utf-8")) % HASH_BUCKETS not in self.idf
+        }
+
+    def search(self, question, top_k=5):
+        """Return the ``top_k`` nodes most similar to ``question``.
+
+        Each result is the node's metadata plus a ``score`` in [0, 1].
+        Nodes with the same source and page range are returned once.
+        """
+        query = self.embed(question)
+        scores = {}
+        for bucket, q_weight in query.items():
+            for position, weight in self._postings.get(bucket, ()):
+                scores[position] = scores.get(position, 0.0) + q_weight * weight
+
+        results = []
+        seen = set()
+        for position in heapq.nlargest(
+            top_k * 3, scores, key=scores.__getitem__
+        ):
+            node = self.nodes[position]
+            key = (node["source"], node["start_page"], node["end_page"])
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append({**node, "score": round(scores[position], 4)})
+            if len(results) == top_k:
+                break
+        return results
+
+
+def _read_trees(study_data_dir):
+    trees = {}
+    raw = {}
+    for tf in sorted(study_data_dir.glob("*_tree.json")):
+        try:
+            with open(tf, "rb") as f:
+                data = f.read()
+            trees[tf.stem] = json.loads(data)
+            raw[tf.stem] = data
+        except (IOError, json.JSONDecodeError):
+            logger.warning("Skipping unreadable tree index %s.", tf.name)
+    return trees, raw
+
+
+def write_node_index(study_data_dir):
+    """Build ``node_index.json`` from the tree indexes in ``study_data_dir``."""
+    trees, raw = _read_trees(study_data_dir)
+    index = NodeIndex.build(trees, hash_trees(raw))
+    index_path = study_data_dir / INDEX_FILENAME
+    tmp_path = index_path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+    logger.info(
+        "Saved node index (%d nodes from %d trees) to %s.",
+        len(index.nodes), len(trees), index_path,
+    )
+    return index
+
+
+def load_node_index(study_data_dir, trees, trees_sha256):
+    """Return the saved index if it matches the trees, else build one."""
+    index_path = study_data_dir / INDEX_FILENAME
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if (
+            data.get("trees_sha256") == trees_sha256
+            and data.get("buckets") == HASH_BUCKETS
+        ):
+            return NodeIndex.from_dict(data)
+        logger.info("Node index is stale. Rebuilding in memory.")
+    except (IOError, json.JSONDecodeError, KeyError):
+        logger.info("No usable node index. Building in memory.")
+    return NodeIndex.build(trees, trees_sha256)
@@ -0,0 +1,230 @@
+"""Content-addressed cache for Mistral OCR output.
+
+Entries are keyed by the SHA-256 of the PDF bytes plus the OCR model and
+options, so a renamed PDF still hits the cache and a replaced PDF with the
+same name misses it. A manifest maps each study's document stems to their
+current key; a study is identified by its input directory, so studies
+sharing the cache can use the same stem. Entries no longer referenced by
+any study are garbage-collected.
+
+The cache directory defaults to ``Study-docs-module/ocr-cache`` and can be
+pointed at a shared location with ``OCR_CACHE_DIR`` so every run and user
+of the CSR backend reuses the same paid OCR results.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_DIR = Path(
+    os.getenv(
+        "OCR_CACHE_DIR",
+        str(Path(__file__).resolve().parent / "ocr-cache"),
+    )
+)
+
+ENTRY_MARKDOWN = "document.md"
+ENTRY_PAGES = "pages.json"
+ENTRY_IMAGES = "images"
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+
+    def __init__(self, cache_dir=None, scope=""):
+        self.cache_dir = Path(cache_dir) if cache_dir else OCR_CACHE_DIR
+        # Study whose stems lookup/record/prune refer to
+        self.scope = str(scope)
+        self.objects_dir = self.cache_dir / "objects"
+        self.manifest_path = self.cache_dir / "manifest.json"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(pdf_hash, model, options):
+        """Build the cache key for a PDF hash and OCR configuration."""
+        payload = json.dumps(
+            {"pdf_sha256": pdf_hash, "model": model, "options": options},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key):
+        return self.objects_dir / key[:2] / key
+
+    def has(self, key):
+        entry = self._entry_dir(key)
+        return (entry / ENTRY_MARKDOWN).exists() and (
+            entry / ENTRY_PAGES
+        ).exists()
+
+    def restore(self, key, md_path, pages_json_path, image_store=None):
+        """Copy a cached entry to the given OCR output paths.
+
+        Page images in the entry are copied into ``image_store``.
+        Returns True on a cache hit, False if the entry does not exist.
+        """
+        if not self.has(key):
+            return False
+        entry = self._entry_dir(key)
+        if image_store is not None:
+            for image_path in (entry / ENTRY_IMAGES).glob("*"):
+                image_store.put_file(image_path.name, image_path)
+        shutil.copyfile(entry / ENTRY_MARKDOWN, md_path)
+        shutil.copyfile(entry / ENTRY_PAGES, pages_json_path)
+        logger.info("Restored OCR output for %s from cache %s.",
+                    Path(md_path).stem, key[:12])
+        return True
+
+    def store(self, key, md_path, pages_json_path, images=None):
+        """Add OCR output files to the cache under ``key``.
+
+        ``images`` maps image refs to blob paths from the image store;
+        they are kept with the entry so a restore is self-contained.
+
+        The entry is assembled in a temporary directory and renamed into
+        place so concurrent readers never see a partial entry.
+        """
+        if self.has(key):
+            return
+        entry = self._entry_dir(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = entry.parent / f".tmp-{key}-{uuid.uuid4().hex[:8]}"
+        tmp_dir.mkdir()
+        try:
+            shutil.copyfile(md_path, tmp_dir / ENTRY_MARKDOWN)
+            shutil.copyfile(pages_json_path, tmp_dir / ENTRY_PAGES)
+            if images:
+                (tmp_dir / ENTRY_IMAGES).mkdir()
+                for ref, image_path in images.items():
+                    shutil.copyfile(image_path, tmp_dir / ENTRY_IMAGES / ref)
+            os.replace(tmp_dir, entry)
+            logger.info("Stored OCR output for %s in cache %s.",
+                        Path(md_path).stem, key[:12])
+        except OSError:
+            # Another worker or process stored the same entry first
+            if not self.has(key):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _read_manifest(self):
+        """Return ``{"studies": {scope: {stem: doc}}, "legacy": {stem: doc}}``.
+
+        ``legacy`` holds the unscoped entries of manifests written before
+        studies were told apart. :meth:`lookup` copies a legacy entry into
+        the study that asks for it; the legacy entry itself is left for any
+        other study that used the same stem, and keeps its cache entry
+        from being garbage-collected.
+        """
+        if not self.manifest_path.exists():
+            return {"studies": {}, "legacy": {}}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            logger.warning(
+                "Could not read OCR cache manifest %s. Starting fresh.",
+                self.manifest_path,
+            )
+            return {"studies": {}, "legacy": {}}
+        return {
+            "studies": manifest.get("studies", {}),
+            "legacy": manifest.get("legacy", manifest.get("documents", {})),
+        }
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path.with_suffix(
+            f".{uuid.uuid4().hex[:8]}.tmp"
+        )
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def lookup(self, stem):
+        """Return the manifest entry for a document stem, or None."""
+        with self._lock:
+            manifest = self._read_manifest()
+            documents = manifest["studies"].get(self.scope, {})
+            if stem in documents:
+                return documents[stem]
+            doc = manifest["legacy"].get(stem)
+            if doc is not None:
+                manifest["studies"].setdefault(self.scope, {})[stem] = doc
+                self._write_manifest(manifest)
+            return doc
+
+    def record(self, stem, key, pdf_hash, model):
+        """Point a document stem at a cache entry in the manifest."""
+        with self._lock:
+            manifest = self._read_manifest()
+            manifest["studies"].setdefault(self.scope, {})[stem] = {
+                "key": key,
+                "pdf_sha256": pdf_hash,
+                "model": model,
+                "updated_at": datetime.utcnow().isoformat(),
+            }
+            self._write_manifest(manifest)
+
+    def prune(self, stems):
+        """Drop this study's manifest entries for stems not in ``stems``
+        (documents that are gone), so :meth:`garbage_collect` can free
+        their entries. Other studies' entries are left alone.
+        """
+        stems = set(stems)
+        with self._lock:
+            manifest = self._read_manifest()
+            documents = manifest["studies"].get(self.scope, {})
+            gone = [stem for stem in documents if stem not in stems]
+            if not gone:
+                return
+            for stem in gone:
+                del documents[stem]
+            if not documents:
+                manifest["studies"].pop(self.scope, None)
+            self._write_manifest(manifest)
+        logger.info(
+            "Dropped %d removed document(s) from the OCR cache manifest.",
+            len(gone),
+        )
+
+    def garbage_collect(self):
+        """Delete cache entries no study in the manifest references.
+
+        Returns the number of entries removed.
+        """
+        with self._lock:
+            manifest = self._read_manifest()
+            referenced = {
+                doc["key"]
+                for documents in (
+                    *manifest["studies"].values(), manifest["legacy"]
+                )
+                for doc in documents.values()
+            }
+            removed = 0
+            for entry in self.objects_dir.glob("*/*"):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                if entry.name not in referenced:
+                    shutil.rmtree(entry, ignore_errors=True)
+                    removed += 1
+        if removed:
+            logger.info("Garbage-collected %d OCR cache entries.", removed)
+        return removed
@@ -0,0 +1,140 @@
+"""Byte-offset index over the pages of an OCR markdown file.
+
+``ocr-output/<stem>_pageindex.json`` maps each page number to the byte
+ranges of its text (the bytes between its ``--- Page N ---`` marker and
+the next one); a page number whose marker repeats has one range per
+occurrence, in file order::
+
+    {"format": 2, "md_bytes": 123456, "md_mtime_ns": 1700000000000000000,
+     "pages": {"1": [[18, 2310]], "2": [[2330, 5120]], ...}}
+
+Retrieval then seeks straight to the requested pages instead of reading
+and splitting the whole document. The recorded size and mtime of the
+markdown let readers detect an index that no longer matches its file.
+"""
+
+import json
+import logging
+import os
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PAGE_MARKER_BYTES_PATTERN = re.compile(rb"--- Page (\d+) ---")
+INDEX_SUFFIX = "_pageindex.json"
+# Bumped when the layout changes; older indexes are rebuilt
+INDEX_FORMAT = 2
+
+
+def index_path_for(md_path):
+    return md_path.with_name(f"{md_path.stem}{INDEX_SUFFIX}")
+
+
+def build_page_index(md_path):
+    """Scan a markdown file once and return its page index dict."""
+    with open(md_path, "rb") as f:
+        data = f.read()
+    matches = list(PAGE_MARKER_BYTES_PATTERN.finditer(data))
+    pages = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(data)
+        # Every occurrence of a repeated page number is kept, as a split
+        # over the markers returns them all
+        pages.setdefault(match.group(1).decode("ascii"), []).append(
+            [match.end(), end]
+        )
+    stat = os.stat(md_path)
+    return {
+        "format": INDEX_FORMAT,
+        "md_bytes": stat.st_size,
+        "md_mtime_ns": stat.st_mtime_ns,
+        "pages": pages,
+    }
+
+
+def _matches_file(index, md_path):
+    try:
+        stat = os.stat(md_path)
+    except OSError:
+        return False
+    return (
+        index.get("format") == INDEX_FORMAT
+        and index.get("md_bytes") == stat.st_size
+        and index.get("md_mtime_ns") == stat.st_mtime_ns
+    )
+
+
+def load_page_index(md_path):
+    """Return the page index for ``md_path``, or None if missing or stale."""
+    index_path = index_path_for(md_path)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return None
+    if not _matches_file(index, md_path):
+        logger.info("Page index %s is stale.", index_path.name)
+        return None
+    return index
+
+
+def write_page_index(md_path):
+    """Write ``<stem>_pageindex.json`` next to ``md_path`` unless current.
+
+    Returns True if the index was (re)written.
+    """
+    if load_page_index(md_path) is not None:
+        return False
+    index = build_page_index(md_path)
+    index_path = index_path_for(md_path)
+    tmp_path = index_path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    logger.info(
+        "Saved page index for %s (%d pages).",
+        md_path.name, len(index["pages"]),
+    )
+    return True
+
+
+def read_page_range(md_path, index, start_page, end_page):
+    """Read pages ``start_page..end_page`` using a page index.
+
+    Returns ``[(page_number, text), ...]`` in file order for the pages
+    that exist. Only the bytes of those pages are read: each run of
+    adjacent ranges is read with its own seek, so a page number repeated
+    far away in the file does not pull in everything in between.
+    """
+    ranges = sorted(
+        (start, end, int(page))
+        for page, page_ranges in index["pages"].items()
+        if start_page <= int(page) <= end_page
+        for start, end in page_ranges
+    )
+
+    # Contiguous runs of ranges as [run_start, run_end, members]
+    runs = []
+    for start, end, page in ranges:
+        if runs and start <= runs[-1][1]:
+            runs[-1][1] = max(runs[-1][1], end)
+            runs[-1][2].append((start, end, page))
+        else:
+            runs.append([start, end, [(start, end, page)]])
+
+    pages = []
+    with open(md_path, "rb") as f:
+        for run_start, run_end, members in runs:
+            f.seek(run_start)
+            data = f.read(run_end - run_start)
+            pages.extend(
+                (
+                    page,
+                    data[start - run_start:end - run_start].decode(
+                        "utf-8", errors="replace"
+                    ),
+                )
+                for start, end, page in members
+            )
+    return pages
@@ -0,0 +1,214 @@
+"""Lookup index over ``tables.json`` for the ``get_table`` tool.
+
+Built at ingestion time and saved as ``study_data/tables_index.json``:
+
+- term -> positions postings over table titles, where the terms are the
+  pieces of each lowercased title split like query keywords are;
+- the SHA-256 of the ``tables.json`` bytes it was built from, so readers
+  can tell when it is stale.
+
+A keyword never contains a split character, so a title contains it
+exactly when one of the title's terms does. Keyword matching therefore
+only searches the vocabulary (joined into one string) and reads the
+postings of the terms found, instead of scanning every title.
+
+Substring lookups of a whole query run as a single ``str.find`` over all
+titles (or ids) joined into one string. All lookups return the same
+tables, in the same order, as the scans over ``tables.json`` they
+replace.
+"""
+
+import bisect
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "tables_index.json"
+# Bumped when the layout changes; older indexes are rebuilt
+INDEX_FORMAT = 2
+QUERY_SPLIT_PATTERN = re.compile(r"[\s\-:.,;()/]+")
+STOP_WORDS = {
+    "a", "an", "the", "of", "in", "for", "and", "or", "to", "by",
+    "at", "from", "with", "on", "is", "are", "was", "were", "that",
+    "this", "as", "example", "table", "figure", "annex", "summary",
+}
+# Fraction of query keywords a title must contain to count as a match
+MIN_KEYWORD_COVERAGE = 0.3
+SEPARATOR = "\x00"
+
+
+def title_terms(title_lower):
+    return {w for w in QUERY_SPLIT_PATTERN.split(title_lower) if w}
+
+
+def query_keywords(query_lower):
+    return [
+        w for w in QUERY_SPLIT_PATTERN.split(query_lower)
+        if w and w not in STOP_WORDS and len(w) > 2
+    ]
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TableIndex:
+
+    def __init__(self, tables, postings, tables_sha256=None):
+        self.tables = tables
+        self.postings = postings
+        self.tables_sha256 = tables_sha256
+        self._vocabulary, self._vocabulary_starts = self._join(postings)
+        self._terms = list(postings)
+        self.by_id = {}
+        for table in tables:
+            self.by_id.setdefault(table.get("table_id", "").lower(), table)
+        self._titles, self._title_starts = self._join(
+            t.get("title", "") for t in tables
+        )
+        self._ids, self._id_starts = self._join(
+            t.get("table_id", "") for t in tables
+        )
+
+    @staticmethod
+    def _join(values):
+        starts = []
+        parts = []
+        offset = 0
+        for value in values:
+            value = value.lower()
+            starts.append(offset)
+            parts.append(value)
+            offset += len(value) + len(SEPARATOR)
+        return SEPARATOR.join(parts), starts
+
+    @classmethod
+    def build(cls, tables, tables_sha256=None):
+        postings = {}
+        for position, table in enumerate(tables):
+            for term in title_terms(table.get("title", "").lower()):
+                postings.setdefault(term, []).append(position)
+        return cls(tables, postings, tables_sha256)
+
+    @classmethod
+    def from_dict(cls, data, tables):
+        return cls(tables, data["postings"], data.get("tables_sha256"))
+
+    def to_dict(self):
+        return {
+            "format": INDEX_FORMAT,
+            "tables_sha256": self.tables_sha256,
+            "postings": self.postings,
+        }
+
+    def _find(self, haystack, starts, needle):
+        if SEPARATOR in needle:
+            return None
+        offset = haystack.find(needle)
+        if offset < 0:
+            return None
+        return self.tables[bisect.bisect_right(starts, offset) - 1]
+
+    def find_by_title(self, query_lower):
+        """First table (in tables.json order) whose title contains it."""
+        return self._find(self._titles, self._title_starts, query_lower)
+
+    def find_by_partial_id(self, query_lower):
+        return self._find(self._ids, self._id_starts, query_lower)
+
+    def _title_positions(self, keyword):
+        """Positions of the tables whose title contains ``keyword``."""
+        positions = set()
+        if SEPARATOR in keyword:
+            return positions
+        starts = self._vocabulary_starts
+        offset = self._vocabulary.find(keyword)
+        while offset >= 0:
+            term = bisect.bisect_right(starts, offset) - 1
+            positions.update(self.postings[self._terms[term]])
+            if term + 1 == len(starts):
+                break
+            # Continue with the next term
+            offset = self._vocabulary.find(keyword, starts[term + 1])
+        return positions
+
+    def rank(self, query_lower, limit=4):
+        """Rank tables by the share of query keywords their title contains.
+
+        A table qualifies when its title contains more than
+        ``MIN_KEYWORD_COVERAGE`` of the query keywords. Qualifying tables
+        are ordered by that coverage, then by their order in tables.json.
+
+        Returns ``[(coverage, table), ...]``, best first.
+        """
+        keywords = query_keywords(query_lower)
+        if not keywords or not self.tables:
+            return []
+
+        matched = {}
+        for keyword in keywords:
+            for position in self._title_positions(keyword):
+                matched[position] = matched.get(position, 0) + 1
+
+        ranked = heapq.nsmallest(
+            limit,
+            (
+                (-count, position)
+                for position, count in matched.items()
+                if count / len(keywords) > MIN_KEYWORD_COVERAGE
+            ),
+        )
+        return [
+            (-count / len(keywords), self.tables[position])
+            for count, position in ranked
+        ]
+
+
+def write_table_index(study_data_dir):
+    """Build ``tables_index.json`` from ``tables.json``.
+
+    Returns the index, or None if there is no readable tables.json.
+    """
+    tables_path = study_data_dir / "tables.json"
+    try:
+        with open(tables_path, "rb") as f:
+            raw = f.read()
+        tables = json.loads(raw)
+    except (IOError, json.JSONDecodeError):
+        logger.warning("Cannot build table index without tables.json.")
+        return None
+
+    index = TableIndex.build(tables, hash_bytes(raw))
+    index_path = study_data_dir / INDEX_FILENAME
+    tmp_path = index_path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    logger.info(
+        "Saved table index (%d tables, %d terms) to %s.",
+        len(tables), len(index.postings), index_path,
+    )
+    return index
+
+
+def load_table_index(study_data_dir, tables, tables_sha256):
+    """Return the saved index if it matches ``tables``, else build one."""
+    index_path = study_data_dir / INDEX_FILENAME
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if (
+            data.get("format") == INDEX_FORMAT
+            and data.get("tables_sha256") == tables_sha256
+        ):
+            return TableIndex.from_dict(data, tables)
+        logger.info("Table index is stale. Rebuilding in memory.")
+    except (IOError, json.JSONDecodeError, KeyError):
+        logger.info("No usable table index. Building in memory.")
+    return TableIndex.build(tables, tables_sha256)
@@ -0,0 +1,294 @@
+"""Helpers for building document tree indexes from OCR markdown.
+
+The tree schema is shared by every builder: a list of nodes with
+``node_id``, ``title``, ``level``, ``start_page``, ``end_page``,
+``summary`` and ``children``.
+"""
+
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+PAGE_MARKER_PATTERN = re.compile(r"--- Page (\d+) ---")
+
+
+def split_pages(content):
+    """Split OCR markdown on ``--- Page N ---`` markers.
+
+    Returns a list of ``(page_number, text)`` tuples where each text
+    starts with its own page marker. Content before the first marker is
+    kept with the first page.
+    """
+    matches = list(PAGE_MARKER_PATTERN.finditer(content))
+    if not matches:
+        return [(1, content)]
+
+    pages = []
+    for i, match in enumerate(matches):
+        start = 0 if i == 0 else match.start()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        pages.append((int(match.group(1)), content[start:end]))
+    return pages
+
+
+def page_windows(pages, max_chars):
+    """Group consecutive pages into windows of at most ``max_chars``.
+
+    Windows always break on page boundaries. A single page longer than
+    ``max_chars`` is truncated so every window fits the limit.
+    """
+    windows = []
+    current = []
+    size = 0
+    for page_num, text in pages:
+        if len(text) > max_chars:
+            logger.warning(
+                "Page %d is %d chars; truncating to %d for tree index.",
+                page_num, len(text), max_chars,
+            )
+            text = text[:max_chars]
+        if current and size + len(text) > max_chars:
+            windows.append(current)
+            current = []
+            size = 0
+        current.append((page_num, text))
+        size += len(text)
+    if current:
+        windows.append(current)
+    return windows
+
+
+def as_node_list(tree):
+    """Coerce an LLM tree response into a list of node dicts."""
+    if isinstance(tree, list):
+        return [n for n in tree if isinstance(n, dict)]
+    if isinstance(tree, dict):
+        if "title" in tree:
+            return [tree]
+        for value in tree.values():
+            if isinstance(value, list):
+                return as_node_list(value)
+    return []
+
+
+def _to_page(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _clamp_pages(nodes, first_page, last_page):
+    """Clamp node page ranges into ``[first_page, last_page]``."""
+    for node in nodes:
+        start = _to_page(node.get("start_page"), first_page)
+        end = _to_page(node.get("end_page"), start)
+        start = min(max(start, first_page), last_page)
+        end = min(max(end, start), last_page)
+        node["start_page"] = start
+        node["end_page"] = end
+        node["children"] = as_node_list(node.get("children", []))
+        _clamp_pages(node["children"], start, end)
+
+
+def _normalize_title(title):
+    title = re.sub(r"\(cont(?:inued|\.|'d)?\)", "", str(title), flags=re.I)
+    return re.sub(r"[^a-z0-9]+", " ", title.lower()).strip()
+
+
+def assign_node_ids(nodes, prefix, level=1):
+    """Give every node a positional ``<prefix>_<n>.<m>...`` id and level."""
+    for i, node in enumerate(nodes, 1):
+        node_id = f"{prefix}.{i}" if level > 1 else f"{prefix}_{i}"
+        node["node_id"] = node_id
+        node["level"] = level
+        assign_node_ids(node.get("children", []), node_id, level + 1)
+
+
+def id_prefix(stem):
+    return re.sub(r"[^a-z0-9]+", "_", stem.lower()).strip("_") or "doc"
+
+
+def merge_subtrees(subtrees, stem):
+    """Merge per-window sub-trees into one tree for the whole document.
+
+    Args:
+        subtrees: ``[(first_page, last_page, nodes), ...]`` in page order.
+        stem: Document stem, used as the node_id prefix.
+
+    A top-level node that continues across a window boundary (same title
+    as the previous window's last node) is merged into that node. Node
+    ids are reassigned positionally so they are unique across windows.
+    """
+    merged = []
+    for first_page, last_page, nodes in subtrees:
+        nodes = as_node_list(nodes)
+        _clamp_pages(nodes, first_page, last_page)
+        for node in nodes:
+            previous = merged[-1] if merged else None
+            if (
+                previous is not None
+                and node["start_page"] <= previous["end_page"] + 1
+                and _normalize_title(node.get("title", ""))
+                == _normalize_title(previous.get("title", ""))
+            ):
+                previous["end_page"] = max(
+                    previous["end_page"], node["end_page"]
+                )
+                previous["children"].extend(node["children"])
+                continue
+            merged.append(node)
+
+    assign_node_ids(merged, id_prefix(stem))
+    return merged
+
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+SECTION_NUMBER_PATTERN = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+\S")
+# Table-of-contents entries OCR'd as headings end with a page number
+TOC_ENTRY_PATTERN = re.compile(r"\s\.*\s*\d{1,4}$")
+SKIP_SUMMARY_PATTERN = re.compile(r"^(?:!\[|<table|\||--- Page \d+ ---)")
+MAX_TITLE_CHARS = 150
+SUMMARY_CHARS = 240
+
+
+def _heading_level(hashes, title):
+    """Prefer explicit section numbering ("2.2.1.") over '#' count, which
+    OCR assigns inconsistently."""
+    match = SECTION_NUMBER_PATTERN.match(title)
+    if match:
+        return match.group(1).count(".") + 1
+    return len(hashes)
+
+
+def _extractive_summary(lines):
+    text = " ".join(
+        line.strip() for line in lines
+        if line.strip() and not SKIP_SUMMARY_PATTERN.match(line.strip())
+    )
+    text = re.sub(r"\s+", " ", text)
+    if len(text) <= SUMMARY_CHARS:
+        return text
+    cut = text[:SUMMARY_CHARS]
+    sentence_end = cut.rfind(". ")
+    if sentence_end > SUMMARY_CHARS // 3:
+        return cut[:sentence_end + 1]
+    return cut.rsplit(" ", 1)[0] + "..."
+
+
+def _parse_headings(pages):
+    headings = []
+    for page_num, text in pages:
+        for line in text.split("\n"):
+            match = HEADING_PATTERN.match(line)
+            if not match:
+                if headings:
+                    headings[-1]["body"].append(line)
+                continue
+            title = match.group(2).strip().strip("*").strip()
+            if not title:
+                continue
+            headings.append({
+                "title": title,
+                "level": _heading_level(match.group(1), title),
+                "page": page_num,
+                "body": [],
+            })
+    return headings
+
+
+def _drop_toc_entries(headings):
+    """Drop headings that are table-of-contents lines ("# 1. SUMMARY 9")
+    on pages full of them; the page's real heading is kept."""
+    per_page = {}
+    for h in headings:
+        if TOC_ENTRY_PATTERN.search(h["title"]):
+            per_page[h["page"]] = per_page.get(h["page"], 0) + 1
+    toc_pages = {page for page, count in per_page.items() if count >= 3}
+    return [
+        h for h in headings
+        if not (h["page"] in toc_pages and TOC_ENTRY_PATTERN.search(h["title"]))
+    ]
+
+
+def _nest(headings):
+    roots = []
+    stack = []
+    for h in headings:
+        node = {
+            "node_id": "",
+            "title": h["title"],
+            "level": h["level"],
+            "start_page": h["page"],
+            "end_page": h["page"],
+            "summary": _extractive_summary(h["body"]),
+            "children": [],
+        }
+        while stack and stack[-1]["level"] >= node["level"]:
+            stack.pop()
+        (stack[-1]["children"] if stack else roots).append(node)
+        stack.append(node)
+    return roots
+
+
+def _set_end_pages(nodes, last_page):
+    """A node runs until the next sibling starts (that page included, as
+    sections often share a page) or the parent ends."""
+    for i, node in enumerate(nodes):
+        if i + 1 < len(nodes):
+            end = nodes[i + 1]["start_page"]
+        else:
+            end = last_page
+        node["end_page"] = max(node["start_page"], end)
+        _set_end_pages(node["children"], node["end_page"])
+
+
+def _structure_confidence(headings, pages):
+    """Score 0-1 for how well the headings describe the document."""
+    total_pages = len(pages)
+    if len(headings) < 3:
+        return 0.0
+    # Long documents need a reasonable number of headings
+    coverage = min(1.0, len(headings) / max(1.0, total_pages / 10))
+    # OCR noise (every table row a heading) shows up as very high density
+    density = len(headings) / total_pages
+    density_score = 1.0 if density <= 8 else 8 / density
+    titles_ok = sum(
+        1 for h in headings if len(h["title"]) <= MAX_TITLE_CHARS
+    ) / len(headings)
+    # Pages before the first heading are not covered by any node
+    first_index = next(
+        i for i, (page_num, _) in enumerate(pages)
+        if page_num == headings[0]["page"]
+    )
+    lead_in = 1.0 - first_index / total_pages
+    return coverage * density_score * titles_ok * lead_in
+
+
+def build_structural_tree(pages, stem):
+    """Build a tree index from markdown headings and page markers alone.
+
+    Args:
+        pages: Output of :func:`split_pages`.
+        stem: Document stem, used as the node_id prefix.
+
+    Returns:
+        ``(nodes, confidence)`` where confidence is between 0 and 1.
+        Summaries are extractive (the opening text under each heading).
+    """
+    headings = _drop_toc_entries(_parse_headings(pages))
+    confidence = _structure_confidence(headings, pages)
+    nodes = _nest(headings)
+    _set_end_pages(nodes, pages[-1][0])
+    assign_node_ids(nodes, id_prefix(stem))
+    return nodes, confidence
+
+
+def sparse_leaves(nodes, max_pages):
+    """Yield leaf nodes spanning more than ``max_pages`` pages."""
+    for node in nodes:
+        if node["children"]:
+            yield from sparse_leaves(node["children"], max_pages)
+        elif node["end_page"] - node["start_page"] + 1 > max_pages:
+            yield node
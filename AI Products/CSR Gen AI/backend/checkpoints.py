@@ -0,0 +1,160 @@
+"""Checkpoint journal for resumable pipeline runs.
+
+Each completed pipeline step of a run is recorded as a
+:class:`RunCheckpoint` with a fingerprint of what it completed with:
+
+- ``ingestion``: the ingestion manifest version it produced and the
+  input PDFs (names, sizes, modification times) it saw;
+- ``guidelines``: the hash of the compiled guideline pack the writers
+  were built from;
+- ``section:<Section_N>``: the study data version, the guideline pack
+  hash and the hash of the section's final content; the content and QA
+  result are kept with it;
+- ``publish``: the hash of the section contents that went into the PDF
+  and of the PDF itself.
+
+A resumed run skips a step whose checkpoint still matches the current
+study data, guidelines and outputs, and redoes everything else.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from .config import BASE_DIR
+from .models import RunCheckpoint
+
+STEP_INGESTION = "ingestion"
+STEP_GUIDELINES = "guidelines"
+STEP_PUBLISH = "publish"
+MANIFEST_PATH = (
+    BASE_DIR / "Study-docs-module" / "study_data" / "ingestion_manifest.json"
+)
+INPUT_DIR = BASE_DIR / "Study-docs-module" / "Input-docs"
+
+
+def section_step(section_key: str) -> str:
+    return f"section:{section_key}"
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def sha256_file(path) -> str | None:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def current_data_version() -> str | None:
+    """Return the version of the study data currently on disk."""
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (IOError, json.JSONDecodeError):
+        return None
+
+
+def input_fingerprint(input_dir=INPUT_DIR) -> str:
+    """Hash of the names, sizes and modification times of the input PDFs,
+    so adding, removing or replacing one changes it."""
+    digest = hashlib.sha256()
+    for path in sorted(input_dir.glob("*.pdf")):
+        stat = path.stat()
+        digest.update(f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def ingestion_fingerprint(data_version: str | None,
+                          inputs: str | None = None) -> str | None:
+    """Fingerprint of the ingestion step: the study data version and the
+    inputs it was produced from."""
+    if not data_version:
+        return None
+    return f"{data_version}:{inputs or input_fingerprint()}"
+
+
+def get_checkpoints(db: Session, run_id: str) -> dict[str, RunCheckpoint]:
+    rows = db.query(RunCheckpoint).filter(RunCheckpoint.run_id == run_id).all()
+    return {row.step: row for row in rows}
+
+
+def record_checkpoint(db: Session, run_id: str, step: str, fingerprint: str,
+                      details: dict | None = None):
+    """Record (or replace) the checkpoint of a completed step."""
+    row = db.query(RunCheckpoint).filter(
+        RunCheckpoint.run_id == run_id, RunCheckpoint.step == step
+    ).first()
+    if row is None:
+        row = RunCheckpoint(run_id=run_id, step=step)
+        db.add(row)
+    row.fingerprint = fingerprint
+    row.details = details
+    row.completed_at = datetime.utcnow()
+    db.commit()
+
+
+def clear_checkpoints(db: Session, run_id: str, step: str | None = None):
+    """Drop one step's checkpoint, or all of the run's when ``step`` is None."""
+    query = db.query(RunCheckpoint).filter(RunCheckpoint.run_id == run_id)
+    if step is not None:
+        query = query.filter(RunCheckpoint.step == step)
+    query.delete(synchronize_session=False)
+    db.commit()
+
+
+def section_fingerprint(data_version: str | None, content: str,
+                        pack_hash: str | None = None) -> str:
+    return f"{data_version or ''}:{pack_hash or ''}:{sha256_text(content)}"
+
+
+def publish_fingerprint(contents: dict[str, str]) -> str:
+    """Hash of the section contents, in section order, behind a PDF."""
+    digest = hashlib.sha256()
+    for key in sorted(contents, key=lambda k: int(k.replace("Section_", ""))):
+        digest.update(key.encode("utf-8"))
+        digest.update(sha256_text(contents[key]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def kept_section_content(checkpoint: RunCheckpoint | None, section_row,
+                         data_version: str | None,
+                         pack_hash: str | None = None) -> str | None:
+    """Return the content a resumed run can keep for a section, or None.
+
+    A human-edited section is always kept. A generated one is kept if its
+    checkpoint was made against the current study data and guidelines.
+    """
+    if (
+        section_row is not None
+        and section_row.is_human_edited
+        and section_row.content
+    ):
+        return section_row.content
+    if checkpoint is None:
+        return None
+    content = (checkpoint.details or {}).get("content")
+    if not content:
+        return None
+    if checkpoint.fingerprint != section_fingerprint(
+        data_version, content, pack_hash
+    ):
+        return None
+    return content
+
+
+def publish_is_valid(checkpoint: RunCheckpoint | None, contents: dict[str, str],
+                     pdf_path) -> bool:
+    if checkpoint is None:
+        return False
+    if checkpoint.fingerprint != publish_fingerprint(contents):
+        return False
+    return (checkpoint.details or {}).get("pdf_sha256") == sha256_file(pdf_path)
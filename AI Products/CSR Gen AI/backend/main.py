@@ -8,7 +8,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from .auth import hash_password
 from .database import init_db, SessionLocal
-from .models import User
+from .models import Run, User
 from .routes import auth, runs, sections, compliance, admin, dashboard
 from .websocket import manager
 
@@ -73,6 +73,7 @@ async def ws_user(websocket: WebSocket, user_id: int):
 def startup():
     init_db()
     _seed_admin()
+    _mark_interrupted_runs()
 
 
 def _seed_admin():
@@ -97,6 +98,24 @@ def _seed_admin():
         db.close()
 
 
+def _mark_interrupted_runs():
+    """Fail runs left running by a previous server process so they can be
+    resumed from their checkpoints."""
+    db = SessionLocal()
+    try:
+        runs = db.query(Run).filter(Run.status.in_(("running", "pending"))).all()
+        for run in runs:
+            run.status = "failed"
+            run.error_message = "Interrupted by a server restart; resume to continue."
+        if runs:
+            db.commit()
+            logging.getLogger(__name__).info(
+                "Marked %d interrupted run(s) as resumable.", len(runs)
+            )
+    finally:
+        db.close()
+
+
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
@@ -12,6 +12,7 @@ from sqlalchemy import (
     String,
     Text,
     JSON,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 
@@ -60,6 +61,7 @@ class Run(Base):
     logs = relationship("AgentLog", back_populates="run", cascade="all, delete-orphan")
     compliance_reports = relationship("ComplianceReport", back_populates="run", cascade="all, delete-orphan")
     output_files = relationship("OutputFile", back_populates="run", cascade="all, delete-orphan")
+    checkpoints = relationship("RunCheckpoint", back_populates="run", cascade="all, delete-orphan")
 
     @property
     def completed_sections(self):
@@ -127,6 +129,28 @@ class Section(Base):
                         primaryjoin="Section.run_id == Run.run_id")
 
 
+class RunCheckpoint(Base):
+    """A completed pipeline step a resumed run may skip.
+
+    ``step`` is ``ingestion``, ``section:<Section_N>`` or ``publish``;
+    ``fingerprint`` identifies the inputs and output the step completed
+    with, so a resume can tell whether it is still valid.
+    """
+    __tablename__ = "run_checkpoints"
+    __table_args__ = (UniqueConstraint("run_id", "step"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String(20), ForeignKey("runs.run_id"), nullable=False, index=True)
+    step = Column(String(50), nullable=False)
+    fingerprint = Column(String(200), nullable=False)
+    details = Column(JSON, nullable=True)
+    completed_at = Column(DateTime, default=datetime.utcnow)
+
+    run = relationship("Run", back_populates="checkpoints",
+                        foreign_keys=[run_id],
+                        primaryjoin="RunCheckpoint.run_id == Run.run_id")
+
+
 class AgentLog(Base):
     __tablename__ = "agent_logs"
 
@@ -5,18 +5,28 @@ WebSocket events and updating the database as sections complete.
 """
 
 import asyncio
+import contextvars
+import functools
 import logging
 import os
 import shutil
 import sys
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from logging import Handler
 
 from sqlalchemy.orm import Session
 
+from .checkpoints import (
+    STEP_GUIDELINES, STEP_INGESTION, STEP_PUBLISH, clear_checkpoints,
+    current_data_version, get_checkpoints, ingestion_fingerprint,
+    input_fingerprint, kept_section_content, publish_fingerprint,
+    publish_is_valid, record_checkpoint, section_fingerprint, section_step,
+    sha256_file,
+)
 from .config import BASE_DIR, OUTPUT_DIR, SECTION_MAP, GENERATED_SECTIONS
 from .database import SessionLocal
 from .models import (
@@ -40,12 +50,7 @@ def _emit(run_id: str, event_type: str, payload: dict | None = None):
         "timestamp": datetime.utcnow().isoformat(),
         "payload": payload or {},
     }
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            loop.create_task(manager.broadcast_to_run(run_id, data))
-    except RuntimeError:
-        pass
+    manager.publish_to_run(run_id, data)
 
 
 def _notify_user(user_id: int, run_id: str, event_type: str, message: str):
@@ -70,12 +75,7 @@ def _notify_user(user_id: int, run_id: str, event_type: str, message: str):
             "is_read": False,
             "created_at": n.created_at.isoformat(),
         }
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop.create_task(manager.broadcast_to_user(user_id, data))
-        except RuntimeError:
-            pass
+        manager.publish_to_user(user_id, data)
     finally:
         db.close()
 
@@ -107,34 +107,153 @@ def _log_agent(db: Session, run_id: str, agent_name: str, status: str,
     })
 
 
+def _update_section(db: Session, run_id: str, section_number: int, **fields):
+    """Set fields of a section row and commit."""
+    sec_row = db.query(Section).filter(
+        Section.run_id == run_id, Section.section_number == section_number
+    ).first()
+    if sec_row is None:
+        return
+    for name, value in fields.items():
+        setattr(sec_row, name, value)
+    db.commit()
+
+
+class _DbWriter:
+    """Serialises the database writes of a run's concurrent section tasks.
+
+    One worker thread owns one session and runs ``fn(session, ...)`` for
+    the tasks in submission order, so one section's commit never flushes
+    another's half-updated row, and commits do not block the event loop.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pipeline-db"
+        )
+        self._session = None
+
+    def _call(self, fn, args, kwargs):
+        if self._session is None:
+            self._session = SessionLocal()
+        try:
+            return fn(self._session, *args, **kwargs)
+        except Exception:
+            self._session.rollback()
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(session, *args, **kwargs)`` and return its result."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._call, fn, args, kwargs
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(session, *args, **kwargs)`` without waiting; safe to
+        call from any thread."""
+        future = self._executor.submit(self._call, fn, args, kwargs)
+        future.add_done_callback(_log_write_error)
+
+    def close(self):
+        """Finish queued writes and close the session."""
+        self._executor.submit(lambda: self._session and self._session.close())
+        self._executor.shutdown(wait=True)
+
+
+def _log_write_error(future):
+    if future.exception() is not None:
+        logger.warning("Database write failed: %s", future.exception())
+
+
+# Run being generated by the current task; tasks inherit it, so log
+# records can be attributed to their run while sections run concurrently
+_current_run = contextvars.ContextVar("pipeline_run", default=None)
+
+
 class _ChunkLogHandler(Handler):
-    """Captures [CHUNK LOG] messages from tools.py and saves them to DB."""
+    """Captures [CHUNK LOG] messages from tools.py and saves them to DB.
+
+    Sections generate concurrently, so one handler serves the whole run
+    and attributes each record to the section of the task that logged it.
+    """
 
-    def __init__(self, db: "Session", run_id: str, section_key: str):
+    def __init__(self, db_writer: "_DbWriter", run_id: str, current_section):
         super().__init__()
-        self.db = db
+        self.db_writer = db_writer
         self.run_id = run_id
-        self.section_key = section_key
+        self.current_section = current_section
 
     def emit(self, record: logging.LogRecord):
+        if _current_run.get() != self.run_id:
+            return
+        section_key = self.current_section.get()
+        if section_key is None:
+            return
         msg = record.getMessage()
         if "[CHUNK LOG]" not in msg:
             return
-        try:
-            _log_agent(
-                self.db,
-                self.run_id,
-                f"{self.section_key}_ChunkRetrieval",
-                "info",
-                msg,
-                phase=f"{self.section_key}_chunks",
-            )
-        except Exception:
-            pass
+        self.db_writer.submit(
+            _log_agent,
+            self.run_id,
+            f"{section_key}_ChunkRetrieval",
+            "info",
+            msg,
+            phase=f"{section_key}_chunks",
+        )
+
+
+def _section_stream(run_id: str, section_key: str, save_text):
+    """Stream a section's writer output to its working file, its DB row
+    (through ``save_text(text)``) and the run's WebSocket clients as
+    ``section_delta`` events."""
+    from section_stream import SectionStream, working_path
+
+    sec_num = int(section_key.replace("Section_", ""))
+
+    def _on_flush(offset, delta, text):
+        save_text(text)
+        _emit(run_id, "section_delta", {
+            "section_number": sec_num, "offset": offset, "delta": delta,
+        })
+
+    return SectionStream(working_path(OUTPUT_DIR, section_key), _on_flush)
+
 
+def _compliance_trace(violations, qa_pass: bool | None,
+                      qa_reason: str | None) -> list[dict]:
+    """Build a section's compliance trace from its lint violations and the
+    QA agent's verdict (which is skipped when lint fails)."""
+    trace = [
+        {
+            "rule_id": f"LINT-{v.rule}",
+            "rule_description": v.message,
+            "status": "fail",
+            "details": f"line {v.line}: {v.text[:200]}",
+        }
+        for v in violations
+    ]
+    if not violations:
+        trace.append({
+            "rule_id": "LINT",
+            "rule_description": "Mechanical formatting and compliance checks",
+            "status": "pass",
+        })
+        trace.append({
+            "rule_id": "QA",
+            "rule_description": "QA agent review",
+            "status": {True: "pass", False: "fail"}.get(qa_pass, "warning"),
+            "details": qa_reason,
+        })
+    return trace
 
-async def run_pipeline(run_id: str, user_id: int):
-    """Execute the full CSR generation pipeline for a given run."""
+
+async def run_pipeline(run_id: str, user_id: int, resume: bool = False):
+    """Execute the full CSR generation pipeline for a given run.
+
+    With ``resume``, steps whose checkpoints are still valid (ingestion,
+    finished sections, the published PDF) are skipped; otherwise the
+    run's checkpoints are cleared and everything is redone.
+    """
     db = SessionLocal()
     try:
         run = db.query(Run).filter(Run.run_id == run_id).first()
@@ -142,24 +261,65 @@ async def run_pipeline(run_id: str, user_id: int):
             logger.error("Run %s not found", run_id)
             return
 
+        if not resume:
+            clear_checkpoints(db, run_id)
+        checkpoints = get_checkpoints(db, run_id)
+
         run.status = "running"
         run.started_at = datetime.utcnow()
         run.current_phase = "ingestion"
         db.commit()
 
         _emit(run_id, "progress", {"percent": 0, "phase_label": "Starting ingestion..."})
-        _log_agent(db, run_id, "Orchestrator", "started", "Pipeline started")
+        _log_agent(db, run_id, "Orchestrator", "started",
+                   "Pipeline resumed" if resume else "Pipeline started")
 
         # ── Step 1: Ingestion ─────────────────────────────────────────────
+        ingestion_checkpoint = checkpoints.get(STEP_INGESTION)
         try:
-            _log_agent(db, run_id, "IngestionEngine", "running", "Processing study documents...")
-            from ingestion_engine import StudyIngestionEngine
-            engine = StudyIngestionEngine()
-
-            # Run ingestion in a thread to avoid blocking the event loop
-            await asyncio.get_event_loop().run_in_executor(None, engine.run_ingestion)
-
-            _log_agent(db, run_id, "IngestionEngine", "completed", "Ingestion complete")
+            # Taken before ingestion: inputs changed while it runs are
+            # picked up by the next resume
+            inputs = input_fingerprint()
+            fingerprint = ingestion_fingerprint(current_data_version(), inputs)
+            if (
+                ingestion_checkpoint
+                and fingerprint
+                and ingestion_checkpoint.fingerprint == fingerprint
+            ):
+                summary = "Ingestion skipped (study data and inputs unchanged since checkpoint)"
+            else:
+                _log_agent(db, run_id, "IngestionEngine", "running", "Processing study documents...")
+                from ingestion_engine import StudyIngestionEngine
+                engine = StudyIngestionEngine()
+
+                # Run ingestion in a thread to avoid blocking the event loop;
+                # per-document progress arrives from the ingestion workers
+                loop = asyncio.get_event_loop()
+
+                def _on_ingestion_progress(stem, stage, status):
+                    loop.call_soon_threadsafe(_emit, run_id, "ingestion_progress", {
+                        "document": stem, "stage": stage, "status": status,
+                    })
+
+                change_set = await loop.run_in_executor(None, functools.partial(
+                    engine.run_ingestion, progress_callback=_on_ingestion_progress,
+                ))
+
+                summary = "Ingestion complete"
+                if change_set:
+                    summary += (
+                        f" ({len(change_set['ocr'])} OCR, "
+                        f"{len(change_set['trees'])} trees, "
+                        f"{len(change_set['tables'])} table sets refreshed; "
+                        f"{len(change_set['removed'])} removed)"
+                    )
+                data_version = (change_set or {}).get("version") or current_data_version()
+                record_checkpoint(
+                    db, run_id, STEP_INGESTION,
+                    ingestion_fingerprint(data_version, inputs) or "",
+                    {"summary": summary},
+                )
+            _log_agent(db, run_id, "IngestionEngine", "completed", summary)
             _emit(run_id, "progress", {"percent": 10, "phase_label": "Ingestion complete"})
         except Exception as e:
             logger.error("Ingestion failed for run %s: %s", run_id, e, exc_info=True)
@@ -177,7 +337,18 @@ async def run_pipeline(run_id: str, user_id: int):
         db.commit()
 
         try:
-            from agents import create_csr_agents, SECTION_MAP as AGENT_SECTION_MAP
+            from agents import (
+                create_csr_agents, get_guideline_pack,
+                SECTION_MAP as AGENT_SECTION_MAP,
+            )
+            from tools import search_cache_stats
+            from llm_gateway import get_gateway
+            from orchestrator import _postprocess_section, _qa_verdict
+            from section_linter import lint_section
+            from section_scheduler import (
+                current_section, run_section_dag, upstream_context,
+                with_dependents,
+            )
             from google.adk.runners import InMemoryRunner
             from google.genai import types
         except ImportError as e:
@@ -189,6 +360,14 @@ async def run_pipeline(run_id: str, user_id: int):
             _emit(run_id, "pipeline_failed", {"error": str(e)})
             return
 
+        # Record which compiled instructions this run's writers use
+        pack = get_guideline_pack()
+        record_checkpoint(db, run_id, STEP_GUIDELINES, pack.hash, {
+            "source_sha256": pack.source_sha256,
+            "builder_sha256": pack.builder_sha256,
+        })
+        _log_agent(db, run_id, "Orchestrator", "info",
+                   f"Guideline pack {pack.hash[:12]}")
         agents = create_csr_agents()
         qa_agent = agents.pop("QA")
         qa_runner = InMemoryRunner(agent=qa_agent, app_name="csr_qa")
@@ -197,26 +376,68 @@ async def run_pipeline(run_id: str, user_id: int):
             k for k in AGENT_SECTION_MAP if k not in ("Section_3", "Section_4")
         ]
         total = len(sections_to_generate)
+        cache_before = search_cache_stats()
+
+        # Keep sections finished by an earlier attempt of this run, unless
+        # the study data or guidelines changed or something they summarize
+        # is redone
+        data_version = current_data_version()
+        kept = {}
+        for section_key in sections_to_generate:
+            sec_row = db.query(Section).filter(
+                Section.run_id == run_id,
+                Section.section_number == int(section_key.replace("Section_", "")),
+            ).first()
+            content = kept_section_content(
+                checkpoints.get(section_step(section_key)), sec_row,
+                data_version, pack.hash,
+            )
+            if content is not None:
+                kept[section_key] = content
+                if sec_row and sec_row.status != "completed":
+                    # Interrupted between the checkpoint and the row update
+                    sec_row.status = "completed"
+                    sec_row.content = content
+                    sec_row.word_count = len(content.split())
+                    sec_row.completed_at = datetime.utcnow()
+                    db.commit()
+        stale = with_dependents(set(sections_to_generate) - set(kept))
+        kept = {k: v for k, v in kept.items() if k not in stale}
+        if kept:
+            # The output directory is shared between runs
+            OUTPUT_DIR.mkdir(exist_ok=True)
+            for section_key, content in kept.items():
+                with open(OUTPUT_DIR / f"{section_key}.md", "w", encoding="utf-8") as f:
+                    f.write(content)
+            _log_agent(db, run_id, "Orchestrator", "info",
+                       f"Resuming: {len(kept)} section(s) kept from checkpoint, "
+                       f"{total - len(kept)} to generate")
+        section_contents = dict(kept)
+
+        completed = len(kept)
+        # Section tasks run concurrently; their writes go through one owner
+        db_writer = _DbWriter()
 
-        for idx, section_key in enumerate(sections_to_generate):
+        async def _generate_section(section_key, upstream):
+            nonlocal completed
             sec_num = int(section_key.replace("Section_", ""))
             sec_name = SECTION_MAP.get(sec_num, section_key)
 
             # Update DB section status
-            sec_row = db.query(Section).filter(
-                Section.run_id == run_id, Section.section_number == sec_num
-            ).first()
-            if sec_row:
-                sec_row.status = "running"
-                sec_row.started_at = datetime.utcnow()
-                db.commit()
+            await db_writer.run(
+                _update_section, run_id, sec_num,
+                status="running", started_at=datetime.utcnow(),
+            )
 
-            _log_agent(db, run_id, f"Section_{sec_num}_Writer", "running",
-                       f"Generating {sec_name}...", phase=sec_name)
+            await db_writer.run(
+                _log_agent, run_id, f"Section_{sec_num}_Writer", "running",
+                f"Generating {sec_name}...", phase=sec_name,
+            )
 
-            pct = 10 + int((idx / total) * 80)
+            pct = 10 + int((completed / total) * 80)
             _emit(run_id, "progress", {"percent": pct, "phase_label": f"Generating {sec_name}"})
 
+            stream = None
             try:
                 writer_agent = agents[section_key]
                 writer_runner = InMemoryRunner(
@@ -228,78 +449,148 @@ async def run_pipeline(run_id: str, user_id: int):
                     f"({section_key}). Use the reasoning_search tool to find "
                     "relevant study data and the get_table tool to retrieve "
                     "any required tables. Follow all guidelines strictly."
+                ) + upstream_context(upstream)
+
+                stream = _section_stream(
+                    run_id, section_key,
+                    lambda text: db_writer.submit(
+                        _update_section, run_id, sec_num,
+                        content=text, word_count=len(text.split()),
+                    ),
+                )
+                content = await _run_agent_async(
+                    writer_runner, section_key, prompt, stream
                 )
 
-                # Attach chunk-log handler so [CHUNK LOG] lines are persisted
-                chunk_handler = _ChunkLogHandler(db, run_id, section_key)
-                chunk_handler.setLevel(logging.INFO)
-                tools_logger = logging.getLogger("tools")
-                tools_logger.addHandler(chunk_handler)
-                try:
-                    content = await _run_agent_async(writer_runner, section_key, prompt)
-                finally:
-                    tools_logger.removeHandler(chunk_handler)
-
-                # QA pass
-                qa_prompt = f"Review the following CSR section for compliance violations:\n\n{content}"
-                qa_result = await _run_agent_async(qa_runner, f"QA_{section_key}", qa_prompt)
-
-                # Post-process (import from orchestrator)
-                from orchestrator import _postprocess_section
                 content = _postprocess_section(content, section_key)
 
+                # QA pass: local lint first, the QA agent only if it is clean
+                violations = lint_section(content, section_key)
+                if violations:
+                    qa_pass = False
+                    qa_reason = f"{len(violations)} lint violation(s)"
+                else:
+                    qa_prompt = f"Review the following CSR section for compliance violations:\n\n{content}"
+                    qa_result = await _run_agent_async(qa_runner, f"QA_{section_key}", qa_prompt)
+                    verdict = _qa_verdict(qa_result)
+                    qa_pass = None if verdict is None else verdict is True
+                    qa_reason = verdict if isinstance(verdict, str) else None
+                await db_writer.run(
+                    record_checkpoint, run_id, section_step(section_key),
+                    section_fingerprint(data_version, content, pack.hash),
+                    {"content": content, "qa_pass": qa_pass,
+                     "guidelines": pack.hash},
+                )
+                section_contents[section_key] = content
+
                 # Save to file
                 OUTPUT_DIR.mkdir(exist_ok=True)
                 out_path = OUTPUT_DIR / f"{section_key}.md"
                 with open(out_path, "w", encoding="utf-8") as f:
                     f.write(content)
+                # Flush before the final row update, which must come last
+                stream.close()
 
                 # Update DB
                 word_count = len(content.split()) if content else 0
-                if sec_row:
-                    sec_row.status = "completed"
-                    sec_row.content = content
-                    sec_row.word_count = word_count
-                    sec_row.completed_at = datetime.utcnow()
-                    db.commit()
+                await db_writer.run(
+                    _update_section, run_id, sec_num,
+                    status="completed",
+                    content=content,
+                    word_count=word_count,
+                    completed_at=datetime.utcnow(),
+                    compliance_trace=_compliance_trace(
+                        violations, qa_pass, qa_reason
+                    ),
+                )
 
-                _log_agent(db, run_id, f"Section_{sec_num}_Writer", "completed",
-                           f"{sec_name} generated ({word_count} words)", phase=sec_name)
+                await db_writer.run(
+                    _log_agent, run_id, f"Section_{sec_num}_Writer", "completed",
+                    f"{sec_name} generated ({word_count} words)", phase=sec_name,
+                )
                 _emit(run_id, "section_complete", {
                     "section_number": sec_num, "section_name": sec_name
                 })
+                return content
 
             except Exception as e:
                 logger.error("Section %s failed: %s", section_key, e, exc_info=True)
-                if sec_row:
-                    sec_row.status = "failed"
-                    sec_row.completed_at = datetime.utcnow()
-                    db.commit()
-                _log_agent(db, run_id, f"Section_{sec_num}_Writer", "failed",
-                           str(e), phase=sec_name)
+                await db_writer.run(
+                    _update_section, run_id, sec_num,
+                    status="failed", completed_at=datetime.utcnow(),
+                )
+                await db_writer.run(
+                    _log_agent, run_id, f"Section_{sec_num}_Writer", "failed",
+                    str(e), phase=sec_name,
+                )
+                raise
+            finally:
+                if stream is not None:
+                    # Removes the working file if generation failed
+                    stream.close()
+                completed += 1
+
+        # Attach chunk-log handler so [CHUNK LOG] lines are persisted
+        _current_run.set(run_id)
+        chunk_handler = _ChunkLogHandler(db_writer, run_id, current_section)
+        chunk_handler.setLevel(logging.INFO)
+        tools_logger = logging.getLogger("tools")
+        tools_logger.addHandler(chunk_handler)
+        try:
+            await run_section_dag(
+                [k for k in sections_to_generate if k not in kept],
+                _generate_section,
+                completed=kept,
+            )
+        finally:
+            tools_logger.removeHandler(chunk_handler)
+            await asyncio.get_running_loop().run_in_executor(
+                None, db_writer.close
+            )
+        # The section rows were written through db_writer's session
+        db.expire_all()
+
+        cache_after = search_cache_stats()
+        logger.info(
+            "Run %s search cache: %d exact hits, %d similar hits, %d misses.",
+            run_id,
+            cache_after["exact_hits"] - cache_before["exact_hits"],
+            cache_after["similar_hits"] - cache_before["similar_hits"],
+            cache_after["misses"] - cache_before["misses"],
+        )
+        logger.info("LLM gateway totals: %s", get_gateway().metrics())
 
         # ── Step 3: PDF publishing ────────────────────────────────────────
         run.current_phase = "publishing"
         db.commit()
         _emit(run_id, "progress", {"percent": 92, "phase_label": "Publishing PDF..."})
-        _log_agent(db, run_id, "Publisher", "running", "Compiling final PDF")
 
+        pdf_path = OUTPUT_DIR / "CSR.pdf"
         try:
-            from publisher import main as publish_pdf
-            await asyncio.get_event_loop().run_in_executor(None, publish_pdf)
-
-            pdf_path = OUTPUT_DIR / "CSR.pdf"
-            if pdf_path.exists():
-                of = OutputFile(
-                    run_id=run_id,
-                    file_type="pdf",
-                    stored_path=str(pdf_path),
-                    file_size_bytes=pdf_path.stat().st_size,
-                )
-                db.add(of)
-                db.commit()
+            if publish_is_valid(checkpoints.get(STEP_PUBLISH), section_contents, pdf_path):
+                _log_agent(db, run_id, "Publisher", "completed",
+                           "PDF unchanged since checkpoint; publishing skipped")
+            else:
+                _log_agent(db, run_id, "Publisher", "running", "Compiling final PDF")
+                from publisher import main as publish_pdf
+                await asyncio.get_event_loop().run_in_executor(None, publish_pdf)
+
+                if pdf_path.exists():
+                    of = OutputFile(
+                        run_id=run_id,
+                        file_type="pdf",
+                        stored_path=str(pdf_path),
+                        file_size_bytes=pdf_path.stat().st_size,
+                    )
+                    db.add(of)
+                    db.commit()
+                    record_checkpoint(
+                        db, run_id, STEP_PUBLISH,
+                        publish_fingerprint(section_contents),
+                        {"pdf_sha256": sha256_file(pdf_path)},
+                    )
 
-            _log_agent(db, run_id, "Publisher", "completed", "PDF created")
+                _log_agent(db, run_id, "Publisher", "completed", "PDF created")
         except Exception as e:
             logger.error("PDF publishing failed: %s", e, exc_info=True)
             _log_agent(db, run_id, "Publisher", "failed", str(e))
@@ -338,8 +629,16 @@ async def run_pipeline(run_id: str, user_id: int):
 
 
 async def run_single_section(run_id: str, section_number: int):
-    """Re-generate a single section."""
+    """Re-generate a single section.
+
+    If the rerun fails, the section keeps the content it had before.
+    """
     db = SessionLocal()
+    # Streamed text and the final update are written off the event loop,
+    # in order
+    db_writer = _DbWriter()
+    sec_row = None
+    previous = {}
     try:
         section_key = f"Section_{section_number}"
         sec_name = SECTION_MAP.get(section_number, section_key)
@@ -349,42 +648,79 @@ async def run_single_section(run_id: str, section_number: int):
             Section.section_number == section_number,
         ).first()
         if sec_row:
+            previous = {
+                "content": sec_row.content,
+                "word_count": sec_row.word_count,
+            }
             sec_row.status = "running"
             sec_row.retry_count += 1
             sec_row.started_at = datetime.utcnow()
             db.commit()
 
-        from agents import create_csr_agents
+        from agents import create_csr_agents, get_guideline_pack
+        from section_scheduler import SECTION_DEPENDENCIES, upstream_context
         from google.adk.runners import InMemoryRunner
 
+        pack = get_guideline_pack()
         agents = create_csr_agents()
         writer_agent = agents.get(section_key)
         if not writer_agent:
             raise ValueError(f"No agent for {section_key}")
 
+        # Dependent sections get this run's finished upstream text
+        upstream = {}
+        for dep in SECTION_DEPENDENCIES.get(section_key, ()):
+            dep_row = db.query(Section).filter(
+                Section.run_id == run_id,
+                Section.section_number == int(dep.replace("Section_", "")),
+                Section.status == "completed",
+            ).first()
+            if dep_row and dep_row.content:
+                upstream[dep] = dep_row.content
+
         writer_runner = InMemoryRunner(agent=writer_agent, app_name=f"csr_{section_key}")
         prompt = (
             f"Generate the complete content for CSR {sec_name} "
             f"({section_key}). Use the reasoning_search tool to find "
             "relevant study data and the get_table tool to retrieve "
             "any required tables. Follow all guidelines strictly."
+        ) + upstream_context(upstream)
+        stream = _section_stream(
+            run_id, section_key,
+            lambda text: db_writer.submit(
+                _update_section, run_id, section_number,
+                content=text, word_count=len(text.split()),
+            ),
         )
-        content = await _run_agent_async(writer_runner, section_key, prompt)
-
-        from orchestrator import _postprocess_section
-        content = _postprocess_section(content, section_key)
+        try:
+            content = await _run_agent_async(
+                writer_runner, section_key, prompt, stream
+            )
 
-        OUTPUT_DIR.mkdir(exist_ok=True)
-        out_path = OUTPUT_DIR / f"{section_key}.md"
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write(content)
+            from orchestrator import _postprocess_section
+            content = _postprocess_section(content, section_key)
+            await db_writer.run(
+                record_checkpoint, run_id, section_step(section_key),
+                section_fingerprint(current_data_version(), content, pack.hash),
+                {"content": content, "qa_pass": None, "guidelines": pack.hash},
+            )
 
-        if sec_row:
-            sec_row.status = "completed"
-            sec_row.content = content
-            sec_row.word_count = len(content.split()) if content else 0
-            sec_row.completed_at = datetime.utcnow()
-            db.commit()
+            OUTPUT_DIR.mkdir(exist_ok=True)
+            out_path = OUTPUT_DIR / f"{section_key}.md"
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        finally:
+            stream.close()
+
+        await db_writer.run(
+            _update_section, run_id, section_number,
+            status="completed",
+            content=content,
+            word_count=len(content.split()) if content else 0,
+            completed_at=datetime.utcnow(),
+        )
+        # The new content is saved; a failed republish does not undo it
+        previous = {}
 
         # Republish PDF
         from publisher import main as publish_pdf
@@ -397,16 +733,21 @@ async def run_single_section(run_id: str, section_number: int):
     except Exception as e:
         logger.error("Section rerun failed: %s", e, exc_info=True)
         if sec_row:
-            sec_row.status = "failed"
-            sec_row.completed_at = datetime.utcnow()
-            db.commit()
+            # Queued after the streamed text, so the previous content wins
+            await db_writer.run(
+                _update_section, run_id, section_number,
+                status="failed", completed_at=datetime.utcnow(), **previous,
+            )
     finally:
+        await asyncio.get_running_loop().run_in_executor(None, db_writer.close)
         db.close()
 
 
-async def _run_agent_async(runner, section_key: str, prompt: str) -> str:
-    """Run a Google ADK agent and collect the text output."""
-    from google.genai import types
+async def _run_agent_async(runner, section_key: str, prompt: str,
+                           on_text=None) -> str:
+    """Run a Google ADK agent and collect the text output, streaming it to
+    ``on_text`` as it arrives."""
+    from section_stream import collect_agent_text
 
     session_id = f"session_{section_key}_{uuid.uuid4().hex[:8]}"
     user_id = "csr_orchestrator"
@@ -417,23 +758,7 @@ async def _run_agent_async(runner, section_key: str, prompt: str) -> str:
         session_id=session_id,
     )
 
-    content = types.Content(
-        role="user",
-        parts=[types.Part(text=prompt)],
-    )
-
-    final_text = ""
-    async for event in runner.run_async(
-        user_id=user_id,
-        session_id=session_id,
-        new_message=content,
-    ):
-        if event.content and event.content.parts:
-            for part in event.content.parts:
-                if part.text:
-                    final_text += part.text
-
-    return final_text
+    return await collect_agent_text(runner, user_id, session_id, prompt, on_text)
 
 
 def _create_compliance_report(db: Session, run_id: str):
@@ -1,4 +1,4 @@
-"""Run routes: CRUD, file upload, download, retry, rerun."""
+"""Run routes: CRUD, file upload, download, retry, rerun, resume."""
 
 import asyncio
 import os
@@ -161,12 +161,12 @@ async def create_run(
     return _run_to_detail(run)
 
 
-def _run_pipeline_wrapper(run_id: str, user_id: int):
+def _run_pipeline_wrapper(run_id: str, user_id: int, resume: bool = False):
     """Wrapper to run the async pipeline from a sync background task."""
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
-        loop.run_until_complete(run_pipeline(run_id, user_id))
+        loop.run_until_complete(run_pipeline(run_id, user_id, resume=resume))
     finally:
         loop.close()
 
@@ -257,6 +257,37 @@ async def rerun_pipeline(
     return {"message": "Full pipeline rerun started"}
 
 
+@router.post("/{run_id}/resume")
+async def resume_pipeline(
+    run_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Continue an interrupted or failed run from its checkpoints."""
+    run = db.query(Run).filter(Run.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    # Check and flip the status in one statement so two resume requests
+    # cannot both start the pipeline
+    claimed = (
+        db.query(Run)
+        .filter(Run.id == run_id, Run.status.notin_(("pending", "running")))
+        .update(
+            {Run.status: "pending", Run.error_message: None},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    if not claimed:
+        raise HTTPException(
+            status_code=409, detail="Run is already queued or running"
+        )
+    background_tasks.add_task(_run_pipeline_wrapper, run.run_id, user.id, True)
+    return {"message": "Pipeline resume started"}
+
+
 @router.get("/{run_id}/logs", response_model=list[AgentLogOut])
 def get_logs(
     run_id: int,
@@ -1,14 +1,117 @@
-"""WebSocket connection manager for real-time updates."""
+"""WebSocket connection manager for real-time updates.
+
+Every connection gets a bounded outbox drained by its own sender task, so
+a slow client never holds up the pipeline or other clients. When an
+outbox is full, queued ``section_delta`` events are merged or dropped
+first; their ``offset`` lets a client notice a gap and reload the
+section, whose working content is persisted as it streams.
+
+The pipeline runs in its own event loop on a worker thread, so
+broadcasts are handed to each connection's loop thread-safely.
+"""
 
 import asyncio
 import json
 import logging
-from collections import defaultdict
+import os
+from collections import defaultdict, deque
 
 from fastapi import WebSocket
 
 logger = logging.getLogger(__name__)
 
+# Events queued per connection before older ones are merged or dropped
+WS_OUTBOX_SIZE = int(os.getenv("WS_OUTBOX_SIZE", "200"))
+# A client that takes longer than this to accept one message is dropped
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+DELTA_EVENT = "section_delta"
+
+
+def _is_delta(data: dict) -> bool:
+    return data.get("event_type") == DELTA_EVENT
+
+
+class _Outbox:
+    """Bounded send queue of one connection, owned by the server loop."""
+
+    def __init__(self, ws: WebSocket, on_dead):
+        self.ws = ws
+        self.loop = asyncio.get_running_loop()
+        self.queue: deque[dict] = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.on_dead = on_dead
+        self.task = asyncio.create_task(self._send_loop())
+
+    def put(self, data: dict):
+        """Queue ``data``; must run on the outbox's loop."""
+        if self.task.done():
+            return
+        if _is_delta(data) and self._merge_into_queue(data):
+            return
+        if len(self.queue) >= WS_OUTBOX_SIZE:
+            self._drop_one()
+        self.queue.append(data)
+        self.ready.set()
+
+    def _merge_into_queue(self, data: dict) -> bool:
+        """Append a delta to the queued, unsent delta of the same section
+        it continues. Returns False if there is none."""
+        new = data["payload"]
+        for index in range(len(self.queue) - 1, -1, -1):
+            queued = self.queue[index]
+            if not _is_delta(queued):
+                continue
+            old = queued["payload"]
+            if old.get("section_number") != new.get("section_number"):
+                continue
+            if old["offset"] + len(old["delta"]) != new["offset"]:
+                return False
+            # A new dict: the same event is queued for every connection
+            self.queue[index] = {
+                **data,
+                "payload": {**old, "delta": old["delta"] + new["delta"]},
+            }
+            return True
+        return False
+
+    def _drop_one(self):
+        for index, queued in enumerate(self.queue):
+            if _is_delta(queued):
+                del self.queue[index]
+                break
+        else:
+            self.queue.popleft()
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(
+                "Slow WebSocket client: %d event(s) dropped.", self.dropped
+            )
+
+    async def _send_loop(self):
+        try:
+            while True:
+                await self.ready.wait()
+                while self.queue:
+                    data = self.queue.popleft()
+                    await asyncio.wait_for(
+                        self.ws.send_text(json.dumps(data)), WS_SEND_TIMEOUT
+                    )
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("Dropping WebSocket connection: %r", e)
+            try:
+                await asyncio.wait_for(self.ws.close(), WS_SEND_TIMEOUT)
+            except Exception:
+                pass
+            self.on_dead()
+
+    def close(self):
+        self.task.cancel()
+
 
 class ConnectionManager:
     """Manages WebSocket connections grouped by channel (run_id or user_id)."""
@@ -16,55 +119,72 @@ class ConnectionManager:
     def __init__(self):
         self._run_connections: dict[str, list[WebSocket]] = defaultdict(list)
         self._user_connections: dict[int, list[WebSocket]] = defaultdict(list)
+        self._outboxes: dict[WebSocket, _Outbox] = {}
 
     async def connect_run(self, run_id: str, ws: WebSocket):
         await ws.accept()
+        self._outboxes[ws] = _Outbox(
+            ws, lambda: self.disconnect_run(run_id, ws)
+        )
         self._run_connections[run_id].append(ws)
 
     async def connect_user(self, user_id: int, ws: WebSocket):
         await ws.accept()
+        self._outboxes[ws] = _Outbox(
+            ws, lambda: self.disconnect_user(user_id, ws)
+        )
         self._user_connections[user_id].append(ws)
 
+    def _forget(self, ws: WebSocket):
+        outbox = self._outboxes.pop(ws, None)
+        if outbox is not None:
+            outbox.loop.call_soon_threadsafe(outbox.close)
+
     def disconnect_run(self, run_id: str, ws: WebSocket):
         conns = self._run_connections.get(run_id, [])
         if ws in conns:
             conns.remove(ws)
+        self._forget(ws)
 
     def disconnect_user(self, user_id: int, ws: WebSocket):
         conns = self._user_connections.get(user_id, [])
         if ws in conns:
             conns.remove(ws)
+        self._forget(ws)
 
-    async def broadcast_to_run(self, run_id: str, data: dict):
-        message = json.dumps(data)
-        dead = []
-        for ws in self._run_connections.get(run_id, []):
+    def _publish(self, connections: list[WebSocket], data: dict):
+        for ws in list(connections):
+            outbox = self._outboxes.get(ws)
+            if outbox is None:
+                continue
             try:
-                await ws.send_text(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect_run(run_id, ws)
+                outbox.loop.call_soon_threadsafe(outbox.put, data)
+            except RuntimeError:
+                # The server loop has shut down
+                pass
+
+    def publish_to_run(self, run_id: str, data: dict):
+        """Queue ``data`` for every connection of a run. Never blocks and
+        may be called from any thread."""
+        self._publish(self._run_connections.get(run_id, []), data)
+
+    def publish_to_user(self, user_id: int, data: dict):
+        self._publish(self._user_connections.get(user_id, []), data)
+
+    async def broadcast_to_run(self, run_id: str, data: dict):
+        self.publish_to_run(run_id, data)
 
     async def broadcast_to_user(self, user_id: int, data: dict):
-        message = json.dumps(data)
-        dead = []
-        for ws in self._user_connections.get(user_id, []):
-            try:
-                await ws.send_text(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            self.disconnect_user(user_id, ws)
+        self.publish_to_user(user_id, data)
 
     async def keepalive(self, ws: WebSocket):
         """Send periodic pings to keep the connection alive."""
-        try:
-            while True:
-                await asyncio.sleep(30)
-                await ws.send_text(json.dumps({"type": "ping"}))
-        except Exception:
-            pass
+        while True:
+            await asyncio.sleep(30)
+            outbox = self._outboxes.get(ws)
+            if outbox is None:
+                return
+            outbox.put({"type": "ping"})
 
 
 manager = ConnectionManager()
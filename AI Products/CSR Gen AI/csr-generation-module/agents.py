@@ -6,6 +6,10 @@ from google.adk.agents import Agent
 from google.genai import types
 
 from tools import reasoning_search, get_table, list_tables
+# tools puts the app root on sys.path
+from llm_gateway import PRIORITY_QA, PRIORITY_WRITER, get_gateway
+from guideline_pack import load_pack
+from instruction_cache import CACHE_ENABLED, InstructionCache
 
 logger = logging.getLogger(__name__)
 
@@ -31,10 +35,10 @@ SECTION_MAP = {
 }
 
 
-def _load_guidelines():
+def get_guideline_pack():
+    """Return the compiled instructions for the current guidelines."""
     try:
-        with open(GUIDELINES_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return load_pack(GUIDELINES_PATH, _compile_instructions, __file__)
     except (IOError, json.JSONDecodeError):
         logger.error(
             "Failed to load guidelines from %s.", GUIDELINES_PATH,
@@ -327,32 +331,49 @@ def _build_section_12_instruction(guidelines):
     return base + extra
 
 
-def create_csr_agents():
-    guidelines = _load_guidelines()
-    agents = {}
-
-    for section_key, section_name in SECTION_MAP.items():
-        if section_key == "Section_1":
-            instruction = _build_section_1_instruction(guidelines)
-        elif section_key == "Section_8":
-            instruction = _build_section_8_instruction(guidelines)
-        elif section_key == "Section_11":
-            instruction = _build_section_11_instruction(guidelines)
-        elif section_key == "Section_12":
-            instruction = _build_section_12_instruction(guidelines)
+def _compile_instructions(guidelines):
+    """Render the writer instruction of every section."""
+    builders = {
+        "Section_1": _build_section_1_instruction,
+        "Section_8": _build_section_8_instruction,
+        "Section_11": _build_section_11_instruction,
+        "Section_12": _build_section_12_instruction,
+    }
+    instructions = {}
+    for section_key in SECTION_MAP:
+        builder = builders.get(section_key)
+        if builder is not None:
+            instructions[section_key] = builder(guidelines)
         else:
-            instruction = _build_section_instruction(
+            instructions[section_key] = _build_section_instruction(
                 guidelines, section_key
             )
+    return instructions
+
 
+def create_csr_agents():
+    pack = get_guideline_pack()
+    agents = {}
+    # Agent model calls share the gateway's per-model quotas with the tools
+    gateway = get_gateway()
+    before_writer, after_writer = gateway.adk_callbacks(PRIORITY_WRITER)
+    before_qa, after_qa = gateway.adk_callbacks(PRIORITY_QA)
+    # Writer instructions and tools are sent once per guidelines version
+    # and referenced from the provider-side cache on every turn
+    if CACHE_ENABLED:
+        before_writer = [before_writer, InstructionCache(pack.hash[:12])]
+
+    for section_key, section_name in SECTION_MAP.items():
         agent = Agent(
             name=f"{section_key}_Writer",
             model=AGENT_MODEL,
-            instruction=instruction,
+            instruction=pack.instructions[section_key],
             tools=[reasoning_search, get_table, list_tables],
             generate_content_config=types.GenerateContentConfig(
                 temperature=0.2,
             ),
+            before_model_callback=before_writer,
+            after_model_callback=after_writer,
         )
         agents[section_key] = agent
         logger.info("Created agent for %s: %s.", section_key, section_name)
@@ -362,35 +383,28 @@ def create_csr_agents():
         model=AGENT_MODEL,
         instruction=(
             "You are a compliance review agent. Your only task is to "
-            "review a given Markdown text. Check for the following "
-            "violations:\n"
-            "1. Presence of any local file paths or source document "
-            "names (e.g., 'TLF2.pdf', '/home/', 'ocr-output/').\n"
-            "2. Incomplete tables or content.\n"
-            "3. Stray characters like '*' after tables.\n"
-            "4. Any content that seems like a placeholder (e.g., "
-            "'[INSERT HERE]', 'TODO', 'TBD', '[XX.X]', '[Number]', "
-            "'[YY.Y]').\n"
-            "5. Missing table numbers or titles.\n"
-            "6. Internal reasoning or meta-commentary text (e.g., "
-            "'The reasoning_search returned...', 'I will now...', "
-            "'Let me try...', 'Based on the tool output...'). The "
-            "section must read as a polished regulatory document.\n"
-            "7. Non-standard section numbering (e.g., '4.1 1.1' "
-            "instead of just '1.1').\n"
-            "8. Wrong heading levels: the main section heading must "
-            "use single '#' (e.g., '# 9. Investigational Plan'), "
-            "not '##' or '###'. Subsections use '##', sub-subsections "
-            "use '###'.\n"
-            "9. Asterisk bullet lists: lines starting with '* ' must "
-            "use '- ' instead, as asterisks cause PDF rendering issues.\n"
-            "10. Bold-wrapped headings: '# **9. Title**' is wrong, "
-            "should be '# 9. Title' (no bold markers in headings).\n"
+            "review a given Markdown text. File paths, placeholders, "
+            "tool names, bullet style, heading levels and numbering "
+            "have already been checked mechanically. Check for the "
+            "following violations:\n"
+            "1. Incomplete tables or content (e.g., truncated "
+            "sentences, tables that stop mid-way, sections that promise "
+            "content they do not deliver).\n"
+            "2. Missing table numbers or titles.\n"
+            "3. Internal reasoning or meta-commentary text (e.g., "
+            "descriptions of what was searched for or found, planning "
+            "notes). The section must read as a polished regulatory "
+            "document.\n"
+            "4. Content that seems like a placeholder even if not in "
+            "a standard form (e.g., 'data to be added', 'see above' "
+            "with nothing above).\n"
             "If any violation is found, respond with a JSON object: "
             "{'pass': false, 'reason': 'Describe the violation and "
             "line number.'}. If it passes, respond with {'pass': true}."
         ),
         tools=[],
+        before_model_callback=before_qa,
+        after_model_callback=after_qa,
     )
     agents["QA"] = qa_agent
     logger.info("Created Internal QA Agent.")
@@ -0,0 +1,172 @@
+"""Token-budgeted packing of hop-2 pages into writer context.
+
+Pages retrieved for the hop-1 nodes are deduplicated (overlapping nodes
+often cover the same pages), split into paragraph chunks, scored against
+the question with BM25 plus a small bonus for higher-ranked nodes, and
+packed greedily until the token budget is spent. Selected chunks are
+emitted in document order under their original ``[<source> Page N]``
+labels so writers can still cite pages.
+"""
+
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+# Rough English/markdown ratio; good enough for budgeting
+CHARS_PER_TOKEN = 4
+CHUNK_CHARS = 1600
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Score bonus for pages of the top hop-1 node, decaying with rank
+NODE_RANK_BONUS = 0.5
+PART_SEPARATOR = "\n\n---\n\n"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    "a", "an", "the", "of", "in", "for", "and", "or", "to", "by", "at",
+    "from", "with", "on", "is", "are", "was", "were", "be", "that", "this",
+    "as", "it", "which", "what", "how", "any", "all", "not", "per", "each",
+}
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _terms(text):
+    return [
+        t for t in TOKEN_PATTERN.findall(text.lower())
+        if t not in STOP_WORDS
+    ]
+
+
+def _split_chunks(text):
+    """Split page text into chunks of about ``CHUNK_CHARS`` on paragraph
+    boundaries. A single oversized paragraph stays one chunk."""
+    chunks = []
+    current = []
+    size = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and size + len(paragraph) > CHUNK_CHARS:
+            chunks.append("\n\n".join(current))
+            current = []
+            size = 0
+        current.append(paragraph)
+        size += len(paragraph)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _bm25_scores(question, chunk_terms):
+    query = set(_terms(question))
+    if not query or not chunk_terms:
+        return [0.0] * len(chunk_terms)
+    n_chunks = len(chunk_terms)
+    avg_length = sum(len(t) for t in chunk_terms) / n_chunks or 1
+    df = {}
+    for terms in chunk_terms:
+        for term in query.intersection(terms):
+            df[term] = df.get(term, 0) + 1
+    scores = []
+    for terms in chunk_terms:
+        counts = {}
+        for term in terms:
+            if term in query:
+                counts[term] = counts.get(term, 0) + 1
+        norm = 1 - BM25_B + BM25_B * len(terms) / avg_length
+        score = 0.0
+        for term, tf in counts.items():
+            idf = math.log(1 + (n_chunks - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        scores.append(score)
+    return scores
+
+
+def pack_context(question, pages, token_budget):
+    """Pack retrieved pages into at most ``token_budget`` tokens.
+
+    Args:
+        question: The search question, used to score chunks.
+        pages: ``[(source, page_number, text, node_rank), ...]`` in hop-1
+            order; ``node_rank`` is 0 for the best node.
+        token_budget: Maximum estimated tokens of the packed text.
+
+    Returns:
+        ``(packed_text, stats)`` where stats has ``pages_in``,
+        ``unique_pages``, ``chunks_in``, ``chunks_selected``,
+        ``tokens_in`` and ``packed_tokens``.
+    """
+    unique = {}
+    for source, page_num, text, node_rank in pages:
+        key = (source, page_num)
+        if key not in unique or node_rank < unique[key][1]:
+            unique[key] = (text, node_rank)
+
+    # (doc order, source, page, chunk index, text, node rank)
+    doc_order = {}
+    chunks = []
+    for (source, page_num), (text, node_rank) in unique.items():
+        doc_order.setdefault(source, len(doc_order))
+        for i, chunk in enumerate(_split_chunks(text)):
+            chunks.append(
+                (doc_order[source], source, page_num, i, chunk, node_rank)
+            )
+
+    scores = _bm25_scores(question, [_terms(c[4]) for c in chunks])
+    max_score = max(scores, default=0.0) or 1.0
+    ranked = sorted(
+        range(len(chunks)),
+        key=lambda i: (
+            -(scores[i] / max_score + NODE_RANK_BONUS / (1 + chunks[i][5])),
+            chunks[i][0], chunks[i][2], chunks[i][3],
+        ),
+    )
+
+    selected = []
+    used = 0
+    for i in ranked:
+        # Labels and separators cost tokens too
+        cost = estimate_tokens(chunks[i][4]) + 12
+        if used + cost > token_budget:
+            continue
+        selected.append(i)
+        used += cost
+    if not selected and ranked:
+        # Even the best chunk is over budget: keep a truncated head of it
+        best = ranked[0]
+        doc, source, page_num, idx, text, rank = chunks[best]
+        text = text[:max(0, token_budget - 12) * CHARS_PER_TOKEN]
+        chunks[best] = (doc, source, page_num, idx, text, rank)
+        selected.append(best)
+
+    by_page = {}
+    for i in sorted(selected, key=lambda i: chunks[i][:4]):
+        doc, source, page_num, idx, text, _ = chunks[i]
+        by_page.setdefault((doc, source, page_num), []).append((idx, text))
+
+    parts = []
+    for (_, source, page_num), page_chunks in by_page.items():
+        body = []
+        previous = None
+        for idx, text in page_chunks:
+            if previous is not None and idx != previous + 1:
+                body.append("[...]")
+            body.append(text)
+            previous = idx
+        parts.append(f"[{source} Page {page_num}]\n" + "\n\n".join(body))
+
+    packed = PART_SEPARATOR.join(parts)
+    stats = {
+        "pages_in": len(pages),
+        "unique_pages": len(unique),
+        "chunks_in": len(chunks),
+        "chunks_selected": len(selected),
+        "tokens_in": sum(estimate_tokens(c[4]) for c in chunks),
+        "packed_tokens": estimate_tokens(packed),
+    }
+    return packed, stats
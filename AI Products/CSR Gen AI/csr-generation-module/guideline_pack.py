@@ -0,0 +1,141 @@
+"""Compiled guideline pack: the rendered writer instructions.
+
+Building the agents used to parse the whole ``guidlines.json`` and
+render every section instruction on each call of the agent factory,
+i.e. on every run and every single-section retry. :func:`load_pack`
+renders them once per version of the guidelines (and of the code that
+renders them) into ``cache/guideline_pack.json``, and memoizes the pack
+in-process, so building the agents afterwards is a lookup.
+
+The pack's ``hash`` covers the rendered instructions themselves. It is
+recorded with each run, so a section can be traced back to exactly the
+instructions it was written with.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PACK_PATH = Path(__file__).resolve().parent / "cache" / "guideline_pack.json"
+
+
+@dataclass(frozen=True)
+class GuidelinePack:
+    hash: str
+    source_sha256: str
+    builder_sha256: str
+    # section key -> writer instruction
+    instructions: dict
+
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def _sha256_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _stat_key(*paths):
+    key = []
+    for path in paths:
+        stat = os.stat(path)
+        key.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(key)
+
+
+def _pack_hash(instructions):
+    encoded = json.dumps(instructions, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _read_pack(pack_path):
+    try:
+        with open(pack_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return GuidelinePack(
+            hash=data["hash"],
+            source_sha256=data["source_sha256"],
+            builder_sha256=data["builder_sha256"],
+            instructions=data["instructions"],
+        )
+    except (IOError, json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def _write_pack(pack, pack_path):
+    pack_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = pack_path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "hash": pack.hash,
+                "source_sha256": pack.source_sha256,
+                "builder_sha256": pack.builder_sha256,
+                "compiled_at": datetime.utcnow().isoformat(),
+                "instructions": pack.instructions,
+            },
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )
+    os.replace(tmp_path, pack_path)
+
+
+def load_pack(source_path, compile_instructions, builder_path,
+              pack_path=PACK_PATH):
+    """Return the :class:`GuidelinePack` for the current guidelines.
+
+    Args:
+        source_path: ``guidlines.json``.
+        compile_instructions: ``compile_instructions(guidelines)`` returning
+            ``{section_key: instruction}``; called only when the pack is
+            missing or stale.
+        builder_path: Source file of ``compile_instructions``; editing it
+            invalidates the pack like editing the guidelines does.
+        pack_path: Where the compiled pack is stored.
+    """
+    source_path, builder_path = Path(source_path), Path(builder_path)
+    pack_path = Path(pack_path)
+    stat_key = _stat_key(source_path, builder_path)
+    with _memo_lock:
+        cached = _memo.get(pack_path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+
+        source_sha = _sha256_file(source_path)
+        builder_sha = _sha256_file(builder_path)
+        pack = _read_pack(pack_path)
+        if (
+            pack is None
+            or pack.source_sha256 != source_sha
+            or pack.builder_sha256 != builder_sha
+        ):
+            with open(source_path, "r", encoding="utf-8") as f:
+                guidelines = json.load(f)
+            instructions = compile_instructions(guidelines)
+            pack = GuidelinePack(
+                hash=_pack_hash(instructions),
+                source_sha256=source_sha,
+                builder_sha256=builder_sha,
+                instructions=instructions,
+            )
+            try:
+                _write_pack(pack, pack_path)
+            except OSError as e:
+                logger.warning("Cannot save guideline pack: %s", e)
+            logger.info(
+                "Compiled guideline pack %s (%d instructions).",
+                pack.hash[:12], len(instructions),
+            )
+        _memo[pack_path] = (stat_key, pack)
+        return pack
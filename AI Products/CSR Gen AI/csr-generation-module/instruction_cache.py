@@ -0,0 +1,187 @@
+"""Provider-side context caching of the CSR writer instructions.
+
+Every turn of a writer's tool-calling loop re-sends its system
+instruction (guideline constraints, required content, formatting rules)
+and tool declarations. :class:`InstructionCache` stores them once as a
+Gemini cached content and has each request reference it by name, so
+they are neither re-uploaded nor re-processed at full price.
+
+A cache is keyed by the guideline pack version (which changes with
+``guidlines.json``) and by the exact instruction and tools it holds, and
+is reused across runs until it expires. Caches of an older pack version
+that this process created are deleted the first time the new version is
+used; those of other processes (another backend or study may still be
+using that version) are left to expire with their TTL. Instructions
+below the provider's minimum cacheable size are sent as before.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from google.genai import types
+
+from llm_gateway import PRIORITY_WRITER, estimate_tokens, get_gateway
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("CSR_INSTRUCTION_CACHE", "1") != "0"
+CACHE_TTL_SECONDS = int(os.getenv("CSR_INSTRUCTION_CACHE_TTL", "3600"))
+# Gemini 2.5 models do not cache prompts below 2048 tokens
+CACHE_MIN_TOKENS = int(os.getenv("CSR_INSTRUCTION_CACHE_MIN_TOKENS", "2048"))
+# A cache expiring sooner than this is extended before it is referenced
+CACHE_REFRESH_SECONDS = 300
+DISPLAY_PREFIX = "csr-writer"
+
+# Cache name -> guideline pack version, for caches this process created
+_created = {}
+
+
+def _tools_json(tools):
+    return json.dumps(
+        [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+        sort_keys=True,
+    )
+
+
+class InstructionCache:
+    """Before-model callback that moves a writer's system instruction and
+    tools into a cached content referenced by name."""
+
+    def __init__(self, version, ttl=CACHE_TTL_SECONDS,
+                 min_tokens=CACHE_MIN_TOKENS):
+        # Guideline pack version, part of every cache's display name
+        self.version = version
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.gateway = get_gateway()
+        # display name -> (cache name, expire time); None if not cacheable
+        self._entries = {}
+        self._locks = {}
+        self._synced = None
+
+    async def __call__(self, callback_context, llm_request):
+        config = llm_request.config
+        if (
+            config is None
+            or config.cached_content
+            or config.tool_config is not None
+            or not isinstance(config.system_instruction, str)
+        ):
+            return None
+        tools = config.tools or []
+        try:
+            name = await self.cache_name(
+                llm_request.model, config.system_instruction, tools
+            )
+        except Exception as e:
+            logger.warning("Instruction cache unavailable: %s", e)
+            return None
+        if name:
+            # The request may not repeat what the cache holds
+            config.cached_content = name
+            config.system_instruction = None
+            config.tools = None
+        return None
+
+    async def cache_name(self, model, instruction, tools):
+        """Return the cached content holding ``instruction`` and ``tools``,
+        creating or extending it as needed, or None if it is too small to
+        cache."""
+        tools_json = _tools_json(tools)
+        digest = hashlib.sha256(
+            f"{model}\n{instruction}\n{tools_json}".encode("utf-8")
+        ).hexdigest()[:16]
+        display_name = f"{DISPLAY_PREFIX}-{self.version}-{digest}"
+        if display_name in self._entries and self._entries[display_name] is None:
+            return None
+        if estimate_tokens(instruction, tools_json) < self.min_tokens:
+            self._entries[display_name] = None
+            return None
+
+        lock = self._locks.setdefault(display_name, asyncio.Lock())
+        async with lock:
+            await self._sync()
+            entry = self._entries.get(display_name)
+            if entry is None and display_name in self._entries:
+                return None
+            now = datetime.now(timezone.utc)
+            if entry is not None:
+                name, expires = entry
+                if expires is not None and (
+                    expires - now > timedelta(seconds=CACHE_REFRESH_SECONDS)
+                ):
+                    return name
+                try:
+                    cache = await self._client().aio.caches.update(
+                        name=name,
+                        config=types.UpdateCachedContentConfig(
+                            ttl=f"{self.ttl}s"
+                        ),
+                    )
+                    self._entries[display_name] = (name, cache.expire_time)
+                    return name
+                except Exception as e:
+                    logger.info("Cannot extend %s (%s); recreating.", name, e)
+
+            try:
+                cache = await self.gateway.call_async(
+                    model,
+                    self._client().aio.caches.create,
+                    priority=PRIORITY_WRITER,
+                    tokens=estimate_tokens(instruction, tools_json),
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=display_name,
+                        system_instruction=instruction,
+                        tools=tools or None,
+                        ttl=f"{self.ttl}s",
+                    ),
+                )
+            except Exception as e:
+                # Usually a prompt under the model's minimum cache size
+                logger.warning(
+                    "Not caching instruction %s: %s", display_name, e
+                )
+                self._entries[display_name] = None
+                return None
+            self._entries[display_name] = (cache.name, cache.expire_time)
+            _created[cache.name] = self.version
+            logger.info(
+                "Cached writer instruction %s as %s.", display_name, cache.name
+            )
+            return cache.name
+
+    def _client(self):
+        return self.gateway.gemini_client()
+
+    async def _sync(self):
+        """Pick up live caches of this pack version and delete the ones of
+        older versions this process created. Runs once per instance."""
+        if self._synced is None:
+            self._synced = asyncio.ensure_future(self._list_and_prune())
+        await asyncio.shield(self._synced)
+
+    async def _list_and_prune(self):
+        client = self._client()
+        current = f"{DISPLAY_PREFIX}-{self.version}-"
+        try:
+            pager = await client.aio.caches.list()
+            async for cache in pager:
+                display_name = cache.display_name or ""
+                if display_name.startswith(current):
+                    self._entries.setdefault(
+                        display_name, (cache.name, cache.expire_time)
+                    )
+                elif _created.get(cache.name, self.version) != self.version:
+                    await client.aio.caches.delete(name=cache.name)
+                    _created.pop(cache.name, None)
+                    logger.info(
+                        "Deleted instruction cache %s of an older guideline pack.",
+                        display_name,
+                    )
+        except Exception as e:
+            logger.warning("Cannot list instruction caches: %s", e)
@@ -0,0 +1,189 @@
+"""Incremental LaTeX build of the CSR PDF.
+
+Converting the whole assembled Markdown with pandoc and letting it run
+xelatex from scratch costs minutes for every publish, even after a
+one-line edit. Instead:
+
+- the assembled Markdown is split at its main (``#``) headings into
+  fragments, and each fragment is converted to LaTeX on its own; the
+  result is cached under ``output/.build/fragments`` by a hash of the
+  fragment, so only changed fragments go through pandoc;
+- the fragments are joined into the template's ``$body$`` and xelatex is
+  run directly in ``output/.build``, keeping its ``.aux`` and ``.toc``
+  files between builds. Because page references and the table of
+  contents from the last build are still there, an unchanged layout
+  needs one xelatex pass. Another pass runs only while those files
+  still change.
+
+A draft build stops after the first pass. Its table of contents and page
+references can be one build out of date.
+
+Fragments are converted independently. Markdown that refers across a
+main heading (reference links, footnote definitions) must therefore
+stay within its section; CSR sections are written that way.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pypandoc
+
+logger = logging.getLogger(__name__)
+
+PANDOC_ARGS = ["--wrap=preserve"]
+# Full builds stop once .aux/.toc settle, or after this many passes
+MAX_XELATEX_PASSES = 3
+XELATEX_TIMEOUT = int(os.getenv("CSR_XELATEX_TIMEOUT", "600"))
+PANDOC_CONCURRENCY = int(os.getenv("CSR_PANDOC_CONCURRENCY", "4"))
+JOB_NAME = "CSR"
+
+MAIN_HEADING = re.compile(r"^#\s")
+
+
+def split_fragments(markdown_text):
+    """Split at main headings outside code blocks. The fragments joined
+    with newlines give back the input."""
+    fragments = []
+    current = []
+    in_code = False
+    for line in markdown_text.split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if not in_code and MAIN_HEADING.match(line) and current:
+            fragments.append("\n".join(current))
+            current = []
+        current.append(line)
+    fragments.append("\n".join(current))
+    return fragments
+
+
+def _fragment_key(fragment):
+    digest = hashlib.sha256()
+    digest.update(str(pypandoc.get_pandoc_version()).encode("utf-8"))
+    digest.update("\0".join(PANDOC_ARGS).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(fragment.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _convert(fragment):
+    return pypandoc.convert_text(
+        fragment, "latex", format="markdown", extra_args=PANDOC_ARGS
+    )
+
+
+def render_fragments(fragments, cache_dir):
+    """Return the LaTeX of each fragment, converting only those not in
+    ``cache_dir``. Cache entries no longer used are removed."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    keys = [_fragment_key(f) for f in fragments]
+    latex = {}
+    missing = {}
+    for key, fragment in zip(keys, fragments):
+        path = cache_dir / f"{key}.tex"
+        if key in latex or key in missing:
+            continue
+        try:
+            latex[key] = path.read_text(encoding="utf-8")
+        except OSError:
+            missing[key] = fragment
+
+    if missing:
+        workers = max(1, min(PANDOC_CONCURRENCY, len(missing)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            converted = dict(zip(missing, pool.map(_convert, missing.values())))
+        for key, text in converted.items():
+            path = cache_dir / f"{key}.tex"
+            tmp_path = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+            tmp_path.write_text(text, encoding="utf-8")
+            os.replace(tmp_path, path)
+            latex[key] = text
+    logger.info(
+        "Rendered %d of %d fragment(s) with pandoc; %d cached.",
+        len(missing), len(fragments), len(fragments) - len(missing),
+    )
+
+    used = set(keys)
+    for path in cache_dir.glob("*.tex"):
+        if path.stem not in used:
+            path.unlink(missing_ok=True)
+    return [latex[key] for key in keys]
+
+
+def _fill_template(template_path, body):
+    template = Path(template_path).read_text(encoding="utf-8")
+    if "$body$" not in template:
+        raise ValueError(f"Template {template_path} has no $body$.")
+    return template.replace("$body$", body, 1)
+
+
+def _aux_state(build_dir):
+    """Hash of the files xelatex reads back on the next pass."""
+    digest = hashlib.sha256()
+    for suffix in (".aux", ".toc"):
+        path = build_dir / f"{JOB_NAME}{suffix}"
+        if path.exists():
+            digest.update(path.read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def run_xelatex(build_dir, draft=False):
+    """Run xelatex on ``<build_dir>/CSR.tex``; return the PDF path."""
+    env = dict(os.environ)
+    # Resources are resolved against the caller's directory, as with
+    # pandoc's --resource-path=.; the trailing separator keeps defaults
+    env["TEXINPUTS"] = f"{Path.cwd()}{os.pathsep}{env.get('TEXINPUTS', '')}"
+    passes = 1 if draft else MAX_XELATEX_PASSES
+    for number in range(1, passes + 1):
+        before = _aux_state(build_dir)
+        result = subprocess.run(
+            [
+                "xelatex", "-interaction=nonstopmode", "-halt-on-error",
+                f"{JOB_NAME}.tex",
+            ],
+            cwd=build_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+            errors="replace",
+            timeout=XELATEX_TIMEOUT,
+        )
+        if result.returncode != 0:
+            # A failed pass can leave a truncated .aux/.toc that would
+            # break the next build too; the next one starts clean instead
+            for suffix in (".aux", ".toc"):
+                (build_dir / f"{JOB_NAME}{suffix}").unlink(missing_ok=True)
+            raise RuntimeError(
+                f"xelatex failed (pass {number}):\n{result.stdout[-3000:]}"
+            )
+        if _aux_state(build_dir) == before:
+            break
+        logger.info("xelatex pass %d changed references.", number)
+    logger.info("xelatex finished after %d pass(es).", number)
+    return build_dir / f"{JOB_NAME}.pdf"
+
+
+def build_pdf(markdown_text, template_path, output_path, build_dir,
+              draft=False):
+    """Build ``output_path`` from the assembled CSR Markdown."""
+    if shutil.which("xelatex") is None:
+        raise RuntimeError("xelatex is not installed.")
+    build_dir.mkdir(parents=True, exist_ok=True)
+    fragments = split_fragments(markdown_text)
+    body = "\n".join(render_fragments(fragments, build_dir / "fragments"))
+    tex_path = build_dir / f"{JOB_NAME}.tex"
+    tex_path.write_text(_fill_template(template_path, body), encoding="utf-8")
+
+    pdf_path = run_xelatex(build_dir, draft=draft)
+    tmp_path = output_path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    shutil.copyfile(pdf_path, tmp_path)
+    os.replace(tmp_path, output_path)
+    return output_path
@@ -6,13 +6,21 @@ import sys
 from pathlib import Path
 
 from google.adk.runners import InMemoryRunner
-from google.genai import types
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Study-docs-module"))
 from ingestion_engine import StudyIngestionEngine
 
 from agents import create_csr_agents, SECTION_MAP
+from tools import search_cache_stats
+from llm_gateway import get_gateway
 from publisher import main as publish_pdf
+from section_linter import format_violations, lint_section
+from section_repair import (
+    locate_violations, repair_prompt, should_repair, splice,
+    split_subsections,
+)
+from section_scheduler import run_section_dag, upstream_context
+from section_stream import SectionStream, collect_agent_text, working_path
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +64,9 @@ def _postprocess_section(content, section_key):
 
     # Fix main heading level: if the first heading uses ## instead of #,
     # adjust all heading levels down by one
+    # ('## 9.1' is a subsection, not a misplaced main heading)
     main_heading_pattern = re.compile(
-        rf"^##\s+{re.escape(section_num)}\.", re.MULTILINE
+        rf"^##\s+{re.escape(section_num)}\.(?!\d)", re.MULTILINE
     )
     if main_heading_pattern.search(content):
         logger.info(
@@ -102,86 +111,152 @@ def _postprocess_section(content, section_key):
     return content
 
 
-async def _run_agent(runner, section_key, prompt):
+async def _run_agent(runner, section_key, prompt, on_text=None):
+    """Send ``prompt`` to the agent in the section's session, so follow-up
+    prompts (regeneration) continue the same conversation. ``on_text``
+    receives the output as it streams in."""
     session_id = f"session_{section_key}"
     user_id = "csr_orchestrator"
 
-    await runner.session_service.create_session(
+    session = await runner.session_service.get_session(
         app_name=runner.app_name,
         user_id=user_id,
         session_id=session_id,
     )
+    if session is None:
+        await runner.session_service.create_session(
+            app_name=runner.app_name,
+            user_id=user_id,
+            session_id=session_id,
+        )
 
-    content = types.Content(
-        role="user",
-        parts=[types.Part(text=prompt)],
+    return await collect_agent_text(
+        runner, user_id, session_id, prompt, on_text
     )
 
-    final_text = ""
-    async for event in runner.run_async(
-        user_id=user_id,
-        session_id=session_id,
-        new_message=content,
-    ):
-        if event.content and event.content.parts:
-            for part in event.content.parts:
-                if part.text:
-                    final_text += part.text
 
-    return final_text
+def _qa_verdict(qa_result):
+    """Return True if the QA agent passed the section, the violation
+    reason if it failed it, or None if its answer was not JSON."""
+    try:
+        qa_json = json.loads(qa_result)
+    except json.JSONDecodeError:
+        if "pass" in qa_result.lower() and "true" in qa_result.lower():
+            return True
+        return None
+    if qa_json.get("pass", False):
+        return True
+    return qa_json.get("reason", "Unknown violation")
+
+
+async def _fix_section(writer_runner, section_key, content, violations,
+                       reason, attempt, stream=None):
+    """Repair the subsections the violations point at, or regenerate the
+    whole section when they cannot be located or cover most of it. A
+    regeneration streams into ``stream``."""
+    section_title = SECTION_MAP.get(section_key, section_key)
+    subsections = split_subsections(content)
+    # Lint violations carry line numbers; a QA reason is parsed for them
+    flagged = locate_violations(
+        subsections, violations, None if violations else reason
+    )
+    if should_repair(subsections, flagged):
+        logger.info(
+            "Repairing %d of %d subsection(s) of %s.",
+            len(flagged), len(subsections), section_key,
+        )
+        indexes = sorted(flagged)
+        results = await asyncio.gather(
+            *(
+                _run_agent(
+                    writer_runner,
+                    f"{section_key}_repair_{attempt}_{index}",
+                    repair_prompt(
+                        section_title, subsections, index, flagged[index]
+                    ),
+                )
+                for index in indexes
+            ),
+            return_exceptions=True,
+        )
+        replacements = {}
+        for index, result in zip(indexes, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Repair of %s subsection %r failed: %s",
+                    section_key, subsections[index].heading, result,
+                )
+            else:
+                replacements[index] = result
+        return splice(subsections, replacements)
+
+    logger.info("Regenerating %s.", section_key)
+    regen_prompt = (
+        f"Please regenerate the section {section_title}, "
+        f"addressing the following issue: {reason}\n\n"
+        "Use reasoning_search and get_table tools as needed. "
+        "Follow all guidelines strictly."
+    )
+    if stream is not None:
+        stream.restart()
+    return await _run_agent(writer_runner, section_key, regen_prompt, stream)
 
 
-async def _generate_section(writer_runner, qa_runner, section_key):
+async def _generate_section(writer_runner, qa_runner, section_key,
+                            upstream=None, stream=None):
     section_title = SECTION_MAP.get(section_key, section_key)
     prompt = (
         f"Generate the complete content for CSR {section_title} "
         f"({section_key}). Use the reasoning_search tool to find "
         "relevant study data and the get_table tool to retrieve "
         "any required tables. Follow all guidelines strictly."
-    )
+    ) + upstream_context(upstream)
 
     logger.info("Generating %s: %s.", section_key, section_title)
-    content = await _run_agent(writer_runner, section_key, prompt)
+    content = await _run_agent(writer_runner, section_key, prompt, stream)
 
     for attempt in range(MAX_QA_RETRIES):
-        logger.info(
-            "QA review for %s (attempt %d).", section_key, attempt + 1
-        )
-        qa_prompt = (
-            f"Review the following CSR section for compliance "
-            f"violations:\n\n{content}"
-        )
-        qa_result = await _run_agent(
-            qa_runner, f"QA_{section_key}", qa_prompt
-        )
-
-        try:
-            qa_json = json.loads(qa_result)
-        except json.JSONDecodeError:
-            if "pass" in qa_result.lower() and "true" in qa_result.lower():
-                logger.info("%s passed QA review.", section_key)
-                break
+        # Mechanical checks run locally; the QA agent only reviews
+        # sections that pass them
+        content = _postprocess_section(content, section_key)
+        violations = lint_section(content, section_key)
+        if violations:
+            reason = (
+                f"{len(violations)} formatting/compliance violation(s):\n"
+                + format_violations(violations)
+            )
             logger.warning(
-                "QA returned non-JSON for %s. Treating as pass.",
-                section_key,
+                "Lint failed for %s (%d violation(s)).",
+                section_key, len(violations),
             )
-            break
-
-        if qa_json.get("pass", False):
-            logger.info("%s passed QA review.", section_key)
-            break
+        else:
+            logger.info(
+                "QA review for %s (attempt %d).", section_key, attempt + 1
+            )
+            qa_prompt = (
+                f"Review the following CSR section for compliance "
+                f"violations:\n\n{content}"
+            )
+            qa_result = await _run_agent(
+                qa_runner, f"QA_{section_key}_{attempt}", qa_prompt
+            )
+            passed = _qa_verdict(qa_result)
+            if passed is None:
+                logger.warning(
+                    "QA returned non-JSON for %s. Treating as pass.",
+                    section_key,
+                )
+                break
+            if passed is True:
+                logger.info("%s passed QA review.", section_key)
+                break
+            reason = passed
+            logger.warning("QA failed for %s: %s.", section_key, reason)
 
-        reason = qa_json.get("reason", "Unknown violation")
-        logger.warning(
-            "QA failed for %s: %s. Regenerating.", section_key, reason
-        )
-        regen_prompt = (
-            f"Please regenerate the section {section_title}, "
-            f"addressing the following issue: {reason}\n\n"
-            "Use reasoning_search and get_table tools as needed. "
-            "Follow all guidelines strictly."
+        content = await _fix_section(
+            writer_runner, section_key, content, violations, reason, attempt,
+            stream,
         )
-        content = await _run_agent(writer_runner, section_key, regen_prompt)
     else:
         logger.warning(
             "%s did not pass QA after %d retries. Using last version.",
@@ -218,30 +293,36 @@ async def run_csr_workflow():
 
     logger.info("Step 3: Generating %d sections.", len(sections_to_generate))
 
-    tasks = []
-    for section_key in sections_to_generate:
-        writer_agent = agents[section_key]
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    async def _generate(section_key, upstream):
         writer_runner = InMemoryRunner(
-            agent=writer_agent,
+            agent=agents[section_key],
             app_name=f"csr_{section_key}",
         )
-        tasks.append(
-            _generate_section(writer_runner, qa_runner, section_key)
-        )
+        # Writer output streams into a working file while it generates
+        stream = SectionStream(working_path(OUTPUT_DIR, section_key))
+        try:
+            _, content = await _generate_section(
+                writer_runner, qa_runner, section_key, upstream, stream
+            )
+            # Saved as soon as it is done; dependents get the final text
+            content = _postprocess_section(content, section_key)
+            output_path = OUTPUT_DIR / f"{section_key}.md"
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        finally:
+            stream.close()
+        logger.info("Saved %s to %s.", section_key, output_path)
+        return content
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    results = await run_section_dag(sections_to_generate, _generate)
+    logger.info("Search cache: %s", search_cache_stats())
+    logger.info("LLM gateway: %s", get_gateway().metrics())
 
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    for result in results:
+    for section_key, result in results.items():
         if isinstance(result, Exception):
-            logger.error("Section generation failed: %s", result)
-            continue
-        section_key, content = result
-        content = _postprocess_section(content, section_key)
-        output_path = OUTPUT_DIR / f"{section_key}.md"
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(content)
-        logger.info("Saved %s to %s.", section_key, output_path)
+            logger.error("%s generation failed: %s", section_key, result)
 
     logger.info("Step 4: Publishing final PDF.")
     try:
@@ -1,15 +1,19 @@
+import argparse
 import json
 import logging
+import os
 import re
 from pathlib import Path
 
-import pypandoc
+from latex_build import build_pdf
 
 logger = logging.getLogger(__name__)
 
 MODULE_DIR = Path(__file__).resolve().parent
 OUTPUT_DIR = MODULE_DIR / "output"
 TEMPLATE_PATH = MODULE_DIR / "templates" / "csr_template.tex"
+# Single xelatex pass; the TOC and page references may lag one build
+PUBLISH_DRAFT = os.getenv("CSR_PUBLISH_DRAFT") == "1"
 
 SECTION_ORDER = [
     "Section_1",
@@ -407,7 +411,8 @@ def _insert_table_labels(content, tables):
     return content
 
 
-def create_final_pdf(content, template_path=None, output_path=None):
+def create_final_pdf(content, template_path=None, output_path=None,
+                     draft=False):
     template_path = Path(template_path) if template_path else TEMPLATE_PATH
     output_path = (
         Path(output_path) if output_path
@@ -420,27 +425,25 @@ def create_final_pdf(content, template_path=None, output_path=None):
 
     output_path.parent.mkdir(exist_ok=True)
 
-    extra_args = [
-        f"--template={template_path}",
-        "--pdf-engine=xelatex",
-        "--resource-path=.",
-    ]
-
     try:
-        pypandoc.convert_text(
+        build_pdf(
             content,
-            "pdf",
-            format="markdown",
-            outputfile=str(output_path),
-            extra_args=extra_args,
+            template_path,
+            output_path,
+            output_path.parent / ".build",
+            draft=draft,
+        )
+        logger.info(
+            "Final %sPDF created at %s.", "draft " if draft else "", output_path
         )
-        logger.info("Final PDF created at %s.", output_path)
     except Exception:
         logger.error("PDF generation failed.", exc_info=True)
         raise
 
 
-def main():
+def main(draft=None):
+    if draft is None:
+        draft = PUBLISH_DRAFT
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -524,9 +527,15 @@ def main():
     )
 
     logger.info("Creating final PDF.")
-    create_final_pdf(full_content)
+    create_final_pdf(full_content, draft=draft)
     logger.info("CSR publishing complete.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Publish the CSR PDF.")
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help="single LaTeX pass; the TOC may be one build out of date",
+    )
+    main(draft=parser.parse_args().draft or None)
@@ -0,0 +1,237 @@
+"""SQLite-backed cache of reasoning_search results.
+
+Entries are keyed by a normalized question within a namespace made of
+the study data version (the ingestion manifest version) and the
+retrieval settings, so a re-ingestion or a settings change never serves
+stale context. Section writers ask many near-identical questions, so a
+lookup that misses the exact key falls back to the most similar cached
+question in the namespace (cosine similarity of hashed TF-IDF vectors
+from the node index) above ``SEARCH_CACHE_SIMILARITY``.
+
+Those vectors drop stop words and terms the node index has never seen,
+so "patients with X" and "patients without X" can be near-identical.
+Each entry therefore also stores a guard: the question's negations and
+the terms its vector dropped as unknown. A similar question is reused
+only when its guard is the same. Entries stored without a guard are
+only reused on an exact match.
+
+Entries expire after ``SEARCH_CACHE_TTL_DAYS`` and the least recently
+used are evicted beyond ``SEARCH_CACHE_MAX_ENTRIES``. The cache lives at
+``SEARCH_CACHE_PATH`` so it survives across runs.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_PATH = Path(
+    os.getenv(
+        "SEARCH_CACHE_PATH",
+        str(Path(__file__).resolve().parent / "cache" / "search_cache.sqlite3"),
+    )
+)
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in (
+    "1", "true", "yes",
+)
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.92"))
+SEARCH_CACHE_TTL_DAYS = float(os.getenv("SEARCH_CACHE_TTL_DAYS", "30"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words that flip a question's meaning but carry no weight in its vector
+NEGATION_TERMS = {
+    "not", "no", "non", "without", "never", "none", "nor", "neither",
+    "except", "excluding", "excluded", "exclude", "absence", "absent",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    namespace TEXT NOT NULL,
+    question_key TEXT NOT NULL,
+    question TEXT NOT NULL,
+    vector TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, question_key)
+);
+CREATE INDEX IF NOT EXISTS ix_search_cache_last_used
+    ON search_cache (last_used_at);
+"""
+
+
+def normalize_question(question):
+    return " ".join(TOKEN_PATTERN.findall(question.lower()))
+
+
+def similarity_guard(question, unknown_terms=()):
+    """Return the terms two questions must share for one's cached result
+    to be reused for the other on similarity alone."""
+    terms = {
+        t for t in TOKEN_PATTERN.findall(question.lower())
+        if t in NEGATION_TERMS
+    }
+    terms.update(unknown_terms)
+    return sorted(terms)
+
+
+def _decode_vector(stored):
+    """Return ``(vector, guard)``; ``guard`` is None for old entries."""
+    data = json.loads(stored)
+    if isinstance(data, dict):
+        return {int(b): w for b, w in data["vector"]}, data["guard"]
+    return {int(b): w for b, w in data}, None
+
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(bucket, 0.0) for bucket, w in a.items())
+
+
+class SearchCache:
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else SEARCH_CACHE_PATH
+        self._lock = threading.Lock()
+        self._conn = None
+        # namespace -> [(question_key, vector, guard)], loaded on first use
+        self._vectors = {}
+        self.metrics = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    def _connection(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, check_same_thread=False, timeout=30
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._expire()
+        return self._conn
+
+    def _expire(self):
+        cutoff = time.time() - SEARCH_CACHE_TTL_DAYS * 86400
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE last_used_at < ?", (cutoff,)
+            )
+
+    def _namespace_vectors(self, namespace):
+        vectors = self._vectors.get(namespace)
+        if vectors is None:
+            rows = self._connection().execute(
+                "SELECT question_key, vector FROM search_cache "
+                "WHERE namespace = ?",
+                (namespace,),
+            ).fetchall()
+            vectors = [
+                (key, *_decode_vector(vector)) for key, vector in rows
+            ]
+            self._vectors[namespace] = vectors
+        return vectors
+
+    def get(self, namespace, question, vector, guard=()):
+        """Return a cached result for the question, or None.
+
+        ``vector`` is the question's normalized sparse vector, used for
+        similarity matching when there is no exact hit; only entries with
+        the same ``guard`` (see :func:`similarity_guard`) qualify.
+        """
+        guard = list(guard)
+        question_key = normalize_question(question)
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT result FROM search_cache "
+                "WHERE namespace = ? AND question_key = ?",
+                (namespace, question_key),
+            ).fetchone()
+            kind = "exact_hits"
+            matched_key = question_key
+            if row is None and vector:
+                best_key, best_score = None, 0.0
+                for key, cached_vector, cached_guard in (
+                    self._namespace_vectors(namespace)
+                ):
+                    if cached_guard != guard:
+                        continue
+                    score = _cosine(vector, cached_vector)
+                    if score > best_score:
+                        best_key, best_score = key, score
+                if best_key is not None and best_score >= SEARCH_CACHE_SIMILARITY:
+                    row = conn.execute(
+                        "SELECT result FROM search_cache "
+                        "WHERE namespace = ? AND question_key = ?",
+                        (namespace, best_key),
+                    ).fetchone()
+                    kind = "similar_hits"
+                    matched_key = best_key
+            if row is None:
+                self.metrics["misses"] += 1
+                return None
+
+            self.metrics[kind] += 1
+            with conn:
+                conn.execute(
+                    "UPDATE search_cache SET last_used_at = ?, hits = hits + 1 "
+                    "WHERE namespace = ? AND question_key = ?",
+                    (time.time(), namespace, matched_key),
+                )
+            if kind == "similar_hits":
+                logger.info(
+                    "Search cache similar hit: %r -> %r.",
+                    question_key, matched_key,
+                )
+            return row[0]
+
+    def put(self, namespace, question, vector, result, guard=()):
+        question_key = normalize_question(question)
+        guard = list(guard)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache "
+                    "(namespace, question_key, question, vector, result, "
+                    "created_at, last_used_at, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (
+                        namespace, question_key, question,
+                        json.dumps({
+                            "vector": [
+                                [b, round(w, 5)] for b, w in vector.items()
+                            ],
+                            "guard": guard,
+                        }),
+                        result, now, now,
+                    ),
+                )
+                conn.execute(
+                    "DELETE FROM search_cache WHERE rowid IN ("
+                    "SELECT rowid FROM search_cache "
+                    "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                    (SEARCH_CACHE_MAX_ENTRIES,),
+                )
+            vectors = self._vectors.get(namespace)
+            if vectors is not None:
+                vectors[:] = [v for v in vectors if v[0] != question_key]
+                vectors.append((question_key, vector, guard))
+
+    def stats(self):
+        """Return hit/miss counters for this process."""
+        with self._lock:
+            metrics = dict(self.metrics)
+        lookups = sum(metrics.values())
+        hits = metrics["exact_hits"] + metrics["similar_hits"]
+        metrics["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        return metrics
@@ -0,0 +1,164 @@
+"""Rule-based QA for generated CSR sections.
+
+Runs the mechanical checks of the QA agent's list locally, in
+milliseconds, and reports each violation with its line number:
+
+- local file paths and source document names (``TLF2.pdf``,
+  ``ocr-output/``);
+- placeholders (``[XX.X]``, ``[Number]``, ``TBD``, ``[INSERT ...]``);
+- tool names and meta-commentary (``reasoning_search``, ``I will now``);
+- ``* `` bullets, stray ``*`` lines and bold-wrapped headings;
+- the main heading level and non-standard section numbering;
+- markdown tables with missing cells.
+
+Formatting issues ``_postprocess_section`` repairs are fixed before
+linting, so what remains needs a rewrite. The QA agent is left with the
+semantic checks (completeness, table captions, tone).
+"""
+
+import re
+from dataclasses import dataclass
+
+PATH_PATTERNS = (
+    re.compile(r"\b[\w.-]+\.(?:pdf|md|json|docx?|csv|xlsx?|txt)\b", re.I),
+    re.compile(
+        r"(?:^|[\s(`'\"])(?:/home/|/tmp/|/Users/|[A-Z]:\\\\|\./|\.\./)", re.I
+    ),
+    re.compile(
+        r"\b(?:ocr-output|study_data|study-documents|Input-docs|"
+        r"Study-docs-module)\b",
+        re.I,
+    ),
+)
+PLACEHOLDER_PATTERNS = (
+    re.compile(r"\[\s*[XY]{1,3}(?:\.[XY]{1,3})?\s*\]%?"),
+    re.compile(r"\b[XY]{2}\.[XY]\b"),
+    re.compile(
+        r"\[\s*(?:Number|N|n|Insert[^\]]*|INSERT[^\]]*|TBD|TBC|Date|"
+        r"Name|Value|Placeholder)\s*\]",
+    ),
+    re.compile(r"\b(?:TODO|TBD|TBC)\b"),
+)
+META_PATTERNS = (
+    re.compile(r"\b(?:reasoning_search|get_table|list_tables)\b"),
+    re.compile(
+        r"\b(?:I will now|I'll now|Let me (?:try|search|check|now)|"
+        r"Based on the tool output|The tool (?:returned|output)|"
+        r"As an AI)\b",
+        re.I,
+    ),
+)
+# Cited URLs in references legitimately end in .pdf
+URL = re.compile(r"\b(?:https?|ftp)://\S+|\bwww\.\S+", re.I)
+HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+BOLD_HEADING = re.compile(r"^#{1,6}\s+\*\*.+\*\*\s*$")
+ASTERISK_BULLET = re.compile(r"^\*\s{1,4}\S")
+# '4.1 1.1 Title': a number stacked in front of the real one
+STACKED_NUMBERING = re.compile(r"^\d+(?:\.\d+)*\.?\s+\d+\.\d+")
+SECTION_NUMBER = re.compile(r"^(\d+)(?:\.\d+)*\.?\s")
+TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+TABLE_DIVIDER = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(?:\|\s*:?-{3,}:?\s*)*\|?\s*$")
+
+
+@dataclass(frozen=True)
+class LintViolation:
+    line: int
+    rule: str
+    message: str
+    text: str
+
+    def __str__(self):
+        return f"line {self.line}: {self.message} ({self.text[:80]!r})"
+
+
+def _table_cells(line):
+    return [c.strip() for c in line.strip().strip("|").split("|")]
+
+
+def _lint_tables(lines):
+    """Flag table rows whose cell count differs from the header's."""
+    violations = []
+    header_cells = None
+    for number, line in enumerate(lines, 1):
+        if not TABLE_ROW.match(line):
+            header_cells = None
+            continue
+        if TABLE_DIVIDER.match(line):
+            continue
+        cells = len(_table_cells(line))
+        if header_cells is None:
+            header_cells = cells
+        elif cells != header_cells:
+            violations.append(LintViolation(
+                number, "table",
+                f"table row has {cells} cells, header has {header_cells}",
+                line.strip(),
+            ))
+    return violations
+
+
+def lint_section(content, section_key):
+    """Return the :class:`LintViolation` list for a section, in line order."""
+    section_num = section_key.replace("Section_", "")
+    lines = content.split("\n")
+    violations = []
+    in_code = False
+
+    def add(number, rule, message, line):
+        violations.append(LintViolation(number, rule, message, line.strip()))
+
+    for number, line in enumerate(lines, 1):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        without_urls = URL.sub("", line)
+        for pattern in PATH_PATTERNS:
+            if pattern.search(without_urls):
+                add(number, "path",
+                    "local file path or source document name", line)
+                break
+        for pattern in PLACEHOLDER_PATTERNS:
+            if pattern.search(line):
+                add(number, "placeholder", "placeholder text", line)
+                break
+        for pattern in META_PATTERNS:
+            if pattern.search(line):
+                add(number, "meta", "tool name or meta-commentary", line)
+                break
+        if in_code:
+            continue
+        if ASTERISK_BULLET.match(line):
+            add(number, "bullet", "'* ' bullet; use '- '", line)
+        if line.strip() == "*":
+            add(number, "stray", "stray '*' line", line)
+
+        heading = HEADING.match(line)
+        if not heading:
+            continue
+        level, title = len(heading.group(1)), heading.group(2).strip()
+        if BOLD_HEADING.match(line):
+            add(number, "bold_heading", "heading wrapped in bold markers", line)
+            title = title.strip("*").strip()
+        if STACKED_NUMBERING.match(title):
+            add(number, "numbering", "non-standard stacked numbering", line)
+            continue
+        numbered = SECTION_NUMBER.match(title)
+        if not numbered or not section_num.isdigit():
+            continue
+        if numbered.group(1) != section_num:
+            add(number, "numbering",
+                f"heading numbered outside section {section_num}", line)
+        elif re.match(rf"{section_num}\.?\s", title) and level != 1:
+            add(number, "heading_level",
+                "main section heading must use a single '#'", line)
+
+    violations.extend(_lint_tables(lines))
+    violations.sort(key=lambda v: v.line)
+    return violations
+
+
+def format_violations(violations, limit=20):
+    """One violation per line, for a regeneration or repair prompt."""
+    shown = [f"- {v}" for v in violations[:limit]]
+    if len(violations) > limit:
+        shown.append(f"- ... and {len(violations) - limit} more")
+    return "\n".join(shown)
@@ -0,0 +1,175 @@
+"""Targeted repair of the subsections a QA check flagged.
+
+A section is split at its headings into subsections. Violations are
+mapped to subsections by line number (lint violations) or by the
+subsection numbers and line numbers a QA reason mentions. Only those
+subsections are rewritten, each in its own small writer session with the
+section outline and neighbouring text as context; everything else is
+kept verbatim. Retry cost then scales with the size of the defect, not
+the size of the section.
+
+When nothing can be mapped, or the flagged subsections make up most of
+the section, callers fall back to regenerating the whole section.
+"""
+
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Regenerate the whole section when more than this share of it is flagged
+REPAIR_MAX_FRACTION = float(os.getenv("CSR_REPAIR_MAX_FRACTION", "0.6"))
+# Characters of each neighbouring subsection given as context
+REPAIR_NEIGHBOUR_CHARS = int(os.getenv("CSR_REPAIR_NEIGHBOUR_CHARS", "3000"))
+
+HEADING = re.compile(r"^(#{1,3})\s+(.*\S)\s*$")
+SUBSECTION_NUMBER = re.compile(r"^\**(\d+(?:\.\d+)+)\b")
+LINE_REFERENCE = re.compile(r"\blines?\s+(\d+)(?:\s*(?:-|–|to)\s*(\d+))?", re.I)
+NUMBER_REFERENCE = re.compile(r"\b(\d+(?:\.\d+)+)\b")
+
+
+@dataclass
+class Subsection:
+    heading: str
+    number: str | None
+    # 1-based, inclusive
+    start_line: int
+    end_line: int
+    text: str
+
+
+def split_subsections(content):
+    """Split a section at its headings (levels 1-3, outside code blocks).
+
+    Text before the first heading, if any, is its own subsection with an
+    empty heading. Joining the ``text`` of all subsections with newlines
+    gives back ``content`` exactly.
+    """
+    lines = content.split("\n")
+    starts = []
+    in_code = False
+    for index, line in enumerate(lines):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        elif not in_code and HEADING.match(line):
+            starts.append(index)
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+
+    subsections = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(lines)
+        heading_match = HEADING.match(lines[start])
+        heading = heading_match.group(0) if heading_match else ""
+        number = None
+        if heading_match:
+            numbered = SUBSECTION_NUMBER.match(heading_match.group(2))
+            number = numbered.group(1) if numbered else None
+        subsections.append(Subsection(
+            heading=heading,
+            number=number,
+            start_line=start + 1,
+            end_line=end,
+            text="\n".join(lines[start:end]),
+        ))
+    return subsections
+
+
+def _containing(subsections, line):
+    for index, subsection in enumerate(subsections):
+        if subsection.start_line <= line <= subsection.end_line:
+            return index
+    return None
+
+
+def locate_violations(subsections, violations=(), reason=None):
+    """Return ``{subsection index: [issue, ...]}`` for lint violations and
+    a free-text QA reason. Parts of the reason that name no line or
+    subsection number are not mapped."""
+    flagged = {}
+    for violation in violations:
+        index = _containing(subsections, violation.line)
+        if index is not None:
+            flagged.setdefault(index, []).append(str(violation))
+
+    if reason:
+        indexes = set()
+        for match in LINE_REFERENCE.finditer(reason):
+            first = int(match.group(1))
+            last = int(match.group(2) or first)
+            for line in range(first, min(last, first + 500) + 1):
+                index = _containing(subsections, line)
+                if index is not None:
+                    indexes.add(index)
+        numbers = set(NUMBER_REFERENCE.findall(reason))
+        for index, subsection in enumerate(subsections):
+            if subsection.number and subsection.number in numbers:
+                indexes.add(index)
+        for index in indexes:
+            flagged.setdefault(index, []).append(reason)
+    return flagged
+
+
+def should_repair(subsections, flagged):
+    """Whether a targeted repair is worthwhile instead of regenerating."""
+    if not flagged or len(subsections) < 2:
+        return False
+    total = sum(len(s.text) for s in subsections) or 1
+    flagged_size = sum(len(subsections[i].text) for i in flagged)
+    return flagged_size / total <= REPAIR_MAX_FRACTION
+
+
+def _outline(subsections, current):
+    return "\n".join(
+        f"{s.heading}{'   <-- rewrite this one' if i == current else ''}"
+        for i, s in enumerate(subsections)
+        if s.heading
+    )
+
+
+def repair_prompt(section_title, subsections, index, issues):
+    """Prompt asking the writer to rewrite one subsection."""
+    subsection = subsections[index]
+    before = subsections[index - 1].text if index > 0 else ""
+    after = (
+        subsections[index + 1].text if index + 1 < len(subsections) else ""
+    )
+    issue_list = "\n".join(f"- {issue}" for issue in dict.fromkeys(issues))
+    return (
+        f"A QA review of the CSR {section_title} found problems in one "
+        "subsection. Rewrite ONLY that subsection to fix them. Keep its "
+        "heading line, keep everything that is correct, and use the "
+        "reasoning_search and get_table tools only if data is needed for "
+        "the fix. Return only the rewritten subsection in Markdown, "
+        "starting with its heading and with no commentary.\n\n"
+        f"Issues:\n{issue_list}\n\n"
+        f"Section outline:\n{_outline(subsections, index)}\n\n"
+        "Preceding text (unchanged, for context):\n"
+        f"{before[-REPAIR_NEIGHBOUR_CHARS:]}\n\n"
+        "Following text (unchanged, for context):\n"
+        f"{after[:REPAIR_NEIGHBOUR_CHARS]}\n\n"
+        f"Subsection to rewrite:\n{subsection.text}"
+    )
+
+
+def splice(subsections, replacements):
+    """Return the section text with ``{index: new text}`` substituted.
+
+    A replacement that lost its heading gets the original heading back.
+    """
+    parts = []
+    for index, subsection in enumerate(subsections):
+        text = replacements.get(index)
+        if text is None or not text.strip():
+            parts.append(subsection.text)
+            continue
+        text = text.strip("\n")
+        if subsection.heading and not HEADING.match(text.split("\n", 1)[0]):
+            text = f"{subsection.heading}\n{text}"
+        # Keep the blank line that separated it from the next heading
+        if subsection.text.endswith("\n") and not text.endswith("\n"):
+            text += "\n"
+        parts.append(text)
+    return "\n".join(parts)
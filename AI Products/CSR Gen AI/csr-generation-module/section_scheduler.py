@@ -0,0 +1,197 @@
+"""Dependency-aware scheduling of CSR section writers.
+
+Sections that summarise other sections (the Synopsis and the Discussion)
+declare them in ``SECTION_DEPENDENCIES``. :func:`run_section_dag` starts
+every section as soon as the sections it depends on have finished, runs
+at most ``max_concurrency`` writers at a time, and hands each writer the
+finished text of its dependencies. Wall-clock time is then the length of
+the longest dependency chain, not the sum of all sections.
+
+When writers are waiting for a free slot, the one heading the longest
+remaining chain goes first, so a concurrency limit never leaves the
+critical path queued behind independent sections.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+
+from agents import SECTION_MAP
+
+logger = logging.getLogger(__name__)
+
+# section -> sections whose finished text it needs
+SECTION_DEPENDENCIES = {
+    "Section_2": (
+        "Section_8", "Section_9", "Section_10", "Section_11", "Section_12",
+        "Section_13",
+    ),
+    "Section_13": ("Section_11", "Section_12"),
+}
+MAX_SECTION_CONCURRENCY = int(os.getenv("CSR_MAX_SECTION_CONCURRENCY", "4"))
+# Characters of each upstream section included in a dependent's prompt
+UPSTREAM_CONTEXT_CHARS = int(os.getenv("CSR_UPSTREAM_CONTEXT_CHARS", "15000"))
+
+# Section being generated by the current task, e.g. for log attribution
+current_section = contextvars.ContextVar("current_section", default=None)
+
+
+def _chain_lengths(sections, dependencies):
+    """Return ``{section: longest chain of dependents after it}``."""
+    dependents = {key: [] for key in sections}
+    for key in sections:
+        for dep in dependencies.get(key, ()):
+            if dep in dependents:
+                dependents[dep].append(key)
+
+    lengths = {}
+    visiting = set()
+
+    def length(key):
+        if key in lengths:
+            return lengths[key]
+        if key in visiting:
+            raise ValueError(f"Section dependency cycle at {key}.")
+        visiting.add(key)
+        lengths[key] = 1 + max(
+            (length(d) for d in dependents[key]), default=0
+        )
+        visiting.discard(key)
+        return lengths[key]
+
+    for key in sections:
+        length(key)
+    return lengths
+
+
+class _PrioritySlots:
+    """Concurrency limit that hands a freed slot to the waiter with the
+    lowest priority value (FIFO among equals)."""
+
+    def __init__(self, slots):
+        self.free = slots
+        self.waiters = []
+        self.sequence = itertools.count()
+
+    async def acquire(self, priority):
+        if self.free and not self.waiters:
+            self.free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Cancelled after being handed a slot: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, waiter = heapq.heappop(self.waiters)
+            if not waiter.done():
+                # The slot passes straight to the waiter
+                waiter.set_result(None)
+                return
+        self.free += 1
+
+
+def with_dependents(stale, dependencies=SECTION_DEPENDENCIES):
+    """Return ``stale`` plus every section that depends on one of them,
+    directly or transitively."""
+    stale = set(stale)
+    changed = True
+    while changed:
+        changed = False
+        for key, deps in dependencies.items():
+            if key not in stale and stale.intersection(deps):
+                stale.add(key)
+                changed = True
+    return stale
+
+
+def upstream_context(upstream):
+    """Format finished upstream sections for a dependent writer's prompt."""
+    if not upstream:
+        return ""
+    parts = []
+    for key, content in upstream.items():
+        title = SECTION_MAP.get(key, key)
+        if len(content) > UPSTREAM_CONTEXT_CHARS:
+            content = content[:UPSTREAM_CONTEXT_CHARS] + "\n[...]"
+        parts.append(f"=== {key}: {title} ===\n{content}")
+    return (
+        "\n\nThe following sections of this CSR are already written. Keep "
+        "this section consistent with them and summarize their findings "
+        "where this section calls for it, but do not copy them verbatim "
+        "and still verify figures with the tools.\n\n"
+        + "\n\n".join(parts)
+    )
+
+
+async def run_section_dag(
+    sections,
+    generate,
+    max_concurrency=MAX_SECTION_CONCURRENCY,
+    dependencies=SECTION_DEPENDENCIES,
+    completed=None,
+):
+    """Generate ``sections`` in dependency order.
+
+    Args:
+        sections: Section keys to generate. Dependencies outside this list
+            are ignored.
+        generate: ``async generate(section_key, upstream)`` returning the
+            section text; ``upstream`` maps each finished dependency to
+            its text. A dependency that failed is left out of it.
+        max_concurrency: Maximum number of sections generating at once.
+        dependencies: ``{section: (dependency, ...)}``.
+        completed: ``{section_key: text}`` of sections finished earlier
+            (e.g. by an interrupted run); passed on as upstream text.
+
+    Returns:
+        ``{section_key: text or the exception it raised}`` in the order of
+        ``sections``.
+    """
+    completed = completed or {}
+    lengths = _chain_lengths(sections, dependencies)
+    slots = _PrioritySlots(max(1, max_concurrency))
+    tasks = {}
+
+    async def _run(key):
+        current_section.set(key)
+        upstream = {}
+        for dep in dependencies.get(key, ()):
+            if dep in completed:
+                upstream[dep] = completed[dep]
+                continue
+            if dep not in tasks:
+                continue
+            try:
+                upstream[dep] = await tasks[dep]
+            except Exception:
+                logger.warning(
+                    "%s: dependency %s failed. Continuing without it.",
+                    key, dep,
+                )
+        await slots.acquire(-lengths[key])
+        try:
+            logger.info(
+                "Starting %s (%d upstream section(s)).", key, len(upstream)
+            )
+            return await generate(key, upstream)
+        finally:
+            slots.release()
+
+    # Longest chains first, so they also win the initial slots
+    for key in sorted(sections, key=lambda k: -lengths[k]):
+        tasks[key] = asyncio.create_task(_run(key))
+
+    results = await asyncio.gather(
+        *(tasks[key] for key in sections), return_exceptions=True
+    )
+    return dict(zip(sections, results))
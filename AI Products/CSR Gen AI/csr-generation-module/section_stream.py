@@ -0,0 +1,126 @@
+"""Streaming writer output as it is generated.
+
+:func:`collect_agent_text` runs an ADK agent with server-sent-event
+streaming and hands each text chunk to a callback while it collects the
+final text. :class:`SectionStream` is such a callback: it buffers chunks
+and, at most every ``STREAM_FLUSH_SECONDS``, appends them to the
+section's working file and passes them on (e.g. to the database and
+WebSocket clients), so a long section is visible and survives a crash
+long before the agent finishes.
+"""
+
+import logging
+import os
+import time
+from pathlib import Path
+
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+STREAM_FLUSH_SECONDS = float(os.getenv("CSR_STREAM_FLUSH_SECONDS", "1.0"))
+WORKING_SUFFIX = ".partial.md"
+
+
+def working_path(output_dir, section_key):
+    """Working file a section streams into; the publisher ignores it."""
+    return Path(output_dir) / f"{section_key}{WORKING_SUFFIX}"
+
+
+async def collect_agent_text(runner, user_id, session_id, prompt,
+                             on_text=None):
+    """Send ``prompt`` to an agent and return all the text it produced.
+
+    With ``on_text``, the model response is streamed and ``on_text(chunk)``
+    is called for each piece of text as it arrives. Streamed chunks are
+    followed by the aggregated response, which is what is collected, so
+    the returned text is the same with or without streaming.
+    """
+    content = types.Content(role="user", parts=[types.Part(text=prompt)])
+    run_config = (
+        RunConfig(streaming_mode=StreamingMode.SSE) if on_text else None
+    )
+
+    final_text = ""
+    streamed = False
+    async for event in runner.run_async(
+        user_id=user_id,
+        session_id=session_id,
+        new_message=content,
+        run_config=run_config,
+    ):
+        if not (event.content and event.content.parts):
+            continue
+        text = "".join(part.text for part in event.content.parts if part.text)
+        if event.partial:
+            if text and on_text:
+                on_text(text)
+                streamed = True
+            continue
+        if text:
+            final_text += text
+            # A response that arrived unstreamed is passed on whole
+            if on_text and not streamed:
+                on_text(text)
+        streamed = False
+    return final_text
+
+
+class SectionStream:
+    """Debounced sink for one section's streamed text.
+
+    Args:
+        path: Working file; truncated on creation, appended on each flush.
+        on_flush: Optional ``on_flush(offset, delta, text)`` called after
+            each flush with the new text, its offset, and all text so far.
+        interval: Minimum seconds between flushes.
+    """
+
+    def __init__(self, path, on_flush=None, interval=STREAM_FLUSH_SECONDS):
+        self.path = Path(path)
+        self.on_flush = on_flush
+        self.interval = interval
+        self.text = ""
+        self.flushed = 0
+        self.last_flush = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text("", encoding="utf-8")
+
+    def __call__(self, chunk):
+        self.text += chunk
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def restart(self):
+        """Start over, e.g. before a full regeneration of the section."""
+        self.flush()
+        self.text = ""
+        self.flushed = 0
+        self.path.write_text("", encoding="utf-8")
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        delta = self.text[self.flushed:]
+        if not delta:
+            return
+        offset, self.flushed = self.flushed, len(self.text)
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(delta)
+        except OSError as e:
+            logger.warning("Cannot append to %s: %s", self.path, e)
+        if self.on_flush:
+            try:
+                self.on_flush(offset, delta, self.text)
+            except Exception:
+                logger.warning(
+                    "Stream flush callback failed for %s.", self.path,
+                    exc_info=True,
+                )
+
+    def close(self):
+        """Flush what is left and remove the working file; the caller has
+        saved the finished section."""
+        self.flush()
+        self.path.unlink(missing_ok=True)
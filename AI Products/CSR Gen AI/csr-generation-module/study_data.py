@@ -0,0 +1,146 @@
+"""Process-wide cache of the study data the CSR tools read.
+
+Tree indexes, ``tables.json`` and the table and node indexes are parsed
+once and shared by every section writer. Each access stats the study
+data files (tree indexes, ``tables.json``, the two indexes and the
+ingestion manifest) and reloads only when a size or mtime changed, e.g.
+after a re-ingestion.
+
+Callers get an immutable :class:`StudyDataSnapshot`; a reload swaps in a
+new snapshot under a lock, so concurrent readers in worker threads or on
+the event loop always see a consistent set of trees and tables.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from node_index import INDEX_FILENAME as NODE_INDEX_FILENAME
+from node_index import NodeIndex, hash_trees, load_node_index
+from table_index import INDEX_FILENAME, TableIndex, hash_bytes, load_table_index
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "ingestion_manifest.json"
+
+
+@dataclass(frozen=True)
+class StudyDataSnapshot:
+    signature: tuple
+    trees: MappingProxyType
+    # json.dumps(trees, indent=1), as used by the hop-1 prompt
+    trees_payload: str
+    node_index: NodeIndex
+    tables: tuple | None
+    table_index: TableIndex | None
+    # Ingestion manifest version, or a hash of the trees and tables when
+    # there is no manifest
+    data_version: str
+
+
+class StudyDataCache:
+
+    def __init__(self, study_data_dir):
+        self.study_data_dir = study_data_dir
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _signature(self):
+        paths = sorted(self.study_data_dir.glob("*_tree.json"))
+        paths.append(self.study_data_dir / "tables.json")
+        paths.append(self.study_data_dir / INDEX_FILENAME)
+        paths.append(self.study_data_dir / NODE_INDEX_FILENAME)
+        paths.append(self.study_data_dir / MANIFEST_FILENAME)
+        signature = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path.name, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def _load_trees(self):
+        """Return ``(trees, node_index)``."""
+        trees = {}
+        raw = {}
+        for tf in sorted(self.study_data_dir.glob("*_tree.json")):
+            try:
+                with open(tf, "rb") as f:
+                    data = f.read()
+                trees[tf.stem] = json.loads(data)
+                raw[tf.stem] = data
+            except (IOError, json.JSONDecodeError):
+                logger.error(
+                    "Failed to load tree index %s.", tf, exc_info=True
+                )
+        node_index = load_node_index(
+            self.study_data_dir, trees, hash_trees(raw)
+        )
+        return trees, node_index
+
+    def _load_tables(self):
+        """Return ``(tables, table_index)``, or ``(None, None)``."""
+        tables_path = self.study_data_dir / "tables.json"
+        if not tables_path.exists():
+            logger.error("tables.json not found at %s.", tables_path)
+            return None, None
+        try:
+            with open(tables_path, "rb") as f:
+                raw = f.read()
+            tables = tuple(json.loads(raw))
+        except (IOError, json.JSONDecodeError):
+            logger.error("Failed to load tables.json.", exc_info=True)
+            return None, None
+        index = load_table_index(self.study_data_dir, tables, hash_bytes(raw))
+        return tables, index
+
+    def _data_version(self, node_index, table_index):
+        manifest_path = self.study_data_dir / MANIFEST_FILENAME
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                version = json.load(f).get("version")
+            if version:
+                return version
+        except (IOError, json.JSONDecodeError):
+            pass
+        payload = "|".join((
+            node_index.trees_sha256 or "",
+            table_index.tables_sha256 if table_index else "",
+        ))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self):
+        """Return the current snapshot, reloading if study data changed."""
+        signature = self._signature()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.signature == signature:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.signature == signature:
+                return snapshot
+
+            trees, node_index = self._load_trees()
+            tables, table_index = self._load_tables()
+            snapshot = StudyDataSnapshot(
+                signature=signature,
+                trees=MappingProxyType(trees),
+                trees_payload=json.dumps(trees, indent=1),
+                node_index=node_index,
+                tables=tables,
+                table_index=table_index,
+                data_version=self._data_version(node_index, table_index),
+            )
+            self._snapshot = snapshot
+            logger.info(
+                "Loaded study data: %d tree index(es), %d table(s).",
+                len(trees), len(tables or []),
+            )
+            return snapshot
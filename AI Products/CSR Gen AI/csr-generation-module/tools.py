@@ -1,12 +1,23 @@
+import asyncio
 import json
 import logging
 import os
 import re
+import sys
 from pathlib import Path
 
-from google import genai
 from google.genai import types
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Study-docs-module"))
+from page_index import load_page_index, read_page_range
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from llm_gateway import PRIORITY_WRITER, estimate_tokens, get_gateway
+
+from context_packer import pack_context
+from search_cache import SEARCH_CACHE_ENABLED, SearchCache, similarity_guard
+from study_data import StudyDataCache
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -19,78 +30,228 @@ OCR_OUTPUT_DIR = BASE_DIR / "Study-docs-module" / "ocr-output"
 
 GEMINI_MODEL = "gemini-2.5-pro"
 
+PAGE_MARKER_PATTERN = re.compile(r"--- Page (\d+) ---")
+
+# Hop 1 retriever: "local" ranks tree nodes with the node index built at
+# ingestion; "llm" sends every tree index to Gemini (the original method).
+HOP1_RETRIEVER = os.getenv("REASONING_SEARCH_HOP1", "local").lower()
+HOP1_TOP_K = 5
+# With rerank enabled, Gemini picks the top nodes from this many local
+# candidates instead of seeing the whole corpus.
+HOP1_RERANK = os.getenv("REASONING_SEARCH_RERANK", "false").lower() in (
+    "1", "true", "yes",
+)
+HOP1_RERANK_CANDIDATES = int(os.getenv("REASONING_SEARCH_CANDIDATES", "20"))
+# Estimated tokens of hop-2 context handed back to a writer per search
+HOP2_TOKEN_BUDGET = int(os.getenv("REASONING_SEARCH_TOKEN_BUDGET", "12000"))
+
+_study_data = StudyDataCache(STUDY_DATA_DIR)
+_search_cache = SearchCache()
+
+_gateway = get_gateway()
+
+
+async def _generate(prompt, temperature):
+    """Run a JSON Gemini call through the shared LLM gateway at writer
+    priority."""
+    return await _gateway.call_async(
+        GEMINI_MODEL,
+        _gateway.gemini_client().aio.models.generate_content,
+        priority=PRIORITY_WRITER,
+        tokens=estimate_tokens(prompt),
+        model=GEMINI_MODEL,
+        contents=[prompt],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            temperature=temperature,
+        ),
+    )
+
+
+def _read_pages(md_path, start_page, end_page):
+    """Return ``[(page_number, text), ...]`` for a page range of an OCR
+    markdown file.
 
-def _get_gemini_client():
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise EnvironmentError("GOOGLE_API_KEY is not set.")
-    return genai.Client(api_key=api_key)
+    Seeks to the requested pages through the ingestion page index. Falls
+    back to reading and splitting the whole file when the index is
+    missing or stale.
+    """
+    start_page, end_page = int(start_page), int(end_page)
+    index = load_page_index(md_path)
+    if index is not None:
+        return read_page_range(md_path, index, start_page, end_page)
+
+    logger.info("No current page index for %s; reading full file.", md_path.name)
+    with open(md_path, "r", encoding="utf-8") as f:
+        full_text = f.read()
+    pages = PAGE_MARKER_PATTERN.split(full_text)
+    extracted = []
+    i = 1
+    while i < len(pages) - 1:
+        page_num = int(pages[i])
+        if start_page <= page_num <= end_page:
+            extracted.append((page_num, pages[i + 1]))
+        i += 2
+    return extracted
+
+
+async def _hop1_llm(question, study_data):
+    hop1_prompt = (
+        "You are a document retrieval specialist. Given the following "
+        "question and document tree indexes, identify the most relevant "
+        "sections to answer the question.\n\n"
+        f"Question: {question}\n\n"
+        "Tree Indexes:\n"
+        f"{study_data.trees_payload}\n\n"
+        "Return a JSON array of objects, each with:\n"
+        '- "source": the tree index name (without _tree suffix)\n'
+        '- "node_id": the node_id of the relevant section\n'
+        '- "start_page": start page number\n'
+        '- "end_page": end page number\n'
+        "Return at most 5 most relevant nodes."
+    )
+    response = await _generate(hop1_prompt, temperature=0.2)
+    return json.loads(response.text)
 
 
-def reasoning_search(question: str) -> str:
+async def _rerank(question, candidates):
+    """Let Gemini choose the best nodes from the local candidates."""
+    listing = "\n".join(
+        f"[{i}] {c['source']} | {c['path']} | pages "
+        f"{c['start_page']}-{c['end_page']} | {c['summary'][:300]}"
+        for i, c in enumerate(candidates)
+    )
+    prompt = (
+        "You are a document retrieval specialist. Given the following "
+        "question and candidate document sections, pick the sections most "
+        "relevant to answering the question.\n\n"
+        f"Question: {question}\n\n"
+        f"Candidates:\n{listing}\n\n"
+        "Return a JSON array of candidate numbers, most relevant first. "
+        f"Return at most {HOP1_TOP_K} numbers."
+    )
+    response = await _generate(prompt, temperature=0.0)
+    picks = json.loads(response.text)
+    selected = []
+    for pick in picks:
+        if isinstance(pick, int) and 0 <= pick < len(candidates):
+            if candidates[pick] not in selected:
+                selected.append(candidates[pick])
+    return selected[:HOP1_TOP_K]
+
+
+async def _hop1_local(question, study_data):
+    if not HOP1_RERANK:
+        return study_data.node_index.search(question, top_k=HOP1_TOP_K)
+
+    candidates = study_data.node_index.search(
+        question, top_k=HOP1_RERANK_CANDIDATES
+    )
+    if len(candidates) <= HOP1_TOP_K:
+        return candidates
+    try:
+        selected = await _rerank(question, candidates)
+    except Exception:
+        logger.warning(
+            "Hop 1 rerank failed; using local ranking.", exc_info=True
+        )
+        selected = []
+    return selected or candidates[:HOP1_TOP_K]
+
+
+def _search_namespace(study_data):
+    """Cache namespace: study data version plus retrieval settings."""
+    return "|".join((
+        study_data.data_version,
+        HOP1_RETRIEVER,
+        f"rerank={HOP1_RERANK}:{HOP1_RERANK_CANDIDATES}",
+        f"budget={HOP2_TOKEN_BUDGET}",
+    ))
+
+
+def search_cache_stats():
+    """Hit/miss counters of the reasoning_search cache in this process."""
+    return _search_cache.stats()
+
+
+async def reasoning_search(question: str) -> str:
     """Two-hop reasoning search over study documents.
 
-    Hop 1 uses Gemini to identify the most relevant sections from tree
-    indexes. Hop 2 retrieves the actual text from those sections.
+    Hop 1 identifies the most relevant sections from tree indexes, by
+    default with the local node index (optionally reranked by Gemini).
+    Hop 2 retrieves the actual text from those sections. Results are
+    cached per study data version, so repeated or near-identical
+    questions are answered without searching again. File and cache I/O
+    runs in worker threads so concurrent section writers never block
+    the event loop.
 
     Args:
         question: The research question to answer from source documents.
 
     Returns:
-        Concatenated relevant text extracted from source documents.
+        Relevant text extracted from source documents, packed to at most
+        ``REASONING_SEARCH_TOKEN_BUDGET`` estimated tokens.
     """
-    tree_files = sorted(STUDY_DATA_DIR.glob("*_tree.json"))
-    if not tree_files:
-        logger.warning("No tree index files found in %s.", STUDY_DATA_DIR)
+    study_data = await asyncio.to_thread(_study_data.get)
+    trees = study_data.trees
+    if not trees:
+        logger.warning("No tree indexes loaded from %s.", STUDY_DATA_DIR)
         return "No study data indexes available."
 
-    trees = {}
-    for tf in tree_files:
+    if not SEARCH_CACHE_ENABLED:
+        return (await _reasoning_search(question, study_data))[0]
+
+    namespace = _search_namespace(study_data)
+    vector = study_data.node_index.embed(question)
+    guard = similarity_guard(
+        question, study_data.node_index.unknown_terms(question)
+    )
+    try:
+        cached = await asyncio.to_thread(
+            _search_cache.get, namespace, question, vector, guard
+        )
+    except Exception:
+        logger.warning("Search cache lookup failed.", exc_info=True)
+        cached = None
+    if cached is not None:
+        logger.info(
+            "[CHUNK LOG] reasoning_search cache hit | question=%r | "
+            "total_chars=%d",
+            question,
+            len(cached),
+        )
+        return cached
+
+    result, found = await _reasoning_search(question, study_data)
+    if found:
         try:
-            with open(tf, "r", encoding="utf-8") as f:
-                trees[tf.stem] = json.load(f)
-        except (IOError, json.JSONDecodeError):
-            logger.error("Failed to load tree index %s.", tf, exc_info=True)
+            await asyncio.to_thread(
+                _search_cache.put, namespace, question, vector, result, guard
+            )
+        except Exception:
+            logger.warning("Search cache store failed.", exc_info=True)
+    return result
 
-    if not trees:
-        return "Failed to load any tree indexes."
 
+async def _reasoning_search(question, study_data):
+    """Run both hops. Returns ``(text, found)`` where ``found`` is False
+    for error and no-result messages, which are not cached."""
+    trees = study_data.trees
     logger.info(
         "[CHUNK LOG] reasoning_search called | question=%r | "
         "tree_indexes_available=%s",
         question,
-        list(trees.keys()),
-    )
-
-    hop1_prompt = (
-        "You are a document retrieval specialist. Given the following "
-        "question and document tree indexes, identify the most relevant "
-        "sections to answer the question.\n\n"
-        f"Question: {question}\n\n"
-        "Tree Indexes:\n"
-        f"{json.dumps(trees, indent=1)}\n\n"
-        "Return a JSON array of objects, each with:\n"
-        '- "source": the tree index name (without _tree suffix)\n'
-        '- "node_id": the node_id of the relevant section\n'
-        '- "start_page": start page number\n'
-        '- "end_page": end page number\n'
-        "Return at most 5 most relevant nodes."
+        list(trees),
     )
 
     try:
-        client = _get_gemini_client()
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=[hop1_prompt],
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                temperature=0.2,
-            ),
-        )
-        relevant_nodes = json.loads(response.text)
+        if HOP1_RETRIEVER == "llm":
+            relevant_nodes = await _hop1_llm(question, study_data)
+        else:
+            relevant_nodes = await _hop1_local(question, study_data)
     except Exception:
         logger.error("Hop 1 reasoning search failed.", exc_info=True)
-        return "Reasoning search failed at hop 1."
+        return "Reasoning search failed at hop 1.", False
 
     logger.info(
         "[CHUNK LOG] Hop 1 selected %d node(s):", len(relevant_nodes)
@@ -105,14 +266,35 @@ def reasoning_search(question: str) -> str:
             node.get("end_page", "?"),
         )
 
-    retrieved_parts = []
-    for node in relevant_nodes:
+    def _read_node(node):
         source = node.get("source", "")
-        node_id = node.get("node_id", "")
         start_page = node.get("start_page", 1)
-        end_page = node.get("end_page", start_page)
         md_path = OCR_OUTPUT_DIR / f"{source}.md"
         if not md_path.exists():
+            return md_path, None
+        return md_path, _read_pages(
+            md_path, start_page, node.get("end_page", start_page)
+        )
+
+    # Read every selected node's pages concurrently, off the event loop
+    reads = await asyncio.gather(
+        *(asyncio.to_thread(_read_node, node) for node in relevant_nodes),
+        return_exceptions=True,
+    )
+
+    retrieved_pages = []
+    for node_rank, (node, read) in enumerate(zip(relevant_nodes, reads)):
+        source = node.get("source", "")
+        node_id = node.get("node_id", "")
+        start_page = node.get("start_page", 1)
+        end_page = node.get("end_page", start_page)
+        if isinstance(read, Exception):
+            logger.error(
+                "Failed to read pages for source=%r.", source, exc_info=read
+            )
+            continue
+        md_path, pages = read
+        if pages is None:
             logger.warning(
                 "[CHUNK LOG] Source file not found: %s (node_id=%r)",
                 md_path,
@@ -120,26 +302,10 @@ def reasoning_search(question: str) -> str:
             )
             continue
 
-        try:
-            with open(md_path, "r", encoding="utf-8") as f:
-                full_text = f.read()
-        except IOError:
-            logger.error("Failed to read %s.", md_path, exc_info=True)
-            continue
-
-        page_pattern = re.compile(r"--- Page (\d+) ---")
-        pages = page_pattern.split(full_text)
-
-        extracted = []
-        i = 1
-        while i < len(pages) - 1:
-            page_num = int(pages[i])
-            page_content = pages[i + 1]
-            if start_page <= page_num <= end_page:
-                extracted.append(
-                    f"[{source} Page {page_num}]\n{page_content.strip()}"
-                )
-            i += 2
+        extracted = [
+            f"[{source} Page {page_num}]\n{page_content.strip()}"
+            for page_num, page_content in pages
+        ]
 
         if extracted:
             total_chars = sum(len(p) for p in extracted)
@@ -155,7 +321,10 @@ def reasoning_search(question: str) -> str:
                 total_chars,
                 extracted[0][:120],
             )
-            retrieved_parts.extend(extracted)
+            retrieved_pages.extend(
+                (source, page_num, page_content, node_rank)
+                for page_num, page_content in pages
+            )
         else:
             logger.warning(
                 "[CHUNK LOG] No pages extracted from source=%r "
@@ -166,60 +335,47 @@ def reasoning_search(question: str) -> str:
                 end_page,
             )
 
-    if not retrieved_parts:
+    if not retrieved_pages:
         logger.warning(
             "[CHUNK LOG] reasoning_search returned empty — "
             "no content found for question=%r",
             question,
         )
-        return "No relevant content found for the given question."
+        return "No relevant content found for the given question.", False
 
+    packed, stats = pack_context(question, retrieved_pages, HOP2_TOKEN_BUDGET)
+    logger.info(
+        "[CHUNK LOG] Context packed | pages=%d (unique %d) | "
+        "chunks_selected=%d/%d | tokens_in=%d | packed_tokens=%d | "
+        "budget=%d",
+        stats["pages_in"],
+        stats["unique_pages"],
+        stats["chunks_selected"],
+        stats["chunks_in"],
+        stats["tokens_in"],
+        stats["packed_tokens"],
+        HOP2_TOKEN_BUDGET,
+    )
     logger.info(
         "[CHUNK LOG] reasoning_search complete | question=%r | "
         "total_chunks_returned=%d | total_chars=%d",
         question,
-        len(retrieved_parts),
-        sum(len(p) for p in retrieved_parts),
+        stats["chunks_selected"],
+        len(packed),
     )
-    return "\n\n---\n\n".join(retrieved_parts)
+    return packed, True
 
 
 def _load_tables():
-    tables_path = STUDY_DATA_DIR / "tables.json"
-    if not tables_path.exists():
-        logger.error("tables.json not found at %s.", tables_path)
-        return None
-    try:
-        with open(tables_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (IOError, json.JSONDecodeError):
-        logger.error("Failed to load tables.json.", exc_info=True)
-        return None
-
-
-_STOP_WORDS = {
-    "a", "an", "the", "of", "in", "for", "and", "or", "to", "by",
-    "at", "from", "with", "on", "is", "are", "was", "were", "that",
-    "this", "as", "example", "table", "figure", "annex", "summary",
-}
-
+    return _study_data.get().tables
 
-def _keyword_score(query_lower, title_lower):
-    keywords = [
-        w for w in re.split(r"[\s\-:.,;()/]+", query_lower)
-        if w and w not in _STOP_WORDS and len(w) > 2
-    ]
-    if not keywords:
-        return 0
-    matched = sum(1 for kw in keywords if kw in title_lower)
-    return matched / len(keywords)
 
-
-def get_table(table_title_or_id: str) -> str:
+async def get_table(table_title_or_id: str) -> str:
     """Retrieve a specific table by its title, keywords, or unique ID.
 
     Searches the cached tables.json for a matching table using exact
-    match, substring match, and keyword-based fuzzy matching.
+    match, substring match, and keyword matching over the table index
+    built at ingestion.
 
     Args:
         table_title_or_id: A descriptive title, keywords, or table ID.
@@ -228,42 +384,38 @@ def get_table(table_title_or_id: str) -> str:
         The markdown content of the matching table, or an error message
         with a list of available tables to help find the right one.
     """
-    tables = _load_tables()
+    study_data = await asyncio.to_thread(_study_data.get)
+    tables = study_data.tables
     if tables is None:
         return "Error: tables.json not found. Run ingestion first."
+    index = study_data.table_index
 
     query_lower = table_title_or_id.lower()
 
-    for table in tables:
-        if table.get("table_id", "").lower() == query_lower:
-            logger.info("Found table by ID: %s.", table["table_id"])
-            return table.get("markdown_content", "")
+    table = index.by_id.get(query_lower)
+    if table is not None:
+        logger.info("Found table by ID: %s.", table["table_id"])
+        return table.get("markdown_content", "")
 
-    for table in tables:
-        if query_lower in table.get("title", "").lower():
-            logger.info("Found table by title match: %s.", table["table_id"])
-            return table.get("markdown_content", "")
+    table = index.find_by_title(query_lower)
+    if table is not None:
+        logger.info("Found table by title match: %s.", table["table_id"])
+        return table.get("markdown_content", "")
 
-    for table in tables:
-        if query_lower in table.get("table_id", "").lower():
-            logger.info(
-                "Found table by partial ID match: %s.", table["table_id"]
-            )
-            return table.get("markdown_content", "")
+    table = index.find_by_partial_id(query_lower)
+    if table is not None:
+        logger.info(
+            "Found table by partial ID match: %s.", table["table_id"]
+        )
+        return table.get("markdown_content", "")
 
-    scored = []
-    for table in tables:
-        title_lower = table.get("title", "").lower()
-        score = _keyword_score(query_lower, title_lower)
-        if score > 0.3:
-            scored.append((score, table))
-    scored.sort(key=lambda x: x[0], reverse=True)
+    scored = index.rank(query_lower)
 
     if scored:
-        best = scored[0][1]
+        coverage, best = scored[0]
         logger.info(
             "Found table by keyword match: %s (score %.2f).",
-            best["table_id"], scored[0][0],
+            best["table_id"], coverage,
         )
         result = best.get("markdown_content", "")
         if len(scored) > 1:
@@ -283,7 +435,7 @@ def get_table(table_title_or_id: str) -> str:
     )
 
 
-def list_tables() -> str:
+async def list_tables() -> str:
     """List all available tables from the study data.
 
     Returns a formatted list of all table titles and IDs that can
@@ -292,7 +444,7 @@ def list_tables() -> str:
     Returns:
         A formatted list of available tables.
     """
-    tables = _load_tables()
+    tables = await asyncio.to_thread(_load_tables)
     if tables is None:
         return "Error: tables.json not found. Run ingestion first."
 
@@ -0,0 +1,42 @@
+/**
+ * Live preview of a section while its writer is still streaming.
+ * Shows the text received so far and keeps the newest lines in view.
+ */
+import { useEffect, useRef } from 'react'
+
+interface Props {
+  sectionNumber: number
+  title: string
+  text: string
+  height?: string
+}
+
+export default function LiveSectionPreview({ sectionNumber, title, text, height = '240px' }: Props) {
+  const boxRef = useRef<HTMLDivElement>(null)
+
+  useEffect(() => {
+    const box = boxRef.current
+    if (box) box.scrollTop = box.scrollHeight
+  }, [text])
+
+  const words = text.trim() ? text.trim().split(/\s+/).length : 0
+
+  return (
+    <div className="border border-blue-200 rounded-lg overflow-hidden">
+      <div className="flex items-center justify-between px-3 py-2 bg-blue-50 text-xs text-blue-700">
+        <span className="font-semibold">S{sectionNumber} · {title}</span>
+        <span className="flex items-center gap-2">
+          {words.toLocaleString()} words
+          <span className="w-2 h-2 rounded-full bg-blue-500 animate-pulse" />
+        </span>
+      </div>
+      <div
+        ref={boxRef}
+        className="p-4 font-serif text-sm whitespace-pre-wrap text-gray-800 overflow-y-auto"
+        style={{ height, fontFamily: 'Georgia, serif', lineHeight: '1.7' }}
+      >
+        {text}
+      </div>
+    </div>
+  )
+}
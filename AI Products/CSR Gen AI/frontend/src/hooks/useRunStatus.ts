@@ -2,16 +2,18 @@
  * Hook: subscribes to real-time run status updates via WebSocket.
  * Falls back to polling every 10 seconds if WS is disconnected.
  */
-import { useState, useCallback, useEffect } from 'react'
+import { useState, useCallback, useEffect, useRef } from 'react'
 import { useQueryClient } from '@tanstack/react-query'
 import { useWebSocket, type WSMessage } from './useWebSocket'
-import type { AgentLog } from '../services/api'
+import { sectionsApi, type AgentLog } from '../services/api'
 
 interface RunStatusState {
   status: string
   progress: number          // 0-100
   currentAgent: string | null
   logs: AgentLog[]
+  // Text of sections still being written, keyed by section number
+  liveSections: Record<number, string>
 }
 
 /**
@@ -26,7 +28,11 @@ export function useRunStatus(runId: number | null, wsRunId?: string | null) {
     progress: 0,
     currentAgent: null,
     logs: [],
+    liveSections: {},
   })
+  const live = useRef<Record<number, string>>({})
+  // Sections whose text is being refetched after missed deltas
+  const resyncing = useRef<Set<number>>(new Set())
 
   const handleMessage = useCallback((msg: WSMessage) => {
     // Backend WSEvent uses 'event_type', not 'type' (type='ping' is handled in useWebSocket)
@@ -63,7 +69,40 @@ export function useRunStatus(runId: number | null, wsRunId?: string | null) {
       }))
     }
 
+    if (eventType === 'section_delta') {
+      const sectionNumber = payload.section_number as number
+      const offset = payload.offset as number
+      const delta = payload.delta as string
+      const text = live.current[sectionNumber]
+      if (offset === 0) {
+        // A new (or restarted) section
+        live.current[sectionNumber] = delta
+      } else if (text !== undefined && offset <= text.length) {
+        // A resynced text may already hold part of the delta
+        if (offset + delta.length > text.length) {
+          live.current[sectionNumber] = text.slice(0, offset) + delta
+        }
+      } else if (runId && !resyncing.current.has(sectionNumber)) {
+        // Deltas were missed (slow connection, or the page opened mid-section):
+        // resync from the section's working text, which the backend persists
+        // as it streams
+        delete live.current[sectionNumber]
+        resyncing.current.add(sectionNumber)
+        sectionsApi.get(runId, sectionNumber).then((r) => {
+          if (sectionNumber in live.current) return
+          if (['completed', 'retried_completed', 'failed'].includes(r.data.status)) return
+          live.current[sectionNumber] = r.data.content ?? ''
+          setState((prev) => ({ ...prev, liveSections: { ...live.current } }))
+        }).catch(() => {}).finally(() => {
+          resyncing.current.delete(sectionNumber)
+        })
+      }
+      setState((prev) => ({ ...prev, liveSections: { ...live.current } }))
+    }
+
     if (eventType === 'section_complete') {
+      delete live.current[payload.section_number as number]
+      setState((prev) => ({ ...prev, liveSections: { ...live.current } }))
       if (runId) {
         queryClient.invalidateQueries({ queryKey: ['sections', runId] })
         queryClient.invalidateQueries({ queryKey: ['run', runId] })
@@ -1,7 +1,7 @@
 /**
  * S-03 Pipeline Monitor — live view of a run in progress.
  * Shows phase progress, real-time agent logs, section status tiles,
- * and token/cost tracking.
+ * live previews of sections being written, and token/cost tracking.
  */
 import { useParams, Link } from 'react-router-dom'
 import { useQuery } from '@tanstack/react-query'
@@ -11,6 +11,7 @@ import AgentLogPanel from '../../components/agent-log/AgentLogPanel'
 import ProgressBar from '../../components/ui/ProgressBar'
 import StatusBadge from '../../components/ui/StatusBadge'
 import TokenUsageBar from '../../components/ui/TokenUsageBar'
+import LiveSectionPreview from '../../components/section-preview/LiveSectionPreview'
 import { format } from 'date-fns'
 
 const SECTION_TITLES: Record<number, string> = {
@@ -37,7 +38,7 @@ export default function PipelinePage() {
     refetchInterval: 5000,
   })
 
-  const { status, progress, currentAgent, logs, connected } = useRunStatus(id, run?.run_id ?? null)
+  const { status, progress, currentAgent, logs, liveSections, connected } = useRunStatus(id, run?.run_id ?? null)
 
   const displayStatus = status || run?.status || 'pending'
   const displayProgress = progress || (run ? ((run.completed_sections ?? 0) / Math.max(run.total_sections ?? 16, 1)) * 100 : 0)
@@ -47,6 +48,8 @@ export default function PipelinePage() {
 
   const isTerminal = ['completed', 'failed', 'awaiting_review'].includes(displayStatus)
 
+  const liveNumbers = Object.keys(liveSections).map(Number).sort((a, b) => a - b)
+
   return (
     <div className="p-6 space-y-6 max-w-6xl mx-auto">
       {/* Header */}
@@ -137,6 +140,23 @@ export default function PipelinePage() {
         </div>
       </div>
 
+      {/* Sections being written */}
+      {liveNumbers.length > 0 && (
+        <div className="card p-5">
+          <h2 className="font-semibold text-gray-700 text-sm mb-4">Writing Now</h2>
+          <div className="grid grid-cols-1 xl:grid-cols-2 gap-4">
+            {liveNumbers.map((n) => (
+              <LiveSectionPreview
+                key={n}
+                sectionNumber={n}
+                title={SECTION_TITLES[n] ?? `Section ${n}`}
+                text={liveSections[n]}
+              />
+            ))}
+          </div>
+        </div>
+      )}
+
       {/* Awaiting Review Banner */}
       {displayStatus === 'awaiting_review' && (
         <div className="card p-5 bg-yellow-50 border-yellow-200">
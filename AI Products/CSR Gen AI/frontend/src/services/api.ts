@@ -236,6 +236,9 @@ export const runsApi = {
   rerun: (runId: number, data: { scope?: string; section_number?: number; replace_documents?: boolean }) =>
     api.post(`/runs/${runId}/rerun`, data),
 
+  resume: (runId: number) =>
+    api.post(`/runs/${runId}/resume`),
+
   getLogs: (runId: number) =>
     api.get<AgentLog[]>(`/runs/${runId}/logs`),
 
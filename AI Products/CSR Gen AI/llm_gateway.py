@@ -0,0 +1,407 @@
+"""Process-wide gateway for every LLM / OCR provider call in the CSR app.
+
+Ingestion, the guidelines processor, the CSR agent tools and the ADK
+agents all draw from the same per-model quotas. The gateway gives them:
+
+- one shared ``genai.Client`` / ``Mistral`` client, so connections are
+  reused instead of opened per call;
+- a token-bucket limiter per model for requests per minute and tokens
+  per minute (``LLM_RATE_LIMITS``), so a full run stays at the quota
+  ceiling instead of bursting past it;
+- priority ordering of waiters, so section writers go ahead of
+  background ingestion when a model is saturated;
+- retries with jittered exponential backoff on 429, 5xx and network
+  errors;
+- per-model metrics (requests, tokens, cached prompt tokens, retries,
+  throttled seconds).
+
+``LLM_RATE_LIMITS`` is JSON, e.g.
+``{"gemini-2.5-pro": {"rpm": 150, "tpm": 2000000}}``; unset fields fall
+back to ``DEFAULT_RATE_LIMITS``. A limit of 0 disables that bucket.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_WRITER = 0
+PRIORITY_QA = 1
+PRIORITY_GUIDELINES = 2
+PRIORITY_INGESTION = 3
+
+DEFAULT_RATE_LIMITS = {
+    "gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000},
+    "gemini-2.5-flash": {"rpm": 1000, "tpm": 1_000_000},
+    "mistral-ocr-latest": {"rpm": 30, "tpm": 0},
+}
+FALLBACK_RATE_LIMIT = {"rpm": 60, "tpm": 0}
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "2"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+NETWORK_ERRORS = (
+    httpx.ConnectError,
+    httpx.TimeoutException,
+    httpx.RemoteProtocolError,
+    ConnectionError,
+    TimeoutError,
+    OSError,
+)
+# Requests are admitted on an estimate of their input size
+CHARS_PER_TOKEN = 4
+# How often a waiter that is not at the head of the queue re-checks
+QUEUE_POLL_SECONDS = 0.05
+
+
+def _load_rate_limits():
+    limits = {model: dict(limit) for model, limit in DEFAULT_RATE_LIMITS.items()}
+    # Read at first use so a .env loaded after import still applies
+    if os.getenv("MISTRAL_OCR_RPM"):
+        limits["mistral-ocr-latest"]["rpm"] = int(os.getenv("MISTRAL_OCR_RPM"))
+    raw = os.getenv("LLM_RATE_LIMITS")
+    if raw:
+        try:
+            for model, limit in json.loads(raw).items():
+                limits.setdefault(model, dict(FALLBACK_RATE_LIMIT)).update(limit)
+        except (ValueError, AttributeError):
+            logger.warning("Ignoring invalid LLM_RATE_LIMITS: %r", raw)
+    return limits
+
+
+def estimate_tokens(*texts):
+    return sum(len(t) for t in texts if t) // CHARS_PER_TOKEN
+
+
+def _status_code(error):
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "raw_response", None) or getattr(
+        error, "response", None
+    )
+    return getattr(response, "status_code", None)
+
+
+def is_retryable(error):
+    if isinstance(error, NETWORK_ERRORS):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given 1-based attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class _TokenBucket:
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` is available (0 if it is now)."""
+        self._refill(now)
+        # A request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        # May go negative for usage reported after the fact
+        self.tokens -= amount
+
+
+class _ModelLimiter:
+
+    def __init__(self, rpm, tpm):
+        self.requests = _TokenBucket(rpm) if rpm else None
+        self.tokens = _TokenBucket(tpm) if tpm else None
+        self.lock = threading.Lock()
+        self.waiters = []
+
+    def enqueue(self, ticket):
+        with self.lock:
+            heapq.heappush(self.waiters, ticket)
+
+    def cancel(self, ticket):
+        with self.lock:
+            if ticket in self.waiters:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+
+    def try_acquire(self, ticket, tokens):
+        """Admit ``ticket`` if it is first in line and both buckets allow
+        it. Returns 0 when admitted, else seconds to wait before retrying."""
+        with self.lock:
+            if self.waiters[0] is not ticket:
+                return QUEUE_POLL_SECONDS
+            now = time.monotonic()
+            wait = 0.0
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens is not None and tokens:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None and tokens:
+                self.tokens.take(tokens)
+            heapq.heappop(self.waiters)
+            return 0.0
+
+    def record_tokens(self, tokens):
+        if self.tokens is not None and tokens:
+            with self.lock:
+                self.tokens.take(tokens)
+
+
+class LLMGateway:
+
+    def __init__(self, rate_limits=None):
+        self.rate_limits = rate_limits or _load_rate_limits()
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._clients = {}
+        self._metrics = {}
+
+    # ── Clients ──────────────────────────────────────────────────────────
+
+    def gemini_client(self):
+        """The shared ``genai.Client`` for this process."""
+        with self._lock:
+            if "gemini" not in self._clients:
+                from google import genai
+
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise EnvironmentError("GOOGLE_API_KEY is not set.")
+                self._clients["gemini"] = genai.Client(api_key=api_key)
+            return self._clients["gemini"]
+
+    def mistral_client(self):
+        """The shared ``Mistral`` client for this process."""
+        with self._lock:
+            if "mistral" not in self._clients:
+                from mistralai import Mistral
+
+                api_key = os.getenv("MISTRAL_API_KEY")
+                if not api_key:
+                    raise EnvironmentError("MISTRAL_API_KEY is not set.")
+                self._clients["mistral"] = Mistral(
+                    api_key=api_key, timeout_ms=60000
+                )
+            return self._clients["mistral"]
+
+    # ── Limiting ─────────────────────────────────────────────────────────
+
+    def _limiter(self, model):
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limit = self.rate_limits.get(model, FALLBACK_RATE_LIMIT)
+                limiter = _ModelLimiter(limit.get("rpm", 0), limit.get("tpm", 0))
+                self._limiters[model] = limiter
+                self._metrics[model] = {
+                    "requests": 0, "tokens": 0, "retries": 0,
+                    "errors": 0, "cached_tokens": 0,
+                    "throttled_seconds": 0.0,
+                }
+            return limiter
+
+    def _metric(self, model, key, amount=1):
+        with self._lock:
+            self._metrics[model][key] += amount
+
+    def _ticket(self, priority):
+        return (priority, next(self._sequence))
+
+    def acquire(self, model, priority=PRIORITY_WRITER, tokens=0):
+        """Block until a request to ``model`` may start."""
+        limiter = self._limiter(model)
+        ticket = self._ticket(priority)
+        limiter.enqueue(ticket)
+        started = time.monotonic()
+        try:
+            while True:
+                wait = limiter.try_acquire(ticket, tokens)
+                if not wait:
+                    break
+                time.sleep(wait)
+        except BaseException:
+            limiter.cancel(ticket)
+            raise
+        self._admitted(model, tokens, time.monotonic() - started)
+
+    async def acquire_async(self, model, priority=PRIORITY_WRITER, tokens=0):
+        """Wait on the event loop until a request to ``model`` may start."""
+        limiter = self._limiter(model)
+        ticket = self._ticket(priority)
+        limiter.enqueue(ticket)
+        started = time.monotonic()
+        try:
+            while True:
+                wait = limiter.try_acquire(ticket, tokens)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            limiter.cancel(ticket)
+            raise
+        self._admitted(model, tokens, time.monotonic() - started)
+
+    def _admitted(self, model, tokens, waited):
+        self._metric(model, "requests")
+        self._metric(model, "tokens", tokens)
+        if waited > QUEUE_POLL_SECONDS:
+            self._metric(model, "throttled_seconds", waited)
+
+    def record_usage(self, model, response):
+        """Charge tokens reported by a response beyond the admitted
+        estimate (output and thinking tokens) to the model's TPM bucket."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        extra = (getattr(usage, "candidates_token_count", 0) or 0) + (
+            getattr(usage, "thoughts_token_count", 0) or 0
+        )
+        self._limiter(model).record_tokens(extra)
+        self._metric(model, "tokens", extra)
+        cached = getattr(usage, "cached_content_token_count", 0) or 0
+        if cached:
+            self._metric(model, "cached_tokens", cached)
+
+    # ── Calls ────────────────────────────────────────────────────────────
+
+    def call(self, limit_model, func, /, *args, priority=PRIORITY_WRITER,
+             tokens=0, **kwargs):
+        """Call ``func(*args, **kwargs)`` under ``limit_model``'s limits,
+        retrying retryable errors with jittered exponential backoff.
+
+        ``limit_model`` is positional-only, so SDK calls can pass their own
+        ``model=`` through ``kwargs``."""
+        for attempt in range(1, MAX_RETRIES + 1):
+            self.acquire(limit_model, priority, tokens)
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                if attempt == MAX_RETRIES or not is_retryable(e):
+                    self._metric(limit_model, "errors")
+                    raise
+                wait = backoff_delay(attempt)
+                self._metric(limit_model, "retries")
+                logger.warning(
+                    "%s call failed (attempt %d/%d): %s. Retrying in %.1fs.",
+                    limit_model, attempt, MAX_RETRIES, e, wait,
+                )
+                time.sleep(wait)
+                continue
+            self.record_usage(limit_model, response)
+            return response
+
+    async def call_async(self, limit_model, func, /, *args,
+                         priority=PRIORITY_WRITER, tokens=0, **kwargs):
+        """Async :meth:`call` for coroutine functions such as
+        ``client.aio.models.generate_content``."""
+        for attempt in range(1, MAX_RETRIES + 1):
+            await self.acquire_async(limit_model, priority, tokens)
+            try:
+                response = await func(*args, **kwargs)
+            except Exception as e:
+                if attempt == MAX_RETRIES or not is_retryable(e):
+                    self._metric(limit_model, "errors")
+                    raise
+                wait = backoff_delay(attempt)
+                self._metric(limit_model, "retries")
+                logger.warning(
+                    "%s call failed (attempt %d/%d): %s. Retrying in %.1fs.",
+                    limit_model, attempt, MAX_RETRIES, e, wait,
+                )
+                await asyncio.sleep(wait)
+                continue
+            self.record_usage(limit_model, response)
+            return response
+
+    # ── ADK integration ──────────────────────────────────────────────────
+
+    def adk_callbacks(self, priority=PRIORITY_WRITER):
+        """Return ``(before_model_callback, after_model_callback)`` that
+        put an ADK agent's model calls under the gateway's limits."""
+
+        async def before_model(callback_context, llm_request):
+            texts = []
+            for content in llm_request.contents or []:
+                for part in content.parts or []:
+                    texts.append(part.text or "")
+            config = llm_request.config
+            if config is not None and isinstance(
+                config.system_instruction, str
+            ):
+                texts.append(config.system_instruction)
+            await self.acquire_async(
+                llm_request.model, priority, estimate_tokens(*texts)
+            )
+            return None
+
+        def after_model(callback_context, llm_response):
+            # Streamed chunks are followed by the aggregated response,
+            # which carries the usage of the whole call
+            if llm_response.partial:
+                return None
+            model = llm_response.model_version or ""
+            # model_version may carry a suffix; charge the configured model
+            for name in self.rate_limits:
+                if model.startswith(name):
+                    model = name
+                    break
+            if model in self._limiters:
+                self.record_usage(model, llm_response)
+            return None
+
+        return before_model, after_model
+
+    def metrics(self):
+        with self._lock:
+            return {
+                model: {**values, "throttled_seconds": round(
+                    values["throttled_seconds"], 2
+                )}
+                for model, values in self._metrics.items()
+            }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the process-wide :class:`LLMGateway`."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
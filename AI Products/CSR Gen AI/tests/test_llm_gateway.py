@@ -0,0 +1,34 @@
+"""Unit tests for the shared LLM gateway."""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from llm_gateway import LLMGateway
+
+MODEL = "gemini-2.5-flash"
+
+
+def _gateway():
+    return LLMGateway(rate_limits={MODEL: {"rpm": 0, "tpm": 0}})
+
+
+def test_call_passes_model_keyword_to_func():
+    """SDK calls forward their own model= next to the limiter key."""
+    def generate(*, model, contents):
+        return (model, contents)
+
+    result = _gateway().call(MODEL, generate, model=MODEL, contents="hi")
+    assert result == (MODEL, "hi")
+
+
+def test_call_async_passes_model_keyword_to_func():
+    async def generate(*, model, contents):
+        return (model, contents)
+
+    result = asyncio.run(
+        _gateway().call_async(MODEL, generate, model=MODEL, contents="hi")
+    )
+    assert result == (MODEL, "hi")
@@ -0,0 +1,100 @@
+"""Regression tests for get_table's keyword ranking on the shipped study data."""
+
+import json
+import os
+import re
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Study-docs-module"))
+
+from table_index import (
+    INDEX_FILENAME, STOP_WORDS, TableIndex, hash_bytes, load_table_index,
+    write_table_index,
+)
+
+TABLES_PATH = os.path.join(ROOT, "Study-docs-module", "study_data", "tables.json")
+
+QUERIES = [
+    "adverse events by system organ class",
+    "efficacy first covid-19 occurrence",
+    "serious adverse events",
+    "disposition of subjects",
+    "demographic characteristics",
+    "vaccine efficacy subgroup analysis",
+    "participants reporting local reactions by maximum severity",
+    "no such table anywhere",
+]
+
+
+@pytest.fixture(scope="module")
+def tables():
+    with open(TABLES_PATH, "rb") as f:
+        raw = f.read()
+    return json.loads(raw), hash_bytes(raw)
+
+
+def _scan(tables, query_lower):
+    """get_table's keyword scan over tables.json before the index."""
+    keywords = [
+        w for w in re.split(r"[\s\-:.,;()/]+", query_lower)
+        if w and w not in STOP_WORDS and len(w) > 2
+    ]
+    scored = []
+    for table in tables:
+        title_lower = table.get("title", "").lower()
+        score = (
+            sum(1 for kw in keywords if kw in title_lower) / len(keywords)
+            if keywords else 0
+        )
+        if score > 0.3:
+            scored.append((score, table))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [(score, table["table_id"]) for score, table in scored[:4]]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("adverse events by system organ class", "TLF_page9_html_table1"),
+    ("efficacy first covid-19 occurrence", "TLF_page5_html_table4"),
+    ("serious adverse events", "TLF_page34_html_table1"),
+    ("disposition of subjects", "TLF_page2_html_table2"),
+])
+def test_best_match_is_pinned(tables, query, expected):
+    index = TableIndex.build(*tables)
+    assert index.rank(query)[0][1]["table_id"] == expected
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_rank_matches_scan(tables, query):
+    index = TableIndex.build(*tables)
+    ranked = [(score, table["table_id"]) for score, table in index.rank(query)]
+    assert ranked == _scan(tables[0], query)
+
+
+def test_rank_matches_scan_for_every_title(tables):
+    index = TableIndex.build(*tables)
+    for table in tables[0]:
+        query = table.get("title", "").lower()[:80]
+        ranked = [(score, t["table_id"]) for score, t in index.rank(query)]
+        assert ranked == _scan(tables[0], query), query
+
+
+def test_saved_index_is_used(tables, tmp_path):
+    with open(TABLES_PATH, "rb") as f:
+        (tmp_path / "tables.json").write_bytes(f.read())
+    written = write_table_index(tmp_path)
+    loaded = load_table_index(tmp_path, tables[0], tables[1])
+    assert loaded.postings == written.postings
+    assert loaded.rank(QUERIES[0]) == TableIndex.build(*tables).rank(QUERIES[0])
+
+
+def test_old_index_layout_is_rebuilt(tables, tmp_path):
+    (tmp_path / INDEX_FILENAME).write_text(json.dumps({
+        "tables_sha256": tables[1],
+        "postings": {"adverse": [[0, 1]]},
+        "doc_lengths": [1],
+    }))
+    loaded = load_table_index(tmp_path, tables[0], tables[1])
+    assert loaded.rank(QUERIES[0]) == TableIndex.build(*tables).rank(QUERIES[0])